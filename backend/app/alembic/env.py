@@ -10,7 +10,8 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-fileConfig(config.config_file_name)
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
 
 # add your model's MetaData object here
 # for 'autogenerate' support
@@ -29,7 +30,20 @@ target_metadata = SQLModel.metadata
 # ... etc.
 
 
+# Reflection drops the COLLATE of an index column, autogenerate would drop and
+# recreate these on every revision
+COLLATED_INDEXES = {"ix_user_email_c", "ix_user_username_c"}
+
+
+def include_object(_object, name, type_, _reflected, _compare_to):
+    return not (type_ == "index" and name in COLLATED_INDEXES)
+
+
 def get_url():
+    # Migrate a shard database with: alembic -x shard=<name> upgrade head
+    shard = context.get_x_argument(as_dictionary=True).get("shard")
+    if shard:
+        return str(settings.SHARD_DATABASE_URIS[shard])
     return str(settings.SQLALCHEMY_DATABASE_URI)
 
 
@@ -47,7 +61,11 @@ def run_migrations_offline():
     """
     url = get_url()
     context.configure(
-        url=url, target_metadata=target_metadata, literal_binds=True, compare_type=True
+        url=url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        compare_type=True,
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -61,6 +79,19 @@ def run_migrations_online():
     and associate a connection with the context.
 
     """
+    # The test suite migrates its template database on its own connection
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            compare_type=True,
+            include_object=include_object,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
     configuration = config.get_section(config.config_ini_section)
     configuration["sqlalchemy.url"] = get_url()
     connectable = engine_from_config(
@@ -71,7 +102,10 @@ def run_migrations_online():
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata, compare_type=True
+            connection=connection,
+            target_metadata=target_metadata,
+            compare_type=True,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,39 @@
+"""Add daily digests
+
+Revision ID: 2582a1eb1f19
+Revises: b5d36d1ed645
+Create Date: 2026-10-19 17:21:05.402917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '2582a1eb1f19'
+down_revision = 'b5d36d1ed645'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('digestrun',
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('shard', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=True),
+    sa.Column('last_user_id', sa.Uuid(), nullable=True),
+    sa.Column('queued', sa.Integer(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # One run per day for the main database too, NULL shards aren't distinct
+    op.create_index('ix_digestrun_day_shard', 'digestrun', ['day', 'shard'], unique=True, postgresql_nulls_not_distinct=True)
+    # Only the open todos with a due date are read by the digests
+    op.create_index('ix_todo_user_id_due_date_open', 'todo', ['user_id', 'due_date'], unique=False, postgresql_where=sa.text('NOT is_completed AND NOT is_deleted AND due_date IS NOT NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_todo_user_id_due_date_open', table_name='todo', postgresql_where=sa.text('NOT is_completed AND NOT is_deleted AND due_date IS NOT NULL'))
+    op.drop_index('ix_digestrun_day_shard', table_name='digestrun', postgresql_nulls_not_distinct=True)
+    op.drop_table('digestrun')
@@ -0,0 +1,24 @@
+"""Clear the content of given up emails
+
+Revision ID: 5d0c9b1e7a42
+Revises: a20c8ffd1984
+Create Date: 2026-10-19 21:05:37.214683
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0c9b1e7a42'
+down_revision = 'a20c8ffd1984'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # New account emails held the password, given up ones were kept with it
+    op.execute("UPDATE outboundemail SET html_content = '' WHERE status = 'failed'")
+
+
+def downgrade():
+    pass
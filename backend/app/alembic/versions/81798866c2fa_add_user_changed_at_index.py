@@ -0,0 +1,27 @@
+"""Add user changed_at index
+
+Revision ID: 81798866c2fa
+Revises: ca6165388321
+Create Date: 2026-10-19 11:02:48.517304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '81798866c2fa'
+down_revision = 'ca6165388321'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # updated_at is only set by the first update, the ETag of the user list is
+    # computed from the last change of either
+    op.create_index('ix_user_changed_at', 'user', [sa.text('coalesce(updated_at, created_at)')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_changed_at', table_name='user')
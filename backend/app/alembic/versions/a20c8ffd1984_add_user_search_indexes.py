@@ -0,0 +1,34 @@
+"""Add user search indexes
+
+Revision ID: a20c8ffd1984
+Revises: 2582a1eb1f19
+Create Date: 2026-10-19 18:40:12.836104
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'a20c8ffd1984'
+down_revision = '2582a1eb1f19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Byte order, LIKE 'prefix%' and the page order of a prefix search use them
+    op.create_index('ix_user_email_c', 'user', [sa.text('email COLLATE "C"')], unique=False)
+    op.create_index('ix_user_username_c', 'user', [sa.text('username COLLATE "C"')], unique=False)
+    op.create_index('ix_user_created_at_id', 'user', ['created_at', 'id'], unique=False)
+    op.create_index('ix_user_created_at_id_inactive', 'user', ['created_at', 'id'], unique=False, postgresql_where=sa.text('NOT is_active'))
+    op.create_index('ix_user_created_at_id_unverified', 'user', ['created_at', 'id'], unique=False, postgresql_where=sa.text('NOT is_verified'))
+
+
+def downgrade():
+    op.drop_index('ix_user_created_at_id_unverified', table_name='user', postgresql_where=sa.text('NOT is_verified'))
+    op.drop_index('ix_user_created_at_id_inactive', table_name='user', postgresql_where=sa.text('NOT is_active'))
+    op.drop_index('ix_user_created_at_id', table_name='user')
+    op.drop_index('ix_user_username_c', table_name='user')
+    op.drop_index('ix_user_email_c', table_name='user')
@@ -0,0 +1,39 @@
+"""Add outbound email queue
+
+Revision ID: b5d36d1ed645
+Revises: c2c7441bc026
+Create Date: 2026-10-19 15:12:40.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d36d1ed645'
+down_revision = 'c2c7441bc026'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outboundemail',
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('email_to', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+    sa.Column('subject', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+    sa.Column('html_content', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('status', sqlmodel.sql.sqltypes.AutoString(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('error', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Failed emails are kept, only the pending ones are claimed by the workers
+    op.create_index('ix_outboundemail_next_attempt_at_pending', 'outboundemail', ['next_attempt_at'], unique=False, postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade():
+    op.drop_index('ix_outboundemail_next_attempt_at_pending', table_name='outboundemail', postgresql_where=sa.text("status = 'pending'"))
+    op.drop_table('outboundemail')
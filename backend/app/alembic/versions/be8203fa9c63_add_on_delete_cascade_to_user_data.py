@@ -0,0 +1,70 @@
+"""Add ON DELETE CASCADE to user data and user deletion jobs
+
+Revision ID: be8203fa9c63
+Revises: b00ce6d016d1
+Create Date: 2026-10-19 09:40:12.481130
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'be8203fa9c63'
+down_revision = 'b00ce6d016d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Let the database delete todos, tags and their links with the user, the
+    # foreign key columns need an index so the cascades don't scan the tables
+    op.drop_constraint('todo_user_id_fkey', 'todo', type_='foreignkey')
+    op.create_foreign_key('todo_user_id_fkey', 'todo', 'user', ['user_id'], ['id'], ondelete='CASCADE')
+    op.create_index(op.f('ix_todo_user_id'), 'todo', ['user_id'], unique=False)
+
+    op.drop_constraint('tag_user_id_fkey', 'tag', type_='foreignkey')
+    op.create_foreign_key('tag_user_id_fkey', 'tag', 'user', ['user_id'], ['id'], ondelete='CASCADE')
+    op.create_index(op.f('ix_tag_user_id'), 'tag', ['user_id'], unique=False)
+
+    op.drop_constraint('todotag_todo_id_fkey', 'todotag', type_='foreignkey')
+    op.create_foreign_key('todotag_todo_id_fkey', 'todotag', 'todo', ['todo_id'], ['id'], ondelete='CASCADE')
+    op.drop_constraint('todotag_tag_id_fkey', 'todotag', type_='foreignkey')
+    op.create_foreign_key('todotag_tag_id_fkey', 'todotag', 'tag', ['tag_id'], ['id'], ondelete='CASCADE')
+    # todo_id is covered by the primary key
+    op.create_index(op.f('ix_todotag_tag_id'), 'todotag', ['tag_id'], unique=False)
+
+    op.create_table('userdeletionjob',
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('user_id', sa.Uuid(), nullable=False),
+    sa.Column('status', sqlmodel.sql.sqltypes.AutoString(length=16), nullable=False),
+    sa.Column('total_todos', sa.Integer(), nullable=False),
+    sa.Column('deleted_todos', sa.Integer(), nullable=False),
+    sa.Column('total_tags', sa.Integer(), nullable=False),
+    sa.Column('deleted_tags', sa.Integer(), nullable=False),
+    sa.Column('error', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_userdeletionjob_user_id'), 'userdeletionjob', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_userdeletionjob_user_id'), table_name='userdeletionjob')
+    op.drop_table('userdeletionjob')
+
+    op.drop_index(op.f('ix_todotag_tag_id'), table_name='todotag')
+    op.drop_constraint('todotag_tag_id_fkey', 'todotag', type_='foreignkey')
+    op.create_foreign_key('todotag_tag_id_fkey', 'todotag', 'tag', ['tag_id'], ['id'])
+    op.drop_constraint('todotag_todo_id_fkey', 'todotag', type_='foreignkey')
+    op.create_foreign_key('todotag_todo_id_fkey', 'todotag', 'todo', ['todo_id'], ['id'])
+
+    op.drop_index(op.f('ix_tag_user_id'), table_name='tag')
+    op.drop_constraint('tag_user_id_fkey', 'tag', type_='foreignkey')
+    op.create_foreign_key('tag_user_id_fkey', 'tag', 'user', ['user_id'], ['id'])
+
+    op.drop_index(op.f('ix_todo_user_id'), table_name='todo')
+    op.drop_constraint('todo_user_id_fkey', 'todo', type_='foreignkey')
+    op.create_foreign_key('todo_user_id_fkey', 'todo', 'user', ['user_id'], ['id'])
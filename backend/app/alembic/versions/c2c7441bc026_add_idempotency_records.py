@@ -0,0 +1,39 @@
+"""Add idempotency records
+
+Revision ID: c2c7441bc026
+Revises: 81798866c2fa
+Create Date: 2026-10-19 11:48:15.203817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2c7441bc026'
+down_revision = '81798866c2fa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotencyrecord',
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('user_id', sa.Uuid(), nullable=True),
+    sa.Column('key', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+    sa.Column('fingerprint', sa.LargeBinary(), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=False),
+    sa.Column('response', sa.LargeBinary(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Anonymous keys are unique too, NULL user ids aren't distinct
+    op.create_index('ix_idempotencyrecord_user_id_key', 'idempotencyrecord', ['user_id', 'key'], unique=True, postgresql_nulls_not_distinct=True)
+    op.create_index(op.f('ix_idempotencyrecord_expires_at'), 'idempotencyrecord', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_idempotencyrecord_expires_at'), table_name='idempotencyrecord')
+    op.drop_index('ix_idempotencyrecord_user_id_key', table_name='idempotencyrecord')
+    op.drop_table('idempotencyrecord')
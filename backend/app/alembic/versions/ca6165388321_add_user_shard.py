@@ -0,0 +1,27 @@
+"""Add user shard
+
+Revision ID: ca6165388321
+Revises: be8203fa9c63
+Create Date: 2026-10-19 10:05:37.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'ca6165388321'
+down_revision = 'be8203fa9c63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('shard', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=True))
+    op.add_column('user', sa.Column('shard_moving', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade():
+    op.drop_column('user', 'shard_moving')
+    op.drop_column('user', 'shard')
@@ -1,16 +1,24 @@
+import hmac
+import uuid
 from collections.abc import Generator
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import timedelta
 from typing import Annotated
 
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
-from pydantic import ValidationError
+from pydantic import BaseModel, ValidationError
 from sqlmodel import Session
 
+from app import crud
 from app.core import security
 from app.core.config import settings
 from app.core.db import engine
+from app.core.responses import PydanticJSONResponse
+from app.core.sharding import shard_session
 from app.models import TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
@@ -19,15 +27,50 @@ reusable_oauth2 = OAuth2PasswordBearer(
 
 
 def get_db() -> Generator[Session, None, None]:
-    with Session(engine) as session:
+    # Server-generated columns are already loaded by RETURNING, keep them after
+    # commit so returning an object doesn't SELECT it again
+    with Session(engine, expire_on_commit=False) as session:
         yield session
 
 
-SessionDep = Annotated[Session, Depends(get_db)]
+@dataclass
+class BatchContext:
+    """
+    Shared by the sub-requests of a POST /batch request.
+    """
+
+    # Authenticated once for the whole batch
+    user: User
+    # The batch's session, None for the reads run concurrently, a session can't
+    # be used by several threads at once
+    session: Session | None
+
+
+batch_context: ContextVar[BatchContext | None] = ContextVar(
+    "batch_context", default=None
+)
+
+
+def get_session(db: Annotated[Session, Depends(get_db)]) -> Session:
+    # Sessions only get a connection when first used, the one from get_db()
+    # costs nothing when the batch's session is used instead
+    batch = batch_context.get()
+    if batch is not None and batch.session is not None:
+        return batch.session
+    return db
+
+
+SessionDep = Annotated[Session, Depends(get_session)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
 def get_current_user(session: SessionDep, token: TokenDep) -> User:
+    batch = batch_context.get()
+    if batch is not None:
+        if batch.session is session:
+            return batch.user
+        # Copied to this session without loading it again
+        return session.merge(batch.user, load=False)
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
@@ -55,3 +98,107 @@ def get_current_active_superuser(current_user: CurrentUser) -> User:
             status_code=403, detail="The user doesn't have enough privileges"
         )
     return current_user
+
+
+def get_user_db(
+    session: SessionDep, current_user: CurrentUser
+) -> Generator[Session, None, None]:
+    """
+    Session on the shard holding the current user's todos and tags.
+    """
+    if current_user.shard_moving:
+        raise HTTPException(
+            status_code=503,
+            detail="The user data is being moved, please retry shortly",
+            headers={"Retry-After": "5"},
+        )
+    if current_user.shard is None:
+        yield session
+        return
+    with shard_session(current_user.shard) as data_session:
+        yield data_session
+
+
+UserSessionDep = Annotated[Session, Depends(get_user_db)]
+
+
+@dataclass
+class Idempotency:
+    """
+    Replays the stored response of a request retried with the same
+    Idempotency-Key header, instead of running it again.
+    """
+
+    session: Session
+    # None when the request has no Idempotency-Key header
+    key: str | None
+    fingerprint: bytes
+    user_id: uuid.UUID | None = None
+
+    def replay(self) -> Response | None:
+        if self.key is None:
+            return None
+        record = crud.get_idempotency_record(
+            session=self.session, user_id=self.user_id, key=self.key
+        )
+        if record is None:
+            return None
+        if record.fingerprint != self.fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="The Idempotency-Key was already used for another request",
+            )
+        return Response(
+            content=record.response,
+            status_code=record.status_code,
+            media_type="application/json",
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    def save(self, content: BaseModel, status_code: int = 200) -> Response:
+        """
+        The response to `content`, stored and committed with the changes of
+        the request still pending in the session.
+        """
+        response = PydanticJSONResponse(content, status_code=status_code)
+        if self.key is None:
+            self.session.commit()
+        else:
+            crud.create_idempotency_record(
+                session=self.session,
+                user_id=self.user_id,
+                key=self.key,
+                fingerprint=self.fingerprint,
+                status_code=status_code,
+                response=bytes(response.body),
+                ttl=timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS),
+            )
+        return response
+
+
+async def get_idempotency(
+    request: Request,
+    session: SessionDep,
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
+) -> Idempotency:
+    # Keyed, the body may hold a password that a plain hash would expose
+    fingerprint = hmac.new(settings.SECRET_KEY.encode(), digestmod="sha256")
+    for part in (request.method, request.url.path, await request.body()):
+        fingerprint.update(part if isinstance(part, bytes) else part.encode())
+        fingerprint.update(b"\0")
+    return Idempotency(
+        session=session, key=idempotency_key, fingerprint=fingerprint.digest()
+    )
+
+
+def get_user_idempotency(
+    idempotency: Annotated[Idempotency, Depends(get_idempotency)],
+    current_user: CurrentUser,
+) -> Idempotency:
+    # Keys are per user, the same key sent by two users are two requests
+    idempotency.user_id = current_user.id
+    return idempotency
+
+
+IdempotencyDep = Annotated[Idempotency, Depends(get_idempotency)]
+UserIdempotencyDep = Annotated[Idempotency, Depends(get_user_idempotency)]
@@ -0,0 +1,165 @@
+import json
+import logging
+from itertools import groupby
+from typing import Any
+
+import anyio
+from fastapi import APIRouter, HTTPException, Request
+from starlette.datastructures import Headers
+from starlette.types import Message as ASGIMessage
+from starlette.types import Scope
+
+from app.api.deps import BatchContext, CurrentUser, SessionDep, batch_context
+from app.core.config import settings
+from app.models import BatchOperation, BatchOperationResult, BatchRequest, BatchResponse
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/batch", tags=["batch"])
+
+
+def operation_scope(request: Request, operation: BatchOperation, body: bytes) -> Scope:
+    path, _, query_string = operation.path.partition("?")
+    path = settings.API_V1_STR + path
+    headers = {name.lower(): value for name, value in operation.headers.items()}
+    # Sent by the batch request, the sub-responses are never compressed
+    headers["authorization"] = request.headers["authorization"]
+    headers.pop("accept-encoding", None)
+    if body:
+        headers["content-type"] = "application/json"
+        headers["content-length"] = str(len(body))
+    return {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": operation.method,
+        "scheme": request.scope["scheme"],
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "headers": [
+            (name.encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers.items()
+        ],
+    }
+
+
+async def run_operation(
+    request: Request, operation: BatchOperation, context: BatchContext
+) -> BatchOperationResult:
+    """
+    Run one operation through the app, in-process, and collect its response.
+    """
+    body = b"" if operation.body is None else json.dumps(operation.body).encode()
+    response_start: ASGIMessage = {"status": 500, "headers": []}
+    chunks: list[bytes] = []
+    response_complete = anyio.Event()
+    body_sent = False
+
+    async def receive() -> ASGIMessage:
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Like a client that stays connected until the end of the response
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: ASGIMessage) -> None:
+        nonlocal response_start
+        if message["type"] == "http.response.start":
+            response_start = message
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    token = batch_context.set(context)
+    try:
+        await request.app(operation_scope(request, operation, body), receive, send)
+    except Exception:
+        # The error response was already sent, the exception is logged here
+        # instead of failing the whole batch
+        logger.exception(
+            "Batch operation %s %s failed", operation.method, operation.path
+        )
+        if context.session is not None:
+            # Left unusable by a failed statement, the next operations share it
+            await anyio.to_thread.run_sync(context.session.rollback)
+    finally:
+        batch_context.reset(token)
+        response_complete.set()
+
+    headers = Headers(raw=response_start["headers"])
+    content = b"".join(chunks)
+    result_body: Any = None
+    if content and headers.get("content-type", "").startswith("application/json"):
+        result_body = json.loads(content)
+    elif content:
+        result_body = content.decode(errors="replace")
+    return BatchOperationResult(
+        status=response_start["status"],
+        headers={
+            name: value for name, value in headers.items() if name != "content-length"
+        },
+        body=result_body,
+    )
+
+
+@router.post("/", response_model=BatchResponse)
+async def run_batch(
+    request: Request,
+    session: SessionDep,
+    current_user: CurrentUser,
+    batch_in: BatchRequest,
+) -> Any:
+    """
+    Run several API requests in one, as the current user.
+
+    The operations run in order on the session of the batch, except consecutive
+    GET operations, which run concurrently on their own sessions. Each operation
+    commits its own changes, a failed one doesn't undo the previous ones.
+    """
+    for operation in batch_in.operations:
+        if not operation.path.startswith("/") or operation.path.startswith("/batch"):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid batch operation path: {operation.path}",
+            )
+        for name, value in operation.headers.items():
+            # Headers are bytes, only latin-1 text can be sent in them
+            try:
+                name.encode("latin-1")
+                value.encode("latin-1")
+            except UnicodeEncodeError:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid batch operation header: {name}",
+                )
+
+    shared_context = BatchContext(user=current_user, session=session)
+    read_context = BatchContext(user=current_user, session=None)
+    limiter = anyio.CapacityLimiter(settings.BATCH_READ_CONCURRENCY)
+    results: dict[int, BatchOperationResult] = {}
+
+    async def run_read(index: int, operation: BatchOperation) -> None:
+        async with limiter:
+            results[index] = await run_operation(request, operation, read_context)
+
+    operations = list(enumerate(batch_in.operations))
+    for is_read, grouped in groupby(
+        operations, key=lambda item: item[1].method == "GET"
+    ):
+        group = list(grouped)
+        if not is_read or len(group) == 1:
+            for index, operation in group:
+                results[index] = await run_operation(request, operation, shared_context)
+            continue
+        async with anyio.create_task_group() as task_group:
+            for index, operation in group:
+                task_group.start_soon(run_read, index, operation)
+
+    return BatchResponse(results=[results[index] for index, _ in operations])
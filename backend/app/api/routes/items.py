@@ -5,6 +5,7 @@ from fastapi import APIRouter, HTTPException
 from sqlmodel import func, select
 
 from app.api.deps import CurrentUser, SessionDep
+from app.core.responses import PydanticJSONResponse, construct_public
 from app.models import Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, Message
 
 router = APIRouter(prefix="/items", tags=["items"])
@@ -38,7 +39,10 @@ def read_items(
         )
         items = session.exec(statement).all()
 
-    return ItemsPublic(data=items, count=count)
+    page = ItemsPublic.model_construct(
+        data=construct_public(ItemPublic, items), count=count
+    )
+    return PydanticJSONResponse(page)
 
 
 @router.get("/{id}", response_model=ItemPublic)
@@ -64,7 +68,6 @@ def create_item(
     item = Item.model_validate(item_in, update={"owner_id": current_user.id})
     session.add(item)
     session.commit()
-    session.refresh(item)
     return item
 
 
@@ -88,7 +91,6 @@ def update_item(
     item.sqlmodel_update(update_dict)
     session.add(item)
     session.commit()
-    session.refresh(item)
     return item
 
 
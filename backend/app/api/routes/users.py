@@ -1,30 +1,58 @@
 import uuid
-from typing import Any
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Any, Literal
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import col, delete, func, select
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Response,
+)
+from sqlalchemy import select as select_columns
+from sqlalchemy import tuple_
+from sqlmodel import Session, col, func, select
 
 from app import crud
 from app.api.deps import (
     CurrentUser,
+    IdempotencyDep,
     SessionDep,
+    UserIdempotencyDep,
+    UserSessionDep,
     get_current_active_superuser,
 )
 from app.core.config import settings
+from app.core.db import engine
+from app.core.fieldsets import fieldset_model, parse_fields
+from app.core.pagination import decode_cursor, encode_cursor
+from app.core.responses import (
+    PydanticJSONResponse,
+    construct_public,
+    etag_matches,
+    not_modified,
+    weak_etag,
+)
 from app.core.security import get_password_hash, verify_password
+from app.core.sharding import shard_session
 from app.models import (
-    Item,
     Message,
     UpdatePassword,
     User,
     UserCreate,
+    UserDeletionJob,
+    UserDeletionJobPublic,
     UserPublic,
     UserRegister,
     UsersPublic,
+    UsersSearchPublic,
     UserUpdate,
     UserUpdateMe,
 )
-from app.utils import generate_new_account_email, send_email
+from app.utils import generate_new_account_email, generate_password_reset_token
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -34,27 +62,182 @@ router = APIRouter(prefix="/users", tags=["users"])
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+def read_users(
+    session: SessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    fields: str | None = Query(
+        default=None,
+        description="Comma separated fields to return, id is always returned",
+    ),
+    if_none_match: str | None = Header(default=None),
+) -> Any:
     """
     Retrieve users.
     """
+    try:
+        field_names = parse_fields(UserPublic, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Any insert, update or delete changes the last change or the count, both
+    # are read before loading any row: the last change from the end of
+    # ix_user_changed_at and the count with an index-only scan
+    version_statement = select(
+        select(
+            func.max(func.coalesce(User.updated_at, User.created_at))
+        ).scalar_subquery(),
+        select(func.count()).select_from(User).scalar_subquery(),
+    )
+    last_changed_at, count = session.exec(version_statement).one()
+    etag = weak_etag(last_changed_at, count)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    # Only the requested columns are loaded, as rows instead of User objects
+    columns = [getattr(User, name) for name in field_names]
+    statement = select_columns(*columns).offset(skip).limit(limit)
+    rows = session.exec(statement).all()  # type: ignore[call-overload]
+
+    page = UsersPublic.model_construct(
+        data=construct_public(fieldset_model(UserPublic, field_names), rows),
+        count=count,
+    )
+    return PydanticJSONResponse(page, headers={"ETag": etag})
+
+
+# The sort keys of each order of the search pages, whether it's descending and
+# the type of its cursors
+SEARCH_SORTS: dict[str, tuple[list[Any], bool, Any]] = {
+    "email": ([col(User.email).collate("C")], False, tuple[Literal["email"], str]),
+    "username": (
+        [col(User.username).collate("C")],
+        False,
+        tuple[Literal["username"], str],
+    ),
+    "created": (
+        [col(User.created_at), col(User.id)],
+        True,
+        tuple[Literal["created"], datetime, uuid.UUID],
+    ),
+}
+
+
+@router.get(
+    "/search",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=UsersSearchPublic,
+)
+def search_users(
+    session: SessionDep,
+    email_prefix: str | None = Query(default=None, min_length=1, max_length=255),
+    username_prefix: str | None = Query(default=None, min_length=1, max_length=255),
+    is_active: bool | None = None,
+    is_verified: bool | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    cursor: str | None = Query(
+        default=None, description="The next_cursor of the previous page"
+    ),
+    limit: int = Query(default=100, ge=1, le=1000),
+    fields: str | None = Query(
+        default=None,
+        description="Comma separated fields to return, id is always returned",
+    ),
+) -> Any:
+    """
+    Search users by email or username prefix, case sensitive, status and
+    creation time.
+
+    Pages are sorted by email when searching by email prefix, else by username
+    when searching by username prefix, else newest first. Each page is read
+    from where the previous one ended, as fast as the first one.
+    """
+    try:
+        field_names = parse_fields(UserPublic, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    conditions: list[Any] = []
+    if email_prefix is not None:
+        conditions.append(
+            col(User.email).collate("C").startswith(email_prefix, autoescape=True)
+        )
+    if username_prefix is not None:
+        conditions.append(
+            col(User.username).collate("C").startswith(username_prefix, autoescape=True)
+        )
+    if is_active is not None:
+        conditions.append(col(User.is_active).is_(is_active))
+    if is_verified is not None:
+        conditions.append(col(User.is_verified).is_(is_verified))
+    if created_after is not None:
+        conditions.append(col(User.created_at) >= created_after)
+    if created_before is not None:
+        conditions.append(col(User.created_at) < created_before)
 
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
+    if email_prefix is not None:
+        sort = "email"
+    elif username_prefix is not None:
+        sort = "username"
+    else:
+        sort = "created"
+        # Set by the database, users without one couldn't be paged after
+        conditions.append(col(User.created_at).is_not(None))
+    keys, descending, cursor_type = SEARCH_SORTS[sort]
 
-    statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    count, count_is_estimate = crud.count_rows(
+        session=session,
+        statement=select_columns(col(User.id)).where(*conditions),
+        exact_limit=settings.USER_SEARCH_EXACT_COUNT_LIMIT,
+    )
 
-    return UsersPublic(data=users, count=count)
+    statement = select_columns(
+        *[getattr(User, name) for name in field_names],
+        *[key.label(f"sort_{i}") for i, key in enumerate(keys)],
+    ).where(*conditions)
+    if cursor is not None:
+        try:
+            _, *after = decode_cursor(cursor, cursor_type)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if descending:
+            statement = statement.where(tuple_(*keys) < tuple_(*after))
+        else:
+            statement = statement.where(tuple_(*keys) > tuple_(*after))
+    order_by = [key.desc() for key in keys] if descending else keys
+    # One more row tells whether there's a next page
+    statement = statement.order_by(*order_by).limit(limit + 1)
+    rows = session.exec(statement).all()  # type: ignore[call-overload]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            (sort, *(getattr(last, f"sort_{i}") for i in range(len(keys))))
+        )
+    page = UsersSearchPublic.model_construct(
+        data=construct_public(fieldset_model(UserPublic, field_names), rows),
+        count=count,
+        count_is_estimate=count_is_estimate,
+        next_cursor=next_cursor,
+    )
+    return PydanticJSONResponse(page)
 
 
 @router.post(
     "/", dependencies=[Depends(get_current_active_superuser)], response_model=UserPublic
 )
-def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
+def create_user(
+    *, session: SessionDep, user_in: UserCreate, idempotency: UserIdempotencyDep
+) -> Any:
     """
     Create new user.
     """
+    replayed = idempotency.replay()
+    if replayed:
+        return replayed
     user = crud.get_user_by_email(session=session, email=user_in.email)
     if user:
         raise HTTPException(
@@ -62,17 +245,22 @@ def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
             detail="The user with this email already exists in the system.",
         )
 
-    user = crud.create_user(session=session, user_create=user_in)
+    user = crud.create_user(session=session, user_create=user_in, commit=False)
+    # Queued in the transaction creating the user, there's no user without it
     if settings.emails_enabled and user_in.email:
         email_data = generate_new_account_email(
-            email_to=user_in.email, username=user_in.email, password=user_in.password
+            email_to=user_in.email,
+            username=user_in.email,
+            token=generate_password_reset_token(email=user_in.email),
         )
-        send_email(
+        crud.enqueue_email(
+            session=session,
             email_to=user_in.email,
             subject=email_data.subject,
             html_content=email_data.html_content,
+            commit=False,
         )
-    return user
+    return idempotency.save(UserPublic.model_validate(user))
 
 
 @router.patch("/me", response_model=UserPublic)
@@ -93,7 +281,6 @@ def update_user_me(
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
     session.commit()
-    session.refresh(current_user)
     return current_user
 
 
@@ -118,15 +305,27 @@ def update_password_me(
 
 
 @router.get("/me", response_model=UserPublic)
-def read_user_me(current_user: CurrentUser) -> Any:
+def read_user_me(
+    current_user: CurrentUser,
+    response: Response,
+    if_none_match: str | None = Header(default=None),
+) -> Any:
     """
     Get current user.
     """
+    etag = weak_etag(
+        current_user.id, current_user.updated_at or current_user.created_at
+    )
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     return current_user
 
 
 @router.delete("/me", response_model=Message)
-def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
+def delete_user_me(
+    session: SessionDep, current_user: CurrentUser, data_session: UserSessionDep
+) -> Any:
     """
     Delete own user.
     """
@@ -134,16 +333,25 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    session.delete(current_user)
-    session.commit()
+    crud.delete_user(
+        session=session,
+        user=current_user,
+        # In the main database the user's data is deleted with them
+        data_session=data_session if current_user.shard is not None else None,
+    )
     return Message(message="User deleted successfully")
 
 
 @router.post("/signup", response_model=UserPublic)
-def register_user(session: SessionDep, user_in: UserRegister) -> Any:
+def register_user(
+    session: SessionDep, user_in: UserRegister, idempotency: IdempotencyDep
+) -> Any:
     """
     Create new user without the need to be logged in.
     """
+    replayed = idempotency.replay()
+    if replayed:
+        return replayed
     user = crud.get_user_by_email(session=session, email=user_in.email)
     if user:
         raise HTTPException(
@@ -151,8 +359,8 @@ def register_user(session: SessionDep, user_in: UserRegister) -> Any:
             detail="The user with this email already exists in the system",
         )
     user_create = UserCreate.model_validate(user_in)
-    user = crud.create_user(session=session, user_create=user_create)
-    return user
+    user = crud.create_user(session=session, user_create=user_create, commit=False)
+    return idempotency.save(UserPublic.model_validate(user))
 
 
 @router.get("/{user_id}", response_model=UserPublic)
@@ -219,8 +427,90 @@ def delete_user(
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    statement = delete(Item).where(col(Item.owner_id) == user_id)
-    session.exec(statement)  # type: ignore
-    session.delete(user)
-    session.commit()
+    delete_user_and_data(session=session, user=user)
     return Message(message="User deleted successfully")
+
+
+def delete_user_and_data(*, session: Session, user: User) -> None:
+    if user.shard is None:
+        crud.delete_user(session=session, user=user)
+        return
+    with shard_session(user.shard) as data_session:
+        crud.delete_user(session=session, user=user, data_session=data_session)
+
+
+def run_user_deletion_job(job_id: uuid.UUID) -> None:
+    with (
+        Session(engine, expire_on_commit=False) as session,
+        ExitStack() as stack,
+    ):
+        db_job = session.get(UserDeletionJob, job_id)
+        if not db_job:
+            return
+        user = session.get(User, db_job.user_id)
+        data_session = None
+        if user and user.shard is not None:
+            data_session = stack.enter_context(shard_session(user.shard))
+        try:
+            crud.run_user_deletion_job(
+                session=session,
+                db_job=db_job,
+                batch_size=settings.USER_DELETION_BATCH_SIZE,
+                data_session=data_session,
+            )
+        except Exception as e:
+            session.rollback()
+            db_job.status = "failed"
+            db_job.error = str(e)[:255]
+            session.add(db_job)
+            session.commit()
+            raise
+
+
+@router.post(
+    "/{user_id}/deletion-job",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=UserDeletionJobPublic,
+    status_code=202,
+)
+def create_user_deletion_job(
+    session: SessionDep,
+    current_user: CurrentUser,
+    user_id: uuid.UUID,
+    background_tasks: BackgroundTasks,
+) -> Any:
+    """
+    Delete a user and all their data in batches, in the background.
+    """
+    user = session.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if user == current_user:
+        raise HTTPException(
+            status_code=403, detail="Super users are not allowed to delete themselves"
+        )
+    if user.shard is None:
+        job = crud.create_user_deletion_job(session=session, user_id=user_id)
+    else:
+        with shard_session(user.shard) as data_session:
+            job = crud.create_user_deletion_job(
+                session=session, user_id=user_id, data_session=data_session
+            )
+    if job.status == "pending":
+        background_tasks.add_task(run_user_deletion_job, job.id)
+    return job
+
+
+@router.get(
+    "/deletion-jobs/{job_id}",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=UserDeletionJobPublic,
+)
+def read_user_deletion_job(session: SessionDep, job_id: uuid.UUID) -> Any:
+    """
+    Get the progress of a user deletion job.
+    """
+    job = session.get(UserDeletionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    return job
@@ -1,31 +1,94 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic.networks import EmailStr
 
-from app.api.deps import get_current_active_superuser
-from app.models import Message
-from app.utils import generate_test_email, send_email
+from app import crud
+from app.api.deps import SessionDep, get_current_active_superuser
+from app.core.concurrency_limit import AdaptiveConcurrencyLimit
+from app.core.config import settings
+from app.core.readiness import ReadinessProbe, default_checks
+from app.models import (
+    ConcurrencyLimitPublic,
+    Message,
+    ReadinessPublic,
+    RouteClassConcurrency,
+    RouteLatencyPublic,
+)
+from app.utils import generate_test_email
 
 router = APIRouter(prefix="/utils", tags=["utils"])
 
+readiness_probe = ReadinessProbe(default_checks(), ttl=settings.READINESS_CACHE_SECONDS)
+
 
 @router.post(
     "/test-email/",
     dependencies=[Depends(get_current_active_superuser)],
     status_code=201,
 )
-def test_email(email_to: EmailStr) -> Message:
+def test_email(session: SessionDep, email_to: EmailStr) -> Message:
     """
     Test emails.
     """
     email_data = generate_test_email(email_to=email_to)
-    send_email(
+    crud.enqueue_email(
+        session=session,
         email_to=email_to,
         subject=email_data.subject,
         html_content=email_data.html_content,
     )
-    return Message(message="Test email sent")
+    return Message(message="Test email queued")
 
 
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
+
+
+@router.get(
+    "/ready/",
+    response_model=ReadinessPublic,
+    responses={503: {"model": ReadinessPublic}},
+)
+def readiness(response: Response) -> ReadinessPublic:
+    """
+    Check the databases and the SMTP server, answers 503 when one of them fails.
+    """
+    result = readiness_probe.check()
+    if not result.ready:
+        response.status_code = 503
+    return result
+
+
+@router.get(
+    "/concurrency-limit/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=ConcurrencyLimitPublic,
+)
+def read_concurrency_limit(request: Request) -> ConcurrencyLimitPublic:
+    """
+    Current concurrency limit of this worker, and the requests shed by it.
+    """
+    limit: AdaptiveConcurrencyLimit | None = getattr(
+        request.app.state, "concurrency_limit", None
+    )
+    if limit is None:
+        raise HTTPException(status_code=404, detail="Concurrency limit is disabled")
+    return ConcurrencyLimitPublic(
+        limit=limit.limit,
+        in_flight=limit.in_flight,
+        route_classes={
+            route_class: RouteClassConcurrency(
+                in_flight=stats.in_flight,
+                shed=stats.shed,
+                latency_ms=stats.latency * 1000,
+            )
+            for route_class, stats in limit.route_classes.items()
+        },
+        routes={
+            route: RouteLatencyPublic(
+                latency_ms=route_latency.latency * 1000,
+                baseline_latency_ms=route_latency.baseline * 1000,
+            )
+            for route, route_latency in limit.routes.items()
+        },
+    )
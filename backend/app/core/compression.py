@@ -0,0 +1,176 @@
+import zlib
+from typing import Protocol
+
+import brotli  # type: ignore[import-untyped]
+import zstandard
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class Encoder(Protocol):
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compress a chunk and flush it, so the client can decode it right away.
+        """
+
+    def finish(self, data: bytes) -> bytes:
+        """
+        Compress the last chunk and end the stream.
+        """
+
+
+class ZstdEncoder:
+    def __init__(self, level: int) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int) -> None:
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return bytes(self._compressor.process(data) + self._compressor.flush())
+
+    def finish(self, data: bytes) -> bytes:
+        return bytes(self._compressor.process(data) + self._compressor.finish())
+
+
+class GzipEncoder:
+    def __init__(self, level: int) -> None:
+        # wbits 31 writes the gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+def negotiate_encoding(accept_encoding: str, available: list[str]) -> str | None:
+    """
+    The encoding of `available` the client prefers, ties go to the first one.
+
+    Encodings without a quality value have q=1, q=0 refuses them.
+    """
+    qualities: dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip()] = quality
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with zstd, brotli or gzip, as negotiated with the
+    Accept-Encoding header.
+
+    Responses smaller than `minimum_size`, already encoded or marked with
+    Cache-Control: no-transform are sent as they are. Streamed responses are
+    compressed chunk by chunk, each chunk is flushed as soon as it's received.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        minimum_size: int,
+        zstd_level: int,
+        brotli_quality: int,
+        gzip_level: int,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"zstd": zstd_level, "br": brotli_quality, "gzip": gzip_level}
+
+    def create_encoder(self, encoding: str) -> Encoder:
+        level = self.levels[encoding]
+        if encoding == "zstd":
+            return ZstdEncoder(level)
+        if encoding == "br":
+            return BrotliEncoder(level)
+        return GzipEncoder(level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), list(self.levels)
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        # The start message is held back until the first body chunk tells if the
+        # response is worth compressing
+        start_message: Message | None = None
+        encoder: Encoder | None = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message, encoder
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or "no-transform" in headers.get(
+                    "cache-control", ""
+                ):
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            body: bytes = message.get("body", b"")
+            more_body: bool = message.get("more_body", False)
+            if encoder is None:
+                headers = MutableHeaders(scope=start_message)
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start_message)
+                    await send(message)
+                    start_message = None
+                    return
+                encoder = self.create_encoder(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    body = encoder.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+
+            if more_body:
+                message["body"] = encoder.compress(body)
+            else:
+                message["body"] = encoder.finish(body)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
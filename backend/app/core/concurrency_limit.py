@@ -0,0 +1,199 @@
+import json
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Literal
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.metrics import CONCURRENCY_LIMIT, REQUESTS_SHED, route_name
+
+RouteClass = Literal["critical", "default", "expensive"]
+
+# Share of the limit each route class may fill, expensive requests are shed
+# first and critical ones, e.g. health checks, never
+ROUTE_CLASS_SHARES: dict[RouteClass, float] = {
+    "critical": float("inf"),
+    "default": 1.0,
+    "expensive": 0.5,
+}
+
+# Set while a request holds a slot, the operations of a batch request run
+# through the app again and mustn't take more
+_admitted: ContextVar[bool] = ContextVar("concurrency_limit_admitted", default=False)
+
+
+def get_route_class(
+    path: str, *, critical_paths: set[str], expensive_paths: set[str]
+) -> RouteClass:
+    if path in critical_paths:
+        return "critical"
+    if path in expensive_paths:
+        return "expensive"
+    return "default"
+
+
+@dataclass
+class RouteClassStats:
+    in_flight: int = 0
+    shed: int = 0
+    # Moving average of the latency
+    latency: float = 0.0
+
+    def record(self, latency: float) -> None:
+        if self.latency == 0.0:
+            self.latency = latency
+        else:
+            self.latency += (latency - self.latency) * 0.1
+
+
+@dataclass
+class RouteLatency:
+    """
+    Latency of a route, smoothed over the last requests, and its usual latency
+    averaged over many more, which follows a lasting change slowly.
+
+    Routes of a class can take very different times, each one is compared
+    with its own usual latency.
+    """
+
+    latency: float
+    baseline: float
+    samples: int = 1
+
+    def record(self, latency: float) -> None:
+        self.latency += (latency - self.latency) * 0.1
+        self.baseline += (latency - self.baseline) * 0.01
+        self.samples += 1
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    Limit of concurrent requests, adjusted by AIMD on their latency.
+
+    The limit grows by one every `limit` requests finished in their usual time
+    while it's at least half used, and is cut by `backoff` when the smoothed
+    latency of a route gets `latency_tolerance` times longer than usual for
+    it, at most once per average latency so a single burst isn't counted many
+    times. A route is only judged after `warmup` requests.
+
+    It's only used from the event loop, without locks.
+    """
+
+    def __init__(
+        self,
+        *,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_tolerance: float,
+        backoff: float = 0.9,
+        warmup: int = 10,
+    ) -> None:
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.warmup = warmup
+        self.in_flight = 0
+        self.route_classes = {
+            route_class: RouteClassStats() for route_class in ROUTE_CLASS_SHARES
+        }
+        # By route name, the routes of the app are a bounded set
+        self.routes: dict[str, RouteLatency] = {}
+        self._last_backoff = 0.0
+        CONCURRENCY_LIMIT.set(self.limit)
+
+    def try_acquire(self, route_class: RouteClass) -> bool:
+        stats = self.route_classes[route_class]
+        if self.in_flight >= self.limit * ROUTE_CLASS_SHARES[route_class]:
+            stats.shed += 1
+            REQUESTS_SHED.labels(route_class).inc()
+            return False
+        self.in_flight += 1
+        stats.in_flight += 1
+        return True
+
+    def release(self, route_class: RouteClass, route: str, latency: float) -> None:
+        stats = self.route_classes[route_class]
+        in_flight = self.in_flight
+        self.in_flight -= 1
+        stats.in_flight -= 1
+        stats.record(latency)
+        if route_class == "critical":
+            return
+        route_latency = self.routes.get(route)
+        if route_latency is None:
+            self.routes[route] = RouteLatency(latency=latency, baseline=latency)
+            return
+        route_latency.record(latency)
+        if route_latency.samples < self.warmup:
+            return
+        now = time.monotonic()
+        if route_latency.latency > route_latency.baseline * self.latency_tolerance:
+            if now - self._last_backoff > route_latency.latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_backoff = now
+        elif in_flight >= self.limit / 2:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        CONCURRENCY_LIMIT.set(self.limit)
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Answer requests over the concurrency limit with 503 and Retry-After.
+
+    Paths in `critical_paths` are never shed, those in `expensive_paths` are
+    shed once half of the limit is used, the rest once it's reached.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        limit: AdaptiveConcurrencyLimit,
+        critical_paths: set[str],
+        expensive_paths: set[str],
+    ) -> None:
+        self.app = app
+        self.limit = limit
+        self.critical_paths = critical_paths
+        self.expensive_paths = expensive_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or _admitted.get():
+            await self.app(scope, receive, send)
+            return
+        route_class = get_route_class(
+            scope["path"],
+            critical_paths=self.critical_paths,
+            expensive_paths=self.expensive_paths,
+        )
+        if not self.limit.try_acquire(route_class):
+            await self.shed(send)
+            return
+        token = _admitted.set(True)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # The router set the matched route in the scope
+            self.limit.release(
+                route_class, route_name(scope), time.perf_counter() - start
+            )
+            _admitted.reset(token)
+
+    async def shed(self, send: Send) -> None:
+        body = json.dumps({"detail": "The server is overloaded, please retry"})
+        start: Message = {
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", b"1"),
+            ],
+        }
+        await send(start)
+        await send({"type": "http.response.body", "body": body.encode()})
@@ -6,6 +6,7 @@ from pydantic import (
     AnyUrl,
     BeforeValidator,
     EmailStr,
+    Field,
     HttpUrl,
     PostgresDsn,
     computed_field,
@@ -69,6 +70,85 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Databases holding the todos and tags of the users moved there with
+    # app/rebalance_shard.py, as a JSON object of shard name to DSN. Users and
+    # the data of users that weren't moved stay in the main database above
+    SHARD_DATABASE_URIS: dict[str, PostgresDsn] = {}
+
+    # Set when the database is reached through PgBouncer in transaction pooling
+    # mode: server connections are shared between clients per transaction, so
+    # the engine must not rely on prepared statements or session-level state.
+    POSTGRES_PGBOUNCER_TRANSACTION_POOLING: bool = False
+    # Client-side pool size used in transaction pooling mode, 0 disables the
+    # client pool entirely and lets PgBouncer do all the pooling.
+    POSTGRES_PGBOUNCER_CLIENT_POOL_SIZE: int = 0
+    # Warn when the same statement runs more than this many times in one request
+    QUERY_REPEAT_WARNING_THRESHOLD: int = 10
+
+    # Log statements slower than the threshold with their plan, as JSON lines
+    SLOW_QUERY_LOG_ENABLED: bool = False
+    SLOW_QUERY_THRESHOLD_MS: int = 500
+    SLOW_QUERY_SAMPLE_RATE: float = Field(default=1.0, ge=0, le=1)
+    # Capture the plan of the same statement at most once per interval
+    SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS: float = 60.0
+    # Shared by the server workers, rotate it with logrotate
+    SLOW_QUERY_LOG_FILE: str = "logs/slow_queries.jsonl"
+
+    # Compress responses of at least this many bytes with the best encoding the
+    # client accepts, zstd, br or gzip. Smaller ones barely shrink
+    COMPRESSION_MINIMUM_SIZE: int = 1000
+    COMPRESSION_ZSTD_LEVEL: int = Field(default=3, ge=1, le=22)
+    COMPRESSION_BROTLI_QUALITY: int = Field(default=4, ge=0, le=11)
+    COMPRESSION_GZIP_LEVEL: int = Field(default=6, ge=1, le=9)
+
+    # Consecutive GET sub-requests of POST /batch run concurrently, at most this
+    # many at once, each one holds a database connection
+    BATCH_READ_CONCURRENCY: int = Field(default=4, ge=1)
+
+    # How long the response of a request with an Idempotency-Key header is kept
+    # to be replayed to its retries
+    IDEMPOTENCY_KEY_TTL_SECONDS: int = 24 * 60 * 60
+
+    # Requests over an adaptive limit of concurrent requests are answered with
+    # 503 right away, instead of queueing for the threadpool and the database
+    CONCURRENCY_LIMIT_ENABLED: bool = True
+    CONCURRENCY_LIMIT_INITIAL: int = Field(default=20, ge=1)
+    CONCURRENCY_LIMIT_MIN: int = Field(default=4, ge=1)
+    CONCURRENCY_LIMIT_MAX: int = Field(default=200, ge=1)
+    # The limit is lowered when the recent requests of a route take this many
+    # times longer than its usual latency
+    CONCURRENCY_LIMIT_LATENCY_TOLERANCE: float = Field(default=2.0, gt=1)
+
+    # Workers of the production server, 0 runs one per CPU available to the
+    # container, as limited by its cgroup CPU quota
+    SERVER_WORKERS: int = Field(default=0, ge=0)
+    # Workers are replaced after this many requests, give or take the jitter so
+    # they don't restart together, to give back memory grown over time
+    SERVER_MAX_REQUESTS: int = Field(default=10000, ge=0)
+    SERVER_MAX_REQUESTS_JITTER: int = Field(default=1000, ge=0)
+    # On SIGTERM, workers stop accepting connections and the requests in
+    # progress have this long to finish
+    SERVER_GRACEFUL_TIMEOUT_SECONDS: int = Field(default=30, ge=0)
+
+    # Users matching an admin search are counted exactly up to this many, the
+    # count of more is estimated by the query planner
+    USER_SEARCH_EXACT_COUNT_LIMIT: int = Field(default=1000, ge=0)
+
+    # Results of the readiness checks are reused by the probes for this long
+    READINESS_CACHE_SECONDS: float = Field(default=5.0, ge=0)
+    # Connection and statement timeout of each readiness check
+    READINESS_CHECK_TIMEOUT_SECONDS: float = Field(default=2.0, gt=0)
+
+    # Share of the requests traced, by Sentry and OpenTelemetry. Health checks
+    # are never traced, and the expensive routes, e.g. login, at their own rate
+    TRACES_SAMPLE_RATE: float = Field(default=0.05, ge=0, le=1)
+    TRACES_EXPENSIVE_SAMPLE_RATE: float = Field(default=0.25, ge=0, le=1)
+    # Share of the traced requests also profiled by Sentry
+    SENTRY_PROFILES_SAMPLE_RATE: float = Field(default=0.0, ge=0, le=1)
+    # Export the traces to an OpenTelemetry collector over OTLP/HTTP, e.g.
+    # http://otel-collector:4318, needs the otel extra
+    OTEL_EXPORTER_OTLP_ENDPOINT: HttpUrl | None = None
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -91,10 +171,47 @@ class Settings(BaseSettings):
     def emails_enabled(self) -> bool:
         return bool(self.SMTP_HOST and self.EMAILS_FROM_EMAIL)
 
+    # Emails are queued in the database and sent by app/email_worker.py, which
+    # claims them in batches and keeps its SMTP connection open while the queue
+    # isn't empty, then polls it at this interval
+    EMAIL_WORKER_BATCH_SIZE: int = Field(default=50, ge=1)
+    EMAIL_WORKER_POLL_SECONDS: float = Field(default=1.0, gt=0)
+    # Emails claimed by a worker that died are sent by another one after this
+    # long, longer than a batch takes to send
+    EMAIL_CLAIM_LEASE_SECONDS: float = Field(default=300.0, gt=0)
+    # A failed email is retried after 30s, 1m, 2m... at most an hour later, and
+    # given up after the last attempt or when the server refuses it for good
+    EMAIL_MAX_ATTEMPTS: int = Field(default=8, ge=1)
+    EMAIL_RETRY_BASE_SECONDS: float = Field(default=30.0, gt=0)
+    EMAIL_RETRY_MAX_SECONDS: float = Field(default=60 * 60, gt=0)
+    # Given up emails are kept this long for inspection, without their content
+    EMAIL_FAILED_RETENTION_DAYS: float = Field(default=7, ge=0)
+
+    # Rows deleted per transaction by background user deletion jobs
+    USER_DELETION_BATCH_SIZE: int = 5000
+
     EMAIL_TEST_USER: EmailStr = "test@example.com"
     FIRST_SUPERUSER: EmailStr
     FIRST_SUPERUSER_PASSWORD: str
 
+    # "fast" hashes passwords with the minimum bcrypt cost, so the tests and the
+    # seed scripts don't spend most of their time hashing. Defaults to "fast"
+    # in local and to "secure" anywhere else, where "fast" is refused
+    PASSWORD_HASH_PROFILE: Literal["secure", "fast"] | None = None
+
+    @model_validator(mode="after")
+    def _set_password_hash_profile(self) -> Self:
+        if self.PASSWORD_HASH_PROFILE is None:
+            self.PASSWORD_HASH_PROFILE = (
+                "fast" if self.ENVIRONMENT == "local" else "secure"
+            )
+        if self.PASSWORD_HASH_PROFILE == "fast" and self.ENVIRONMENT != "local":
+            raise ValueError(
+                'PASSWORD_HASH_PROFILE "fast" is only allowed when ENVIRONMENT '
+                'is "local"'
+            )
+        return self
+
     def _check_default_secret(self, var_name: str, value: str | None) -> None:
         if value == "changethis":
             message = (
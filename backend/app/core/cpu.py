@@ -0,0 +1,42 @@
+import math
+import os
+from pathlib import Path
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+
+def cgroup_cpu_quota(cgroup_root: Path = CGROUP_ROOT) -> float | None:
+    """
+    CPUs allowed by the cgroup CPU quota of the container, None if unlimited.
+    """
+    # cgroup v2, e.g. "150000 100000" for 1.5 CPUs, or "max 100000"
+    cpu_max = cgroup_root / "cpu.max"
+    if cpu_max.exists():
+        quota, period = cpu_max.read_text().split()
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    # cgroup v1, the quota is -1 when unlimited
+    for controller in ("cpu", "cpu,cpuacct"):
+        quota_file = cgroup_root / controller / "cpu.cfs_quota_us"
+        period_file = cgroup_root / controller / "cpu.cfs_period_us"
+        if quota_file.exists() and period_file.exists():
+            quota_us = int(quota_file.read_text())
+            if quota_us <= 0:
+                return None
+            return quota_us / int(period_file.read_text())
+    return None
+
+
+def available_cpus(cgroup_root: Path = CGROUP_ROOT) -> int:
+    """
+    CPUs this process can use, limited by its affinity and the cgroup quota.
+
+    os.cpu_count() is the number of CPUs of the host, a container limited to
+    2 CPUs on a 64 CPU host would run 64 workers competing for 2 CPUs.
+    """
+    cpus = len(os.sched_getaffinity(0))
+    quota = cgroup_cpu_quota(cgroup_root)
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(cpus, 1)
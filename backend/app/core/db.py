@@ -1,10 +1,56 @@
+from typing import Any
+
+from sqlalchemy import Engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import Session, create_engine, select
 
 from app import crud
 from app.core.config import settings
+from app.core.metrics import instrument_pool
+from app.core.query_stats import instrument_engine
+from app.core.slow_query import SlowQueryLog
 from app.models import User, UserCreate
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+
+def get_engine_options(
+    *, pgbouncer_transaction_pooling: bool, client_pool_size: int = 0
+) -> dict[str, Any]:
+    if not pgbouncer_transaction_pooling:
+        return {}
+    # PgBouncer may hand every transaction to a different server connection, so
+    # psycopg must not prepare statements server-side: the next execution could
+    # land on a connection where the prepared statement doesn't exist
+    options: dict[str, Any] = {"connect_args": {"prepare_threshold": None}}
+    if client_pool_size > 0:
+        # Keep only a few client connections, PgBouncer multiplexes the rest
+        options.update(pool_size=client_pool_size, max_overflow=0)
+    else:
+        options["poolclass"] = NullPool
+    return options
+
+
+def create_db_engine(url: str) -> Engine:
+    return create_engine(
+        url,
+        **get_engine_options(
+            pgbouncer_transaction_pooling=settings.POSTGRES_PGBOUNCER_TRANSACTION_POOLING,
+            client_pool_size=settings.POSTGRES_PGBOUNCER_CLIENT_POOL_SIZE,
+        ),
+    )
+
+
+engine = create_db_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+instrument_engine(engine)
+instrument_pool(engine, database="primary")
+
+if settings.SLOW_QUERY_LOG_ENABLED:
+    SlowQueryLog(
+        engine,
+        threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS,
+        sample_rate=settings.SLOW_QUERY_SAMPLE_RATE,
+        explain_interval=settings.SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS,
+        log_file=settings.SLOW_QUERY_LOG_FILE,
+    ).install()
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -27,6 +73,7 @@ def init_db(session: Session) -> None:
     if not user:
         user_in = UserCreate(
             email=settings.FIRST_SUPERUSER,
+            username=settings.FIRST_SUPERUSER,
             password=settings.FIRST_SUPERUSER_PASSWORD,
             is_superuser=True,
         )
@@ -0,0 +1,37 @@
+import functools
+
+from pydantic import BaseModel, create_model
+
+
+def parse_fields(model: type[BaseModel], fields: str | None) -> tuple[str, ...]:
+    """
+    Names of the fields of `model` listed in a comma separated ?fields= value.
+
+    They're returned in the model's order, with id always included, so the same
+    fieldset is always the same tuple. Every field when `fields` isn't given.
+    """
+    if fields is None:
+        return tuple(model.model_fields)
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - model.model_fields.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    return tuple(name for name in model.model_fields if name in requested)
+
+
+@functools.lru_cache(maxsize=128)
+def fieldset_model(model: type[BaseModel], fields: tuple[str, ...]) -> type[BaseModel]:
+    """
+    A model with only some of the fields of `model`, built once per fieldset so
+    its serializer is reused.
+    """
+    if fields == tuple(model.model_fields):
+        return model
+    return create_model(  # type: ignore[call-overload, no-any-return]
+        f"{model.__name__}Fieldset",
+        **{
+            name: (model.model_fields[name].annotation, model.model_fields[name])
+            for name in fields
+        },
+    )
@@ -0,0 +1,170 @@
+"""
+Prometheus metrics, served at /metrics.
+
+With several worker processes, PROMETHEUS_MULTIPROC_DIR must point to an empty
+directory shared by the workers, each one writes its values to its own files
+there and /metrics aggregates them, whichever worker answers the scrape.
+"""
+
+import atexit
+import os
+import time
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import Engine, event
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    # The values of the metrics are written there as soon as they're created
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    # Drop the live gauges of this worker when it exits, a restarted worker
+    # gets a new pid and new files. The pid is read at exit, gunicorn imports
+    # the app before forking the workers
+    atexit.register(
+        lambda: multiprocess.mark_process_dead(os.getpid())  # type: ignore[no-untyped-call]
+    )
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to send the whole response, by route",
+    ["route"],
+)
+REQUESTS = Counter(
+    "http_requests",
+    "Responses sent, by route and status code",
+    ["route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests being handled",
+    multiprocess_mode="livesum",
+)
+REQUESTS_SHED = Counter(
+    "http_requests_shed",
+    "Requests answered with 503 over the concurrency limit, by route class",
+    ["route_class"],
+)
+CONCURRENCY_LIMIT = Gauge(
+    "http_concurrency_limit",
+    "Adaptive limit of concurrent requests, summed over the workers",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Open database connections, by database",
+    ["database"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_connections_checked_out",
+    "Database connections in use, by database",
+    ["database"],
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "Time to hash or verify a password",
+    ["operation"],
+)
+EMAIL_SEND_DURATION = Histogram(
+    "email_send_duration_seconds",
+    "Time to send an email through SMTP",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+# Set while a request is recorded, the operations of a batch request run
+# through the app again and are only recorded as part of the batch
+_recording: ContextVar[bool] = ContextVar("metrics_recording", default=False)
+
+
+def route_name(scope: Scope) -> str:
+    """
+    Unique id of the matched API route, as in the OpenAPI operation ids.
+    """
+    route = scope.get("route")
+    if route is not None:
+        return str(route.unique_id)
+    # Routes outside the API, e.g. /docs or /metrics, only set the endpoint
+    endpoint = scope.get("endpoint")
+    if endpoint is not None:
+        return str(endpoint.__name__)
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Record the duration and status code of the responses, by route.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        # Children of the labelled metrics by route, looking them up again takes
+        # a lock on every request
+        self._durations: dict[str, Histogram] = {}
+        self._requests: dict[tuple[str, int], Counter] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or _recording.get():
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = _recording.set(True)
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            _recording.reset(token)
+            self.record(route_name(scope), status, duration)
+
+    def record(self, route: str, status: int, duration: float) -> None:
+        histogram = self._durations.get(route)
+        if histogram is None:
+            histogram = self._durations[route] = REQUEST_DURATION.labels(route)
+        histogram.observe(duration)
+        counter = self._requests.get((route, status))
+        if counter is None:
+            counter = self._requests[route, status] = REQUESTS.labels(route, status)
+        counter.inc()
+
+
+def instrument_pool(engine: Engine, *, database: str) -> None:
+    connections = DB_POOL_CONNECTIONS.labels(database)
+    checked_out = DB_POOL_CHECKED_OUT.labels(database)
+    event.listen(engine, "connect", lambda *_args: connections.inc())
+    event.listen(engine, "close", lambda *_args: connections.dec())
+    event.listen(engine, "close_detached", lambda *_args: connections.dec())
+    event.listen(engine, "checkout", lambda *_args: checked_out.inc())
+    event.listen(engine, "checkin", lambda *_args: checked_out.dec())
+
+
+def metrics(_request: Request) -> Response:
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)  # type: ignore[no-untyped-call]
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
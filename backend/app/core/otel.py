@@ -0,0 +1,87 @@
+"""
+Export of the traces with OpenTelemetry, over OTLP/HTTP.
+
+Needs the packages of the otel extra, installed with `uv sync --extra otel`.
+"""
+
+from collections.abc import Sequence
+
+from opentelemetry import trace
+from opentelemetry.context import Context
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import (
+    ParentBased,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
+)
+from opentelemetry.trace import Link, SpanKind
+from opentelemetry.util.types import Attributes
+
+from app.core.tracing import RouteTracesSampler
+
+
+class RouteSampler(Sampler):
+    """
+    Sample the request spans at the rate of their route class.
+    """
+
+    def __init__(self, sampler: RouteTracesSampler) -> None:
+        self.sampler = sampler
+        self._ratio_samplers: dict[float, TraceIdRatioBased] = {}
+
+    def should_sample(
+        self,
+        parent_context: Context | None,
+        trace_id: int,
+        name: str,
+        kind: SpanKind | None = None,
+        attributes: Attributes = None,
+        links: Sequence[Link] | None = None,
+        trace_state: trace.TraceState | None = None,
+    ) -> SamplingResult:
+        path = (attributes or {}).get("url.path")
+        if isinstance(path, str):
+            rate = self.sampler.sample_rate(path)
+        else:
+            rate = self.sampler.sample_rates["default"]
+        ratio_sampler = self._ratio_samplers.get(rate)
+        if ratio_sampler is None:
+            ratio_sampler = self._ratio_samplers[rate] = TraceIdRatioBased(rate)
+        return ratio_sampler.should_sample(
+            parent_context, trace_id, name, kind, attributes, links, trace_state
+        )
+
+    def get_description(self) -> str:
+        return "RouteSampler"
+
+
+def route_parent_based(route_sampler: RouteSampler) -> ParentBased:
+    """
+    Sample the request spans at their route rate, even those continuing a trace
+    started by a client, which could otherwise have all its requests traced.
+    The spans started inside a request follow its decision.
+    """
+    return ParentBased(
+        root=route_sampler,
+        remote_parent_sampled=route_sampler,
+        remote_parent_not_sampled=route_sampler,
+    )
+
+
+def setup_opentelemetry(
+    *, endpoint: str, service_name: str, environment: str, sampler: RouteTracesSampler
+) -> None:
+    provider = TracerProvider(
+        resource=Resource.create(
+            {"service.name": service_name, "deployment.environment": environment}
+        ),
+        sampler=route_parent_based(RouteSampler(sampler)),
+    )
+    provider.add_span_processor(
+        BatchSpanProcessor(OTLPSpanExporter(endpoint=f"{endpoint}/v1/traces"))
+    )
+    trace.set_tracer_provider(provider)
@@ -0,0 +1,32 @@
+import base64
+import functools
+from typing import Any
+
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+
+
+def encode_cursor(key: tuple[Any, ...]) -> str:
+    """
+    Opaque cursor of a keyset page, the sort key of its last row.
+    """
+    return base64.urlsafe_b64encode(to_json(key)).decode().rstrip("=")
+
+
+@functools.lru_cache(maxsize=32)
+def _key_adapter(key_type: Any) -> TypeAdapter[Any]:
+    return TypeAdapter(key_type)
+
+
+def decode_cursor(cursor: str, key_type: Any) -> Any:
+    """
+    The sort key of a cursor made by encode_cursor, validated as `key_type`,
+    e.g. tuple[datetime, uuid.UUID].
+
+    Raises ValueError for anything else, e.g. the cursor of another sort.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return _key_adapter(key_type).validate_json(data)
+    except ValueError as e:
+        raise ValueError("Invalid cursor") from e
@@ -0,0 +1,150 @@
+import logging
+import time
+from collections import Counter
+from collections.abc import Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import Engine, event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    duration: float = 0.0
+    statements: Counter[str] = field(default_factory=Counter)
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def repeated_statements(self, threshold: int) -> list[tuple[str, int]]:
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count > threshold
+        ]
+
+    def server_timing(self) -> str:
+        return f'db;desc="{self.count} queries";dur={self.duration * 1000:.2f}'
+
+
+# Statistics of the request being handled, the same object is shared with the
+# threadpool workers running sync endpoints and dependencies
+_request_stats: ContextVar[QueryStats | None] = ContextVar(
+    "request_query_stats", default=None
+)
+_request_scope: ContextVar[Scope | None] = ContextVar("request_scope", default=None)
+# Collectors started with count_queries(), they see statements from any thread
+_collectors: list[QueryStats] = []
+# Statements starting with one of these aren't counted, e.g. the SAVEPOINTs the
+# tests run every request in. BEGIN and COMMIT don't even go through a cursor
+ignored_statements: tuple[str, ...] = ()
+
+
+def _before_cursor_execute(conn: Any, *_args: Any) -> None:
+    # Statements on a connection run one at a time. A single value, overwritten
+    # by the next statement, so one that failed leaves nothing behind
+    conn.info["query_start_time"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn: Any, _cursor: Any, statement: str, *_args: Any) -> None:
+    duration = time.perf_counter() - conn.info["query_start_time"]
+    if statement.startswith(ignored_statements):
+        return
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.record(statement, duration)
+    for collector in _collectors:
+        collector.record(statement, duration)
+
+
+def current_query_stats() -> QueryStats | None:
+    """
+    Statistics of the request being handled, if any.
+    """
+    return _request_stats.get()
+
+
+def current_route() -> str | None:
+    """
+    Method and route path of the request being handled, if any.
+    """
+    scope = _request_scope.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+
+
+def instrument_engine(engine: Engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def count_queries() -> Generator[QueryStats, None, None]:
+    """
+    Collect the statements run on instrumented engines while the block runs.
+    """
+    stats = QueryStats()
+    _collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _collectors.remove(stats)
+
+
+class QueryStatsMiddleware:
+    """
+    Count the statements and the database time of each request.
+
+    Statements repeated more than `repeat_threshold` times in the same request,
+    usually a lazy relationship loaded in a loop, are logged as warnings.
+    """
+
+    def __init__(
+        self, app: ASGIApp, *, server_timing: bool, repeat_threshold: int
+    ) -> None:
+        self.app = app
+        self.server_timing = server_timing
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Sub-requests of POST /batch are counted in the batch request
+        if scope["type"] != "http" or _request_stats.get() is not None:
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _request_stats.set(stats)
+        scope_token = _request_scope.set(scope)
+
+        async def send_with_server_timing(message: Message) -> None:
+            if message["type"] == "http.response.start" and self.server_timing:
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            self._warn_repeated_statements(stats)
+            _request_scope.reset(scope_token)
+            _request_stats.reset(token)
+
+    def _warn_repeated_statements(self, stats: QueryStats) -> None:
+        for statement, count in stats.repeated_statements(self.repeat_threshold):
+            logger.warning(
+                "Possible N+1 query in %s, statement ran %d times: %s",
+                current_route(),
+                count,
+                statement,
+            )
@@ -0,0 +1,142 @@
+"""
+Readiness checks of the dependencies needed to serve requests.
+
+Liveness, /utils/health-check/, only tells the process is up. Readiness checks
+that every database accepts connections and is migrated to the head revision of
+this code, and that the SMTP server accepts connections when emails are
+enabled. The results are cached for a few seconds, frequent probes from several
+load balancers run the checks once.
+
+Every check gives up after READINESS_CHECK_TIMEOUT_SECONDS. The probe is
+public, why a check failed is only logged.
+"""
+
+import logging
+import math
+import socket
+import threading
+import time
+from collections.abc import Callable
+from functools import cache, partial
+from pathlib import Path
+
+from sqlalchemy import Engine, create_engine, text
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+from app.core.sharding import all_shards, get_shard_engine
+from app.models import ReadinessCheck, ReadinessPublic
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parents[1] / "alembic"
+
+
+@cache
+def migration_heads() -> set[str]:
+    # Imported on the first check, alembic is slow to import and only needed here
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    return set(ScriptDirectory.from_config(config).get_heads())
+
+
+@cache
+def readiness_engine(shard: str | None) -> Engine:
+    """
+    Engine of the checks on the shard, with a connection of its own per check.
+
+    Connecting times out, and a check doesn't wait for a connection of an
+    exhausted app pool.
+    """
+    return create_engine(
+        get_shard_engine(shard).url,
+        poolclass=NullPool,
+        # libpq takes whole seconds
+        connect_args={
+            "connect_timeout": math.ceil(settings.READINESS_CHECK_TIMEOUT_SECONDS)
+        },
+    )
+
+
+def check_database(shard: str | None) -> None:
+    """
+    Connect and compare the database revision with the code.
+    """
+    timeout_ms = int(settings.READINESS_CHECK_TIMEOUT_SECONDS * 1000)
+    with readiness_engine(shard).connect() as connection:
+        connection.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+        revisions = set(
+            connection.execute(text("SELECT version_num FROM alembic_version"))
+            .scalars()
+            .all()
+        )
+    if revisions != migration_heads():
+        raise RuntimeError(
+            f"Database at revision {', '.join(sorted(revisions)) or 'none'}, "
+            f"expected {', '.join(sorted(migration_heads()))}"
+        )
+
+
+def check_smtp() -> None:
+    if not settings.emails_enabled:
+        return
+    assert settings.SMTP_HOST
+    with socket.create_connection(
+        (settings.SMTP_HOST, settings.SMTP_PORT),
+        timeout=settings.READINESS_CHECK_TIMEOUT_SECONDS,
+    ):
+        pass
+
+
+def default_checks() -> dict[str, Callable[[], None]]:
+    checks: dict[str, Callable[[], None]] = {}
+    for shard in all_shards():
+        name = "database" if shard is None else f"database:{shard}"
+        checks[name] = partial(check_database, shard)
+    checks["smtp"] = check_smtp
+    return checks
+
+
+class ReadinessProbe:
+    """
+    Run the checks at most once per `ttl` seconds, concurrent probes wait for
+    the run in progress and share its result.
+
+    A check fails when it raises, the error is logged and not returned.
+    """
+
+    def __init__(self, checks: dict[str, Callable[[], None]], *, ttl: float) -> None:
+        self.checks = checks
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._result: ReadinessPublic | None = None
+        self._checked_at = 0.0
+
+    def check(self) -> ReadinessPublic:
+        with self._lock:
+            if self._result is None or time.monotonic() - self._checked_at > self.ttl:
+                self._result = self._run_checks()
+                self._checked_at = time.monotonic()
+            return self._result
+
+    def _run_checks(self) -> ReadinessPublic:
+        results = {}
+        for name, check in self.checks.items():
+            start = time.perf_counter()
+            try:
+                check()
+                ok = True
+            except Exception as e:
+                logger.warning(
+                    "Readiness check %s failed: %s: %s", name, type(e).__name__, e
+                )
+                ok = False
+            results[name] = ReadinessCheck(
+                ok=ok, duration_ms=(time.perf_counter() - start) * 1000
+            )
+        return ReadinessPublic(
+            ready=all(result.ok for result in results.values()), checks=results
+        )
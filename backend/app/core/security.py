@@ -2,15 +2,39 @@ from datetime import datetime, timedelta, timezone
 from typing import Any
 
 import jwt
+from opentelemetry import trace
 from passlib.context import CryptContext
 
 from app.core.config import settings
+from app.core.metrics import PASSWORD_HASH_DURATION
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor of each password hash profile, a "fast" hash takes ~1ms
+# instead of ~250ms. Hashes of any cost verify with either profile
+BCRYPT_ROUNDS = {"secure": 12, "fast": 4}
+
+
+def create_pwd_context(*, profile: str, environment: str) -> CryptContext:
+    # Checked again here in case the settings were changed after validation, a
+    # deployment must never store cheap hashes
+    if profile != "secure" and environment != "local":
+        raise RuntimeError(
+            f'Password hash profile "{profile}" is not allowed in {environment}'
+        )
+    return CryptContext(
+        schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS[profile]
+    )
+
+
+pwd_context = create_pwd_context(
+    profile=settings.PASSWORD_HASH_PROFILE or "secure",
+    environment=settings.ENVIRONMENT,
+)
 
 
 ALGORITHM = "HS256"
 
+tracer = trace.get_tracer(__name__)
+
 
 def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     expire = datetime.now(timezone.utc) + expires_delta
@@ -20,8 +44,16 @@ def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    with (
+        PASSWORD_HASH_DURATION.labels("verify").time(),
+        tracer.start_as_current_span("password verify"),
+    ):
+        return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    with (
+        PASSWORD_HASH_DURATION.labels("hash").time(),
+        tracer.start_as_current_span("password hash"),
+    ):
+        return pwd_context.hash(password)
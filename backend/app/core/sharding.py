@@ -0,0 +1,34 @@
+import threading
+
+from sqlalchemy import Engine
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import create_db_engine, engine
+from app.core.metrics import instrument_pool
+from app.core.query_stats import instrument_engine
+
+# The main database is the shard named None, it holds every user and the data of
+# the users whose User.shard is None
+_shard_engines: dict[str, Engine] = {}
+_lock = threading.Lock()
+
+
+def get_shard_engine(shard: str | None) -> Engine:
+    if shard is None:
+        return engine
+    with _lock:
+        if shard not in _shard_engines:
+            shard_engine = create_db_engine(str(settings.SHARD_DATABASE_URIS[shard]))
+            instrument_engine(shard_engine)
+            instrument_pool(shard_engine, database=shard)
+            _shard_engines[shard] = shard_engine
+        return _shard_engines[shard]
+
+
+def all_shards() -> list[str | None]:
+    return [None, *settings.SHARD_DATABASE_URIS]
+
+
+def shard_session(shard: str | None) -> Session:
+    return Session(get_shard_engine(shard), expire_on_commit=False)
@@ -0,0 +1,191 @@
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from logging.handlers import WatchedFileHandler
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import Engine, event
+
+from app.core.query_stats import current_route
+
+logger = logging.getLogger(__name__)
+
+# Statements that EXPLAIN accepts, anything else is logged without a plan
+EXPLAINABLE_PREFIXES = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+# Quoted constants in plan conditions, e.g. (email = 'x@example.com'::text)
+PLAN_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+
+def redact_plan(plan: Any) -> Any:
+    """
+    Replace the bound values that Postgres inlines in the plan conditions.
+    """
+    if isinstance(plan, str):
+        return PLAN_LITERAL.sub("'?'", plan)
+    if isinstance(plan, list):
+        return [redact_plan(item) for item in plan]
+    if isinstance(plan, dict):
+        return {key: redact_plan(value) for key, value in plan.items()}
+    return plan
+
+
+@dataclass
+class SlowQuery:
+    statement: str
+    duration_ms: float
+    route: str | None
+    timestamp: str
+    # Bound values, only used to plan the statement and never written to the log
+    parameters: Any = field(default=None, repr=False)
+
+    def to_json(self, plan: Any = None) -> str:
+        return json.dumps(
+            {
+                "timestamp": self.timestamp,
+                "route": self.route,
+                "duration_ms": round(self.duration_ms, 2),
+                "statement": self.statement,
+                "plan": plan,
+            }
+        )
+
+
+class SlowQueryLog:
+    """
+    Write statements slower than `threshold_ms` as JSON lines to a log file.
+
+    The server workers append to the same file, each line with a single write,
+    and the file is rotated outside of the app, e.g. by logrotate. A rotated
+    file is noticed and reopened by each worker.
+
+    A `sample_rate` fraction of the slow statements is logged. The plan of a
+    logged statement is captured with EXPLAIN (FORMAT JSON) by a background
+    thread, at most once per `explain_interval` seconds for the same statement,
+    so the request that ran it never waits for it.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        *,
+        threshold_ms: float,
+        sample_rate: float,
+        explain_interval: float,
+        log_file: str,
+    ) -> None:
+        self.engine = engine
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.explain_interval = explain_interval
+        self._last_explained: dict[str, float] = {}
+        self._explain_queue: queue.Queue[SlowQuery] = queue.Queue(maxsize=100)
+        self._explain_thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+        Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+        # Opened by the first write of each worker, not in the preloading master
+        self._handler = WatchedFileHandler(log_file, delay=True)
+
+    def install(self) -> None:
+        event.listen(self.engine, "before_cursor_execute", self._before_execute)
+        event.listen(self.engine, "after_cursor_execute", self._after_execute)
+
+    def uninstall(self) -> None:
+        event.remove(self.engine, "before_cursor_execute", self._before_execute)
+        event.remove(self.engine, "after_cursor_execute", self._after_execute)
+        self._handler.close()
+
+    def write(self, line: str) -> None:
+        # The handler serializes writes from request threads and the explain
+        # thread, and reopens the file once it was moved away
+        self._handler.handle(logging.makeLogRecord({"msg": line}))
+
+    def _before_execute(self, conn: Any, *_args: Any) -> None:
+        # Overwritten by the next statement, even if this one fails
+        conn.info["slow_query_start_time"] = time.perf_counter()
+
+    def _after_execute(
+        self,
+        conn: Any,
+        _cursor: Any,
+        statement: str,
+        parameters: Any,
+        _context: Any,
+        executemany: bool,
+    ) -> None:
+        duration = time.perf_counter() - conn.info["slow_query_start_time"]
+        if conn.info.get("slow_query_explain"):
+            return
+        if duration < self.threshold or random.random() >= self.sample_rate:
+            return
+        slow_query = SlowQuery(
+            statement=statement,
+            duration_ms=duration * 1000,
+            route=current_route(),
+            timestamp=datetime.now(timezone.utc).isoformat(),
+            parameters=parameters,
+        )
+        if executemany or not self._should_explain(statement):
+            self.write(slow_query.to_json())
+            return
+        try:
+            self._explain_queue.put_nowait(slow_query)
+        except queue.Full:
+            self.write(slow_query.to_json())
+            return
+        self._ensure_explain_thread()
+
+    def _should_explain(self, statement: str) -> bool:
+        if not statement.lstrip().upper().startswith(EXPLAINABLE_PREFIXES):
+            return False
+        now = time.monotonic()
+        with self._lock:
+            last_explained = self._last_explained.get(statement)
+            if (
+                last_explained is not None
+                and now - last_explained < self.explain_interval
+            ):
+                return False
+            if len(self._last_explained) >= 1000:
+                self._last_explained.clear()
+            self._last_explained[statement] = now
+        return True
+
+    def _ensure_explain_thread(self) -> None:
+        with self._lock:
+            if self._explain_thread is None:
+                self._explain_thread = threading.Thread(
+                    target=self._explain_worker, name="slow-query-explain", daemon=True
+                )
+                self._explain_thread.start()
+
+    def _explain_worker(self) -> None:
+        while True:
+            slow_query = self._explain_queue.get()
+            self.write(slow_query.to_json(plan=self.explain(slow_query)))
+            self._explain_queue.task_done()
+
+    def explain(self, slow_query: SlowQuery) -> Any:
+        # The EXPLAIN itself goes through the same listeners, the flag on the
+        # connection keeps it out of the log
+        try:
+            with self.engine.connect() as conn:
+                conn.info["slow_query_explain"] = True
+                try:
+                    result = conn.exec_driver_sql(
+                        f"EXPLAIN (FORMAT JSON) {slow_query.statement}",
+                        slow_query.parameters,
+                    )
+                    return redact_plan(result.scalar())
+                finally:
+                    del conn.info["slow_query_explain"]
+        except Exception as e:
+            logger.warning(f"Could not capture slow query plan: {e}")
+            return None
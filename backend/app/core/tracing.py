@@ -0,0 +1,102 @@
+"""
+Sampling of the request traces, sent to Sentry or exported with OpenTelemetry.
+
+Whether a request is traced is decided when it starts, by its route class:
+health checks are never traced and the expensive routes, the slow ones, more
+often than the rest. Errors are reported to Sentry whether traced or not.
+"""
+
+from typing import Any
+
+from opentelemetry import context, propagate, trace
+from opentelemetry.trace import SpanKind
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.concurrency_limit import RouteClass, get_route_class
+from app.core.metrics import route_name
+from app.core.query_stats import current_query_stats
+
+
+class RouteTracesSampler:
+    def __init__(
+        self,
+        *,
+        critical_paths: set[str],
+        expensive_paths: set[str],
+        sample_rates: dict[RouteClass, float],
+    ) -> None:
+        self.critical_paths = critical_paths
+        self.expensive_paths = expensive_paths
+        self.sample_rates = sample_rates
+
+    def sample_rate(self, path: str) -> float:
+        route_class = get_route_class(
+            path,
+            critical_paths=self.critical_paths,
+            expensive_paths=self.expensive_paths,
+        )
+        return self.sample_rates[route_class]
+
+    def __call__(self, sampling_context: dict[str, Any]) -> float:
+        """
+        Sentry traces_sampler, the decision of a trace started by a client is
+        ignored, any client could send one to have all its requests traced.
+        """
+        scope = sampling_context.get("asgi_scope")
+        if scope is None:
+            # Not a request, e.g. a script
+            return self.sample_rates["default"]
+        return self.sample_rate(scope["path"])
+
+
+class OpenTelemetryMiddleware:
+    """
+    Start a server span per request, with the time spent in the database.
+
+    The spans are no-ops until app.core.otel sets up the OpenTelemetry SDK.
+    """
+
+    def __init__(
+        self, app: ASGIApp, *, tracer_provider: trace.TracerProvider | None = None
+    ) -> None:
+        self.app = app
+        self.tracer = trace.get_tracer(__name__, tracer_provider=tracer_provider)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope["headers"]
+        }
+        # The operations of a batch request are children of its span
+        parent = propagate.extract(carrier, context=context.get_current())
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with self.tracer.start_as_current_span(
+            f"{method} {scope['path']}",
+            context=parent,
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": method, "url.path": scope["path"]},
+        ) as span:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                if span.is_recording():
+                    route = route_name(scope)
+                    span.update_name(f"{method} {route}")
+                    span.set_attribute("http.route", route)
+                    span.set_attribute("http.response.status_code", status)
+                    stats = current_query_stats()
+                    if stats is not None:
+                        span.set_attribute("db.statement_count", stats.count)
+                        span.set_attribute("db.duration_ms", stats.duration * 1000)
@@ -1,19 +1,45 @@
 import uuid
+from collections.abc import Sequence
+from datetime import date, datetime, timedelta, timezone
 from typing import Any
 
-from sqlmodel import Session, select
+from sqlalchemy import Row, Select
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg, insert
+from sqlmodel import Session, col, delete, func, select, update
 
+from app.core.config import settings
+from app.core.ids import uuid7
 from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
+from app.models import (
+    DigestRun,
+    IdempotencyRecord,
+    Item,
+    ItemCreate,
+    OutboundEmail,
+    Tag,
+    Todo,
+    User,
+    UserCreate,
+    UserDeletionJob,
+    UserUpdate,
+)
 
 
-def create_user(*, session: Session, user_create: UserCreate) -> User:
+def create_user(
+    *, session: Session, user_create: UserCreate, commit: bool = True
+) -> User:
+    """
+    With `commit=False` the user is only flushed, to be committed with the
+    caller's other changes.
+    """
     db_obj = User.model_validate(
         user_create, update={"hashed_password": get_password_hash(user_create.password)}
     )
     session.add(db_obj)
-    session.commit()
-    session.refresh(db_obj)
+    if commit:
+        session.commit()
+    else:
+        session.flush()
     return db_obj
 
 
@@ -27,7 +53,6 @@ def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
     db_user.sqlmodel_update(user_data, update=extra_data)
     session.add(db_user)
     session.commit()
-    session.refresh(db_user)
     return db_user
 
 
@@ -46,9 +71,386 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
     return db_user
 
 
+def estimate_rows(*, session: Session, statement: Select[Any]) -> int:
+    """
+    The number of rows the query planner expects `statement` to return, from the
+    statistics of the tables, without running it.
+    """
+    compiled = statement.compile(
+        bind=session.get_bind(), compile_kwargs={"render_postcompile": True}
+    )
+    plan = (
+        session.connection()
+        .exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params)
+        .scalar_one()
+    )
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_rows(
+    *, session: Session, statement: Select[Any], exact_limit: int
+) -> tuple[int, bool]:
+    """
+    Count the rows of `statement` exactly up to `exact_limit`, estimate the count
+    past it, return the count and whether it's estimated.
+
+    The exact count reads at most `exact_limit` + 1 rows, however many match.
+    """
+    bounded = select(func.count()).select_from(
+        statement.limit(exact_limit + 1).subquery()
+    )
+    count = session.exec(bounded).one()
+    if count <= exact_limit:
+        return count, False
+    return max(estimate_rows(session=session, statement=statement), count), True
+
+
 def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -> Item:
     db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
     session.add(db_item)
     session.commit()
-    session.refresh(db_item)
     return db_item
+
+
+def delete_user(
+    *, session: Session, user: User, data_session: Session | None = None
+) -> None:
+    """
+    Delete the user, the database cascades delete their todos and tags.
+
+    `data_session` is a session on the user's shard when their data isn't in the
+    main database, the copy of the user row there is deleted too.
+    """
+    session.delete(user)
+    session.commit()
+    if data_session is not None:
+        statement = delete(User).where(col(User.id) == user.id)
+        data_session.exec(statement)  # type: ignore
+        data_session.commit()
+
+
+def delete_user_rows(
+    *, session: Session, model: type[Todo] | type[Tag], user_id: uuid.UUID, limit: int
+) -> int:
+    """
+    Delete up to `limit` of the user's todos or tags, return how many were deleted.
+
+    Links in todotag are deleted by the database together with their todo or tag.
+    """
+    batch = select(model.id).where(model.user_id == user_id).limit(limit)
+    statement = delete(model).where(col(model.id).in_(batch.scalar_subquery()))
+    result = session.exec(statement)  # type: ignore
+    session.commit()
+    return int(result.rowcount)
+
+
+def create_user_deletion_job(
+    *, session: Session, user_id: uuid.UUID, data_session: Session | None = None
+) -> UserDeletionJob:
+    statement = select(UserDeletionJob).where(
+        UserDeletionJob.user_id == user_id,
+        col(UserDeletionJob.status).in_(["pending", "running"]),
+    )
+    db_job = session.exec(statement).first()
+    if db_job:
+        return db_job
+    rows_session = data_session or session
+    total_todos = rows_session.exec(
+        select(func.count()).select_from(Todo).where(Todo.user_id == user_id)
+    ).one()
+    total_tags = rows_session.exec(
+        select(func.count()).select_from(Tag).where(Tag.user_id == user_id)
+    ).one()
+    db_job = UserDeletionJob(
+        user_id=user_id, total_todos=total_todos, total_tags=total_tags
+    )
+    session.add(db_job)
+    session.commit()
+    return db_job
+
+
+def run_user_deletion_job(
+    *,
+    session: Session,
+    db_job: UserDeletionJob,
+    batch_size: int,
+    data_session: Session | None = None,
+) -> UserDeletionJob:
+    """
+    Delete the user's todos, then tags, in batches, then the user.
+
+    Every batch is committed with the job progress, `data_session` is a session
+    on the user's shard when their data isn't in the main database.
+    """
+    db_job.status = "running"
+    session.add(db_job)
+    session.commit()
+    rows_session = data_session or session
+    for model, counter in ((Todo, "deleted_todos"), (Tag, "deleted_tags")):
+        while True:
+            deleted = delete_user_rows(
+                session=rows_session,
+                model=model,
+                user_id=db_job.user_id,
+                limit=batch_size,
+            )
+            setattr(db_job, counter, getattr(db_job, counter) + deleted)
+            session.add(db_job)
+            session.commit()
+            if deleted < batch_size:
+                break
+    user = session.get(User, db_job.user_id)
+    if user:
+        delete_user(session=session, user=user, data_session=data_session)
+    db_job.status = "finished"
+    db_job.finished_at = datetime.now(timezone.utc)
+    session.add(db_job)
+    session.commit()
+    return db_job
+
+
+def get_idempotency_record(
+    *, session: Session, user_id: uuid.UUID | None, key: str
+) -> IdempotencyRecord | None:
+    user_filter = (
+        col(IdempotencyRecord.user_id).is_(None)
+        if user_id is None
+        else col(IdempotencyRecord.user_id) == user_id
+    )
+    statement = select(IdempotencyRecord).where(
+        user_filter,
+        IdempotencyRecord.key == key,
+        IdempotencyRecord.expires_at > func.now(),
+    )
+    return session.exec(statement).first()
+
+
+def create_idempotency_record(
+    *,
+    session: Session,
+    user_id: uuid.UUID | None,
+    key: str,
+    fingerprint: bytes,
+    status_code: int,
+    response: bytes,
+    ttl: timedelta,
+    evict_limit: int = 100,
+) -> None:
+    """
+    Store the response of a request, then evict up to `evict_limit` expired ones.
+
+    A concurrent request with the same key may have stored its response first,
+    that one is kept.
+    """
+    statement = (
+        insert(IdempotencyRecord)
+        .values(
+            id=uuid7(),
+            user_id=user_id,
+            key=key,
+            fingerprint=fingerprint,
+            status_code=status_code,
+            response=response,
+            expires_at=datetime.now(timezone.utc) + ttl,
+        )
+        .on_conflict_do_nothing()
+    )
+    session.exec(statement)  # type: ignore
+    expired = (
+        select(IdempotencyRecord.id)
+        .where(IdempotencyRecord.expires_at <= func.now())
+        .limit(evict_limit)
+    )
+    evict_statement = delete(IdempotencyRecord).where(
+        col(IdempotencyRecord.id).in_(expired.scalar_subquery())
+    )
+    session.exec(evict_statement)  # type: ignore
+    session.commit()
+
+
+def enqueue_email(
+    *,
+    session: Session,
+    email_to: str,
+    subject: str,
+    html_content: str,
+    commit: bool = True,
+) -> OutboundEmail:
+    """
+    With `commit=False` the email is only added to the session, to be sent once
+    the caller's other changes are committed with it.
+    """
+    assert settings.emails_enabled, "no provided configuration for email variables"
+    db_email = OutboundEmail(
+        email_to=email_to, subject=subject, html_content=html_content
+    )
+    session.add(db_email)
+    if commit:
+        session.commit()
+    return db_email
+
+
+def claim_emails(
+    *, session: Session, limit: int, lease: timedelta
+) -> list[OutboundEmail]:
+    """
+    Claim up to `limit` pending emails that are due, oldest first.
+
+    The emails locked by another worker's claim are skipped instead of waited
+    for. A claimed email is due again once the lease expires, the emails of a
+    worker that died are claimed by another one.
+    """
+    due = (
+        select(OutboundEmail.id)
+        .where(
+            OutboundEmail.status == "pending",
+            col(OutboundEmail.next_attempt_at) <= func.now(),
+        )
+        .order_by(col(OutboundEmail.next_attempt_at))
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    statement = (
+        update(OutboundEmail)
+        .where(col(OutboundEmail.id).in_(due.scalar_subquery()))
+        .values(
+            attempts=OutboundEmail.attempts + 1,
+            next_attempt_at=func.now() + lease,
+        )
+        .returning(OutboundEmail)
+    )
+    db_emails = list(session.scalars(statement))
+    session.commit()
+    return db_emails
+
+
+def delete_emails(*, session: Session, ids: list[uuid.UUID]) -> None:
+    statement = delete(OutboundEmail).where(col(OutboundEmail.id).in_(ids))
+    session.exec(statement)  # type: ignore
+    session.commit()
+
+
+def fail_email(
+    *,
+    session: Session,
+    db_email: OutboundEmail,
+    error: str,
+    retry_in: timedelta | None,
+) -> None:
+    """
+    Record a failed attempt, the email is retried after `retry_in`, or given up
+    when it's None.
+
+    The content of a given up email is cleared, it may hold a link to set a
+    password, its recipient and error are kept until delete_failed_emails.
+    """
+    db_email.error = error[:255]
+    if retry_in is None:
+        db_email.status = "failed"
+        db_email.html_content = ""
+        db_email.next_attempt_at = datetime.now(timezone.utc)
+    else:
+        db_email.next_attempt_at = datetime.now(timezone.utc) + retry_in
+    session.add(db_email)
+    session.commit()
+
+
+def delete_failed_emails(*, session: Session, older_than: timedelta) -> int:
+    """
+    Delete the emails given up more than `older_than` ago, return how many.
+    """
+    statement = delete(OutboundEmail).where(
+        col(OutboundEmail.status) == "failed",
+        col(OutboundEmail.next_attempt_at) < func.now() - older_than,
+    )
+    result = session.exec(statement)  # type: ignore
+    session.commit()
+    return int(result.rowcount)
+
+
+def get_digest_run(*, session: Session, day: date, shard: str | None) -> DigestRun:
+    """
+    The run of the digests of `day` on the shard, created on the first call.
+    """
+    statement = (
+        insert(DigestRun)
+        .values(id=uuid7(), day=day, shard=shard, queued=0)
+        .on_conflict_do_nothing()
+    )
+    session.exec(statement)  # type: ignore
+    shard_filter = (
+        col(DigestRun.shard).is_(None)
+        if shard is None
+        else col(DigestRun.shard) == shard
+    )
+    db_run = session.exec(
+        select(DigestRun).where(DigestRun.day == day, shard_filter)
+    ).one()
+    session.commit()
+    return db_run
+
+
+def get_todo_digests(
+    *,
+    session: Session,
+    day_start: datetime,
+    after: uuid.UUID | None,
+    limit: int,
+    titles_limit: int,
+) -> Sequence[Row[Any]]:
+    """
+    Count the open todos of the users that were due before `day_start`, and
+    that are due that day, with the titles of the first `titles_limit` of each.
+
+    One grouped query returns the users with any of them, up to `limit` after
+    the user `after`, in user id order.
+    """
+    overdue = col(Todo.due_date) < day_start
+    titles = array_agg(  # type: ignore[no-untyped-call]
+        aggregate_order_by(Todo.title, col(Todo.due_date), col(Todo.id))  # type: ignore[no-untyped-call]
+    )
+    statement = (
+        select(  # type: ignore[call-overload]
+            Todo.user_id,
+            func.count().filter(overdue).label("overdue"),
+            titles.filter(overdue)[1:titles_limit].label("overdue_titles"),
+            func.count().filter(~overdue).label("due_today"),
+            titles.filter(~overdue)[1:titles_limit].label("due_today_titles"),
+        )
+        .where(
+            # As in the predicate of the partial index
+            ~col(Todo.is_completed),
+            ~col(Todo.is_deleted),
+            col(Todo.due_date) < day_start + timedelta(days=1),
+        )
+        .group_by(col(Todo.user_id))
+        .order_by(col(Todo.user_id))
+        .limit(limit)
+    )
+    if after is not None:
+        statement = statement.where(Todo.user_id > after)
+    return session.execute(statement).all()
+
+
+def save_digests(
+    *,
+    session: Session,
+    db_run: DigestRun,
+    emails: list[OutboundEmail],
+    last_user_id: uuid.UUID,
+) -> None:
+    """
+    Queue the digest emails of a batch of users and move the run past them, in
+    the same transaction: a resumed run never queues them again.
+    """
+    session.add_all(emails)
+    db_run.last_user_id = last_user_id
+    db_run.queued += len(emails)
+    session.add(db_run)
+    session.commit()
+
+
+def finish_digest_run(*, session: Session, db_run: DigestRun) -> None:
+    db_run.finished_at = datetime.now(timezone.utc)
+    session.add(db_run)
+    session.commit()
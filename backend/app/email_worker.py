@@ -0,0 +1,143 @@
+"""
+Send the emails queued in the database by the API.
+
+    $ python app/email_worker.py
+
+Emails are claimed in batches with SELECT ... FOR UPDATE SKIP LOCKED, several
+workers share the queue without waiting for each other. They're sent over one
+SMTP connection, opened for the first email and kept while the queue isn't
+empty, instead of a connection and a handshake per email. A failed email is
+retried later with exponential backoff, unless the server refused it for good.
+Given up emails are deleted after EMAIL_FAILED_RETENTION_DAYS.
+"""
+
+import argparse
+import logging
+import signal
+import smtplib
+import threading
+import time
+from datetime import timedelta
+from typing import Any
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.utils import send_email, smtp_options
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The given up emails are deleted at most this often, while the queue is idle
+PURGE_INTERVAL_SECONDS = 60 * 60
+
+
+def smtp_backend() -> Any:
+    from emails.backend import SMTPBackend  # type: ignore
+
+    # Errors are raised, the email is retried instead of lost
+    return SMTPBackend(fail_silently=False, **smtp_options())
+
+
+def is_permanent(error: Exception) -> bool:
+    """
+    Whether the server refused the email with a 5xx reply, it would again.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def retry_delay(attempts: int) -> timedelta:
+    seconds = settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.EMAIL_RETRY_MAX_SECONDS))
+
+
+def send_batch(*, session: Session, smtp: Any) -> int:
+    """
+    Claim a batch of emails and send them over `smtp`, return how many were
+    claimed.
+
+    The sent emails are deleted together at the end of the batch, a worker
+    killed in the middle sends them again once their lease expires.
+    """
+    db_emails = crud.claim_emails(
+        session=session,
+        limit=settings.EMAIL_WORKER_BATCH_SIZE,
+        lease=timedelta(seconds=settings.EMAIL_CLAIM_LEASE_SECONDS),
+    )
+    sent = []
+    for db_email in db_emails:
+        try:
+            send_email(
+                email_to=db_email.email_to,
+                subject=db_email.subject,
+                html_content=db_email.html_content,
+                smtp=smtp,
+            )
+        except Exception as e:
+            given_up = (
+                is_permanent(e) or db_email.attempts >= settings.EMAIL_MAX_ATTEMPTS
+            )
+            logger.warning(
+                "Sending email %s failed, attempt %d%s: %s",
+                db_email.id,
+                db_email.attempts,
+                ", given up" if given_up else "",
+                e,
+            )
+            crud.fail_email(
+                session=session,
+                db_email=db_email,
+                error=f"{type(e).__name__}: {e}",
+                retry_in=None if given_up else retry_delay(db_email.attempts),
+            )
+            # The connection may be left in any state, the next email opens a
+            # new one
+            smtp.close()
+        else:
+            sent.append(db_email.id)
+    if sent:
+        crud.delete_emails(session=session, ids=sent)
+    return len(db_emails)
+
+
+def run(*, stop: threading.Event) -> None:
+    if not settings.emails_enabled:
+        logger.warning("Emails are disabled, set SMTP_HOST and EMAILS_FROM_EMAIL")
+    smtp = smtp_backend()
+    purged_at = float("-inf")
+    with Session(engine, expire_on_commit=False) as session:
+        while not stop.is_set():
+            claimed = send_batch(session=session, smtp=smtp)
+            if claimed < settings.EMAIL_WORKER_BATCH_SIZE:
+                # The queue is drained, the server would close an idle connection
+                smtp.close()
+                if time.monotonic() - purged_at >= PURGE_INTERVAL_SECONDS:
+                    purged_at = time.monotonic()
+                    deleted = crud.delete_failed_emails(
+                        session=session,
+                        older_than=timedelta(days=settings.EMAIL_FAILED_RETENTION_DAYS),
+                    )
+                    if deleted:
+                        logger.info("Deleted %d given up emails", deleted)
+                stop.wait(settings.EMAIL_WORKER_POLL_SECONDS)
+    smtp.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.parse_args()
+
+    stop = threading.Event()
+    # Finish the batch in progress on docker stop, its emails are already
+    # claimed
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    logger.info("Sending queued emails")
+    run(stop=stop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Configuration of gunicorn, the production server, started by scripts/start.sh:
+
+    $ gunicorn --config app/gunicorn_conf.py app.main:app
+
+The app is imported once by the master process before it forks the workers, so
+they share its memory pages until they write to them, instead of each worker
+importing everything again. One worker runs per CPU available to the container.
+Workers are replaced after SERVER_MAX_REQUESTS requests, to give back memory
+that grows over time, and get SERVER_GRACEFUL_TIMEOUT_SECONDS to finish their
+requests on SIGTERM.
+"""
+
+import gc
+import os
+from typing import Any
+
+from prometheus_client import multiprocess
+
+from app.core.config import settings
+from app.core.cpu import available_cpus
+from app.core.metrics import CONCURRENCY_LIMIT, MULTIPROC_DIR
+
+bind = "0.0.0.0:8000"
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = settings.SERVER_WORKERS or available_cpus()
+preload_app = True
+max_requests = settings.SERVER_MAX_REQUESTS
+max_requests_jitter = settings.SERVER_MAX_REQUESTS_JITTER
+graceful_timeout = settings.SERVER_GRACEFUL_TIMEOUT_SECONDS
+# Same as uvicorn, which `fastapi run` used
+keepalive = 5
+accesslog = "-"
+
+
+def when_ready(_server: Any) -> None:
+    from app.utils import load_email_templates
+
+    # Compiled once here instead of by each worker on its first email
+    load_email_templates()
+    # Move the objects of the preloaded app out of the garbage collector's
+    # reach, its passes would write to their pages and copy them in each worker
+    gc.freeze()
+    # Gauges set while importing the app, the master doesn't serve requests
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())  # type: ignore[no-untyped-call]
+
+
+def post_fork(_server: Any, _worker: Any) -> None:
+    from app.core.db import engine
+    from app.main import app
+
+    # Connections opened by the master, if any, must not be shared with workers
+    engine.dispose(close=False)
+    # The metrics of a worker start from zero, except this one
+    concurrency_limit = getattr(app.state, "concurrency_limit", None)
+    if concurrency_limit is not None:
+        CONCURRENCY_LIMIT.set(concurrency_limit.limit)
+
+
+def child_exit(_server: Any, worker: Any) -> None:
+    # The live gauges of a dead worker must not be reported anymore
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(worker.pid)  # type: ignore[no-untyped-call]
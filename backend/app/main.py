@@ -1,26 +1,115 @@
-import sentry_sdk
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
+from app.core.compression import CompressionMiddleware
+from app.core.concurrency_limit import (
+    AdaptiveConcurrencyLimit,
+    ConcurrencyLimitMiddleware,
+)
 from app.core.config import settings
+from app.core.metrics import MetricsMiddleware, metrics
+from app.core.query_stats import QueryStatsMiddleware
+from app.core.responses import PydanticJSONResponse
+from app.core.tracing import OpenTelemetryMiddleware, RouteTracesSampler
+
+# Never shed nor traced
+CRITICAL_PATHS = {
+    f"{settings.API_V1_STR}/utils/health-check/",
+    f"{settings.API_V1_STR}/utils/ready/",
+}
+# Shed first, and traced more often
+EXPENSIVE_PATHS = {
+    f"{settings.API_V1_STR}/login/access-token",
+    f"{settings.API_V1_STR}/users/signup",
+    f"{settings.API_V1_STR}/reset-password/",
+}
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.tags[0]}-{route.name}"
 
 
+traces_sampler = RouteTracesSampler(
+    critical_paths=CRITICAL_PATHS,
+    expensive_paths=EXPENSIVE_PATHS,
+    sample_rates={
+        "critical": 0.0,
+        "default": settings.TRACES_SAMPLE_RATE,
+        "expensive": settings.TRACES_EXPENSIVE_SAMPLE_RATE,
+    },
+)
+
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
-    sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
+    # Only imported when enabled, the SDK and its HTTP transport are slow to import
+    import sentry_sdk
+
+    sentry_sdk.init(
+        dsn=str(settings.SENTRY_DSN),
+        traces_sampler=traces_sampler,
+        profiles_sample_rate=settings.SENTRY_PROFILES_SAMPLE_RATE,
+    )
+
+if settings.OTEL_EXPORTER_OTLP_ENDPOINT:
+    # Only imported when enabled, the OpenTelemetry SDK is an optional extra
+    from app.core.otel import setup_opentelemetry
+
+    setup_opentelemetry(
+        endpoint=str(settings.OTEL_EXPORTER_OTLP_ENDPOINT).rstrip("/"),
+        service_name=settings.PROJECT_NAME,
+        environment=settings.ENVIRONMENT,
+        sampler=traces_sampler,
+    )
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    default_response_class=PydanticJSONResponse,
 )
 
-# Set all CORS enabled origins
+# Inside QueryStatsMiddleware, to add its statistics to the request spans
+if settings.OTEL_EXPORTER_OTLP_ENDPOINT:
+    app.add_middleware(OpenTelemetryMiddleware)
+
+# Count database statements per request, exposed as Server-Timing outside production
+app.add_middleware(
+    QueryStatsMiddleware,
+    server_timing=settings.ENVIRONMENT != "production",
+    repeat_threshold=settings.QUERY_REPEAT_WARNING_THRESHOLD,
+)
+
+# Around the app's middleware, so the headers they add are kept
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    zstd_level=settings.COMPRESSION_ZSTD_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+)
+
+# Request latency and status codes by route, for Prometheus
+app.add_middleware(MetricsMiddleware)
+
+# Outside the app's middleware, shed requests are answered without doing any
+# other work
+if settings.CONCURRENCY_LIMIT_ENABLED:
+    app.state.concurrency_limit = AdaptiveConcurrencyLimit(
+        initial_limit=settings.CONCURRENCY_LIMIT_INITIAL,
+        min_limit=settings.CONCURRENCY_LIMIT_MIN,
+        max_limit=settings.CONCURRENCY_LIMIT_MAX,
+        latency_tolerance=settings.CONCURRENCY_LIMIT_LATENCY_TOLERANCE,
+    )
+    app.add_middleware(
+        ConcurrencyLimitMiddleware,
+        limit=app.state.concurrency_limit,
+        critical_paths=CRITICAL_PATHS,
+        expensive_paths=EXPENSIVE_PATHS,
+    )
+
+# Set all CORS enabled origins. Outermost, browsers only let the page read
+# responses with the CORS headers, the shed requests' 503 too
 if settings.all_cors_origins:
     app.add_middleware(
         CORSMiddleware,
@@ -31,3 +120,4 @@ if settings.all_cors_origins:
     )
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
+app.add_route("/metrics", metrics, include_in_schema=False)
@@ -1,12 +1,14 @@
 import uuid
-from datetime import datetime
-from typing import List, Optional
+from datetime import date, datetime
+from typing import Any, List, Literal, Optional
 
 from pydantic import EmailStr
-from sqlalchemy import Column, DateTime
+from sqlalchemy import Column, DateTime, Index, text
 from sqlalchemy.sql import func
 from sqlmodel import Field, Relationship, SQLModel
 
+from app.core.ids import uuid7
+
 
 # Shared properties
 class UserBase(SQLModel):
@@ -50,10 +52,43 @@ class UpdatePassword(SQLModel):
 
 # Database model, database table inferred from class name
 class User(UserBase, table=True):
-    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    # Read server-generated columns back with RETURNING in the INSERT/UPDATE
+    # itself instead of expiring them and running a SELECT on next access
+    __mapper_args__ = {"eager_defaults": True}
+    # The last change of any user, part of the ETag of the user list, is read
+    # from the end of the index
+    __table_args__ = (
+        Index("ix_user_changed_at", text("coalesce(updated_at, created_at)")),
+        # The admin search by prefix matches, sorts and pages with the same
+        # index, compared byte by byte
+        Index("ix_user_email_c", text('email COLLATE "C"')),
+        Index("ix_user_username_c", text('username COLLATE "C"')),
+        # Otherwise newest first, inactive and unverified users are few
+        Index("ix_user_created_at_id", "created_at", "id"),
+        Index(
+            "ix_user_created_at_id_inactive",
+            "created_at",
+            "id",
+            postgresql_where=text("NOT is_active"),
+        ),
+        Index(
+            "ix_user_created_at_id_unverified",
+            "created_at",
+            "id",
+            postgresql_where=text("NOT is_verified"),
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid7, primary_key=True)
     hashed_password: str
-    todos: List["Todo"] = Relationship(back_populates="user", cascade_delete=True)
-    tags: List["Tag"] = Relationship(back_populates="user", cascade_delete=True)
+    # Rows are deleted by ON DELETE CASCADE in the database, the ORM doesn't
+    # load them just to delete them one by one
+    todos: List["Todo"] = Relationship(
+        back_populates="user", cascade_delete=True, passive_deletes=True
+    )
+    tags: List["Tag"] = Relationship(
+        back_populates="user", cascade_delete=True, passive_deletes=True
+    )
     created_at: datetime | None = Field(
         default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now())
     )
@@ -61,6 +96,10 @@ class User(UserBase, table=True):
         default=None, sa_column=Column(DateTime(timezone=True), onupdate=func.now())
     )
     last_login_at: datetime | None = Field(default=None)
+    # Shard holding the user's todos and tags, None for the main database
+    shard: str | None = Field(default=None, max_length=64)
+    # Set while app/rebalance_shard.py switches the user to another shard
+    shard_moving: bool = False
 
 
 # Properties to return via API, id is always required
@@ -73,9 +112,23 @@ class UsersPublic(SQLModel):
     count: int
 
 
+class UsersSearchPublic(SQLModel):
+    data: list[UserPublic]
+    # Exact up to USER_SEARCH_EXACT_COUNT_LIMIT, estimated from the query plan
+    # past it
+    count: int
+    count_is_estimate: bool
+    # The cursor of the next page, None on the last one
+    next_cursor: str | None
+
+
 class TodoTag(SQLModel, table=True):
-    todo_id: uuid.UUID = Field(foreign_key="todo.id", primary_key=True)
-    tag_id: uuid.UUID = Field(foreign_key="tag.id", primary_key=True)
+    todo_id: uuid.UUID = Field(
+        foreign_key="todo.id", primary_key=True, ondelete="CASCADE"
+    )
+    tag_id: uuid.UUID = Field(
+        foreign_key="tag.id", primary_key=True, ondelete="CASCADE", index=True
+    )
     created_at: datetime | None = Field(
         default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now())
     )
@@ -99,10 +152,16 @@ class TagUpdate(TagBase):
 
 # Database model, database table inferred from class name
 class Tag(TagBase, table=True):
-    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    user_id: uuid.UUID = Field(foreign_key="user.id", nullable=False)
+    __mapper_args__ = {"eager_defaults": True}
+
+    id: uuid.UUID = Field(default_factory=uuid7, primary_key=True)
+    user_id: uuid.UUID = Field(
+        foreign_key="user.id", nullable=False, ondelete="CASCADE", index=True
+    )
     user: "User" = Relationship(back_populates="tags")
-    todos: List["Todo"] = Relationship(back_populates="tags", link_model=TodoTag)
+    todos: List["Todo"] = Relationship(
+        back_populates="tags", link_model=TodoTag, passive_deletes=True
+    )
     created_at: datetime | None = Field(
         default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now())
     )
@@ -144,10 +203,27 @@ class TodoUpdate(TodoBase):
 
 # Database model, database table inferred from class name
 class Todo(TodoBase, table=True):
-    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    user_id: uuid.UUID = Field(foreign_key="user.id", nullable=False)
+    __mapper_args__ = {"eager_defaults": True}
+    # The daily digests read the open todos with a due date, grouped by user
+    __table_args__ = (
+        Index(
+            "ix_todo_user_id_due_date_open",
+            "user_id",
+            "due_date",
+            postgresql_where=text(
+                "NOT is_completed AND NOT is_deleted AND due_date IS NOT NULL"
+            ),
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid7, primary_key=True)
+    user_id: uuid.UUID = Field(
+        foreign_key="user.id", nullable=False, ondelete="CASCADE", index=True
+    )
     user: "User" = Relationship(back_populates="todos")
-    tags: List["Tag"] = Relationship(back_populates="todos", link_model=TodoTag)
+    tags: List["Tag"] = Relationship(
+        back_populates="todos", link_model=TodoTag, passive_deletes=True
+    )
     completed_at: datetime | None = Field(default=None)
     deleted_at: datetime | None = Field(default=None)
     created_at: datetime | None = Field(
@@ -169,6 +245,120 @@ class TodosPublic(SQLModel):
     count: int
 
 
+# Background deletion of a user with a large amount of data
+class UserDeletionJob(SQLModel, table=True):
+    __mapper_args__ = {"eager_defaults": True}
+
+    id: uuid.UUID = Field(default_factory=uuid7, primary_key=True)
+    # Not a foreign key, the job outlives the user it deletes
+    user_id: uuid.UUID = Field(index=True)
+    status: str = Field(default="pending", max_length=16)  # pending, running, finished, failed
+    total_todos: int = 0
+    deleted_todos: int = 0
+    total_tags: int = 0
+    deleted_tags: int = 0
+    error: str | None = Field(default=None, max_length=255)
+    created_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now())
+    )
+    finished_at: datetime | None = Field(default=None)
+
+
+class UserDeletionJobPublic(SQLModel):
+    id: uuid.UUID
+    user_id: uuid.UUID
+    status: str
+    total_todos: int
+    deleted_todos: int
+    total_tags: int
+    deleted_tags: int
+    error: str | None
+    created_at: datetime | None
+    finished_at: datetime | None
+
+
+# Response of a request sent with an Idempotency-Key header, replayed instead
+# of running the request again when it's retried with the same key
+class IdempotencyRecord(SQLModel, table=True):
+    __table_args__ = (
+        Index(
+            "ix_idempotencyrecord_user_id_key",
+            "user_id",
+            "key",
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid7, primary_key=True)
+    # None for anonymous requests, e.g. sign ups
+    user_id: uuid.UUID | None = Field(default=None)
+    key: str = Field(max_length=255)
+    # SHA-256 of the method, path and body, a key can't be reused for another
+    # request
+    fingerprint: bytes
+    status_code: int
+    response: bytes
+    expires_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False, index=True)
+    )
+
+
+# Email waiting to be sent by app/email_worker.py, deleted once sent
+class OutboundEmail(SQLModel, table=True):
+    __mapper_args__ = {"eager_defaults": True}
+    # The workers claim the pending emails that are due, failed ones stay for
+    # inspection outside of the index
+    __table_args__ = (
+        Index(
+            "ix_outboundemail_next_attempt_at_pending",
+            "next_attempt_at",
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid7, primary_key=True)
+    email_to: str = Field(max_length=255)
+    subject: str = Field(max_length=255)
+    html_content: str
+    status: str = Field(default="pending", max_length=16)  # pending, failed
+    attempts: int = 0
+    # Pushed back while a worker sends it, and after a failed attempt. When
+    # the email was given up once it failed
+    next_attempt_at: datetime | None = Field(
+        default=None,
+        sa_column=Column(
+            DateTime(timezone=True), server_default=func.now(), nullable=False
+        ),
+    )
+    error: str | None = Field(default=None, max_length=255)
+    created_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), server_default=func.now())
+    )
+
+
+# Progress of the daily digest emails of a day on a shard, app/send_digests.py
+# resumes after the last user whose digest was queued
+class DigestRun(SQLModel, table=True):
+    __table_args__ = (
+        Index(
+            "ix_digestrun_day_shard",
+            "day",
+            "shard",
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid7, primary_key=True)
+    day: date
+    # None for the main database
+    shard: str | None = Field(default=None, max_length=64)
+    last_user_id: uuid.UUID | None = Field(default=None)
+    queued: int = 0
+    finished_at: datetime | None = Field(default=None)
+
+
 # Generic message
 class Message(SQLModel):
     message: str
@@ -188,3 +378,54 @@ class TokenPayload(SQLModel):
 class NewPassword(SQLModel):
     token: str
     new_password: str = Field(min_length=8, max_length=40)
+
+
+# One of the API requests of a batch, the path is relative to the API prefix,
+# e.g. /users/me?fields=email
+class BatchOperation(SQLModel):
+    method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"]
+    path: str = Field(max_length=2048)
+    headers: dict[str, str] = {}
+    body: Any | None = None
+
+
+class BatchRequest(SQLModel):
+    operations: list[BatchOperation] = Field(min_length=1, max_length=20)
+
+
+class BatchOperationResult(SQLModel):
+    status: int
+    headers: dict[str, str]
+    body: Any | None = None
+
+
+class BatchResponse(SQLModel):
+    results: list[BatchOperationResult]
+
+
+class ReadinessCheck(SQLModel):
+    ok: bool
+    duration_ms: float
+
+
+class ReadinessPublic(SQLModel):
+    ready: bool
+    checks: dict[str, ReadinessCheck]
+
+
+class RouteClassConcurrency(SQLModel):
+    in_flight: int
+    shed: int
+    latency_ms: float
+
+
+class RouteLatencyPublic(SQLModel):
+    latency_ms: float
+    baseline_latency_ms: float
+
+
+class ConcurrencyLimitPublic(SQLModel):
+    limit: float
+    in_flight: int
+    route_classes: dict[str, RouteClassConcurrency]
+    routes: dict[str, RouteLatencyPublic]
@@ -0,0 +1,275 @@
+"""
+Move a user's todos and tags to another shard, or back to the main database.
+
+    $ python app/rebalance_shard.py <user_id> <shard name or "primary">
+
+The data is bulk copied while the user keeps working, then the requests using
+their shard's session, see UserSessionDep, are answered with 503 for a short
+grace period while the rows changed during the copy are synced. User.shard is
+switched and the data left behind is deleted in batches.
+"""
+
+import argparse
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import (
+    Connection,
+    Select,
+    String,
+    Table,
+    delete,
+    func,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import ColumnElement
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.core.sharding import get_shard_engine, shard_session
+from app.models import Tag, Todo, TodoTag, User
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+user_table: Table = User.__table__  # type: ignore[attr-defined]
+todo_table: Table = Todo.__table__  # type: ignore[attr-defined]
+# In foreign key order, tags and todos before the links between them
+tables: list[Table] = [
+    Tag.__table__,  # type: ignore[attr-defined]
+    todo_table,
+    TodoTag.__table__,  # type: ignore[attr-defined]
+]
+
+
+def select_user_rows(table: Table, user_id: uuid.UUID, *columns: Any) -> Select[Any]:
+    statement = select(*columns) if columns else select(table)
+    if table is TodoTag.__table__:  # type: ignore[attr-defined]
+        return statement.join(todo_table, table.c.todo_id == todo_table.c.id).where(
+            todo_table.c.user_id == user_id
+        )
+    return statement.where(table.c.user_id == user_id)
+
+
+def copy_rows(
+    source: Connection,
+    target: Connection,
+    table: Table,
+    user_id: uuid.UUID,
+    *,
+    batch_size: int,
+    changed_since: datetime | None = None,
+) -> int:
+    """
+    Upsert the user's rows of `table` from source to target in primary key order.
+    """
+    key = list(table.primary_key.columns)
+    statement = select_user_rows(table, user_id).order_by(*key).limit(batch_size)
+    if changed_since is not None:
+        changed_at: ColumnElement[Any] = table.c.created_at
+        if "updated_at" in table.c:
+            changed_at = func.coalesce(table.c.updated_at, table.c.created_at)
+        statement = statement.where(changed_at >= changed_since)
+    copied = 0
+    last_key = None
+    while True:
+        batch = statement
+        if last_key is not None:
+            batch = batch.where(tuple_(*key) > tuple_(*last_key))
+        rows = source.execute(batch).mappings().all()
+        source.commit()
+        if not rows:
+            return copied
+        upsert = insert(table).values([dict(row) for row in rows])
+        upsert = upsert.on_conflict_do_update(
+            index_elements=key,
+            set_={
+                c.name: upsert.excluded[c.name] for c in table.c if not c.primary_key
+            },
+        )
+        target.execute(upsert)
+        target.commit()
+        copied += len(rows)
+        last_key = [rows[-1][c.name] for c in key]
+
+
+def delete_missing_rows(
+    source: Connection,
+    target: Connection,
+    table: Table,
+    user_id: uuid.UUID,
+    *,
+    batch_size: int,
+) -> int:
+    """
+    Delete the user's rows in target that were deleted in source during the copy.
+
+    The keys in target are read in primary key order, a batch at a time, and
+    looked up in source.
+    """
+    key = list(table.primary_key.columns)
+    statement = select_user_rows(table, user_id, *key).order_by(*key).limit(batch_size)
+    deleted = 0
+    last_key = None
+    while True:
+        batch = statement
+        if last_key is not None:
+            batch = batch.where(tuple_(*key) > tuple_(*last_key))
+        target_keys = [tuple(row) for row in target.execute(batch).all()]
+        if not target_keys:
+            target.commit()
+            return deleted
+        found = source.execute(select(*key).where(tuple_(*key).in_(target_keys)))
+        source_keys = {tuple(row) for row in found.all()}
+        source.commit()
+        missing = [row for row in target_keys if row not in source_keys]
+        if missing:
+            target.execute(delete(table).where(tuple_(*key).in_(missing)))
+        target.commit()
+        deleted += len(missing)
+        last_key = target_keys[-1]
+
+
+def copy_user_row(source: Connection, target: Connection, user_id: uuid.UUID) -> None:
+    """
+    Upsert the user row so the foreign keys on the target shard are satisfied.
+
+    The main database stays the source of truth for users, the copy has no
+    password and is only refreshed when the user moves again. The copies of
+    other users still holding the email or username, changed since they were
+    copied, get their id instead so they don't conflict with it.
+    """
+    row = (
+        source.execute(select(user_table).where(user_table.c.id == user_id))
+        .mappings()
+        .one()
+    )
+    source.commit()
+    stale_id = user_table.c.id.cast(String)
+    target.execute(
+        update(user_table)
+        .where(
+            user_table.c.id != user_id,
+            or_(
+                user_table.c.email == row["email"],
+                user_table.c.username == row["username"],
+            ),
+        )
+        .values(email=stale_id, username=stale_id)
+    )
+    values = {**row, "hashed_password": "", "shard": None, "shard_moving": False}
+    upsert = insert(user_table).values(values)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=["id"],
+        set_={c.name: upsert.excluded[c.name] for c in user_table.c if c.name != "id"},
+    )
+    target.execute(upsert)
+    target.commit()
+
+
+def rebalance(
+    *, user_id: uuid.UUID, shard: str | None, batch_size: int, grace_seconds: float
+) -> None:
+    with Session(engine, expire_on_commit=False) as session:
+        user = session.get(User, user_id)
+        if not user:
+            raise ValueError(f"User {user_id} not found")
+        source_shard = user.shard
+        if source_shard == shard:
+            logger.info("User %s is already on shard %s", user_id, shard)
+            return
+        with (
+            engine.connect() as primary,
+            get_shard_engine(source_shard).connect() as source,
+            get_shard_engine(shard).connect() as target,
+        ):
+            if shard is not None:
+                copy_user_row(primary, target, user_id)
+            # Rows written by transactions that started before the copy have an
+            # older updated_at, so look back a grace period when syncing
+            copy_started_at = source.execute(select(func.now())).scalar_one()
+            source.commit()
+            changed_since = copy_started_at - timedelta(seconds=grace_seconds)
+            for table in tables:
+                copied = copy_rows(
+                    source, target, table, user_id, batch_size=batch_size
+                )
+                logger.info("Copied %d rows of %s", copied, table.name)
+
+            user.shard_moving = True
+            session.add(user)
+            session.commit()
+            try:
+                # Let the requests that started before the flag was set finish
+                time.sleep(grace_seconds)
+                for table in tables:
+                    copied = copy_rows(
+                        source,
+                        target,
+                        table,
+                        user_id,
+                        batch_size=batch_size,
+                        changed_since=changed_since,
+                    )
+                    logger.info("Synced %d changed rows of %s", copied, table.name)
+                for table in reversed(tables):
+                    deleted = delete_missing_rows(
+                        source, target, table, user_id, batch_size=batch_size
+                    )
+                    logger.info("Deleted %d stale rows of %s", deleted, table.name)
+                user.shard = shard
+            finally:
+                user.shard_moving = False
+                session.add(user)
+                session.commit()
+        logger.info("User %s moved to shard %s", user_id, shard)
+
+    with shard_session(source_shard) as source_session:
+        for model in (Todo, Tag):
+            deleted = batch_size
+            while deleted == batch_size:
+                deleted = crud.delete_user_rows(
+                    session=source_session,
+                    model=model,
+                    user_id=user_id,
+                    limit=batch_size,
+                )
+        if source_shard is not None:
+            statement = delete(User).where(user_table.c.id == user_id)
+            source_session.exec(statement)  # type: ignore
+            source_session.commit()
+    logger.info("Deleted the data left on shard %s", source_shard)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("user_id", type=uuid.UUID)
+    parser.add_argument(
+        "shard",
+        choices=[*settings.SHARD_DATABASE_URIS, "primary"],
+        help='a shard name, or "primary" for the main database',
+    )
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--grace-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    shard = None if args.shard == "primary" else args.shard
+    rebalance(
+        user_id=args.user_id,
+        shard=shard,
+        batch_size=args.batch_size,
+        grace_seconds=args.grace_seconds,
+    )
+
+
+if __name__ == "__main__":
+    main()
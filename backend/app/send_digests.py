@@ -0,0 +1,147 @@
+"""
+Queue the daily digests of the users' open todos, overdue and due today.
+
+    $ python app/send_digests.py [--day 2026-10-19]
+
+Run it once a day, e.g. from cron. The digests of a batch of users are computed
+by one grouped query over the todos of each shard and queued in the database
+with the progress of the run, in one transaction, app/email_worker.py sends
+them over one SMTP connection per batch. A run that stopped resumes after the
+last batch queued, running it again once a day is finished queues nothing.
+"""
+
+import argparse
+import logging
+import uuid
+from datetime import date, datetime, time, timezone
+
+from sqlmodel import Session, col, select
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.core.sharding import all_shards, shard_session
+from app.models import OutboundEmail, User
+from app.utils import generate_digest_email
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_recipients(
+    *, session: Session, user_ids: list[uuid.UUID], shard: str | None
+) -> dict[uuid.UUID, str]:
+    """
+    The email of the active users among `user_ids` whose data is on the shard.
+
+    The todos left on the shard a user was moved away from aren't theirs
+    anymore.
+    """
+    shard_filter = (
+        col(User.shard).is_(None) if shard is None else col(User.shard) == shard
+    )
+    statement = select(User.id, User.email).where(
+        col(User.id).in_(user_ids), col(User.is_active), shard_filter
+    )
+    return dict(session.exec(statement).all())
+
+
+def queue_digests(
+    *,
+    session: Session,
+    data_session: Session,
+    shard: str | None,
+    day: date,
+    batch_size: int,
+    titles_limit: int,
+) -> int:
+    """
+    Queue the digests of `day` of the users whose data is on the shard, return
+    how many were queued by this call.
+
+    `data_session` is a session on the shard, the same database as `session`
+    for the main one.
+    """
+    assert settings.emails_enabled, "no provided configuration for email variables"
+    # Due dates are naive UTC datetimes
+    day_start = datetime.combine(day, time())
+    db_run = crud.get_digest_run(session=session, day=day, shard=shard)
+    queued = 0
+    while db_run.finished_at is None:
+        digests = crud.get_todo_digests(
+            session=data_session,
+            day_start=day_start,
+            after=db_run.last_user_id,
+            limit=batch_size,
+            titles_limit=titles_limit,
+        )
+        # Don't keep the snapshot of the shard while the emails are queued
+        data_session.commit()
+        if digests:
+            recipients = get_recipients(
+                session=session,
+                user_ids=[digest.user_id for digest in digests],
+                shard=shard,
+            )
+            emails = []
+            for digest in digests:
+                email_to = recipients.get(digest.user_id)
+                if email_to is None:
+                    continue
+                email_data = generate_digest_email(
+                    email_to=email_to,
+                    day=day,
+                    overdue=digest.overdue,
+                    overdue_titles=digest.overdue_titles or [],
+                    due_today=digest.due_today,
+                    due_today_titles=digest.due_today_titles or [],
+                )
+                emails.append(
+                    OutboundEmail(
+                        email_to=email_to,
+                        subject=email_data.subject,
+                        html_content=email_data.html_content,
+                    )
+                )
+            crud.save_digests(
+                session=session,
+                db_run=db_run,
+                emails=emails,
+                last_user_id=digests[-1].user_id,
+            )
+            queued += len(emails)
+        if len(digests) < batch_size:
+            crud.finish_digest_run(session=session, db_run=db_run)
+    return queued
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--day",
+        type=date.fromisoformat,
+        default=datetime.now(timezone.utc).date(),
+        help="the day of the digests, today in UTC by default",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--titles", type=int, default=10, help="todo titles listed per section"
+    )
+    args = parser.parse_args()
+
+    with Session(engine, expire_on_commit=False) as session:
+        for shard in all_shards():
+            with shard_session(shard) as data_session:
+                queued = queue_digests(
+                    session=session,
+                    data_session=data_session,
+                    shard=shard,
+                    day=args.day,
+                    batch_size=args.batch_size,
+                    titles_limit=args.titles,
+                )
+            logger.info("Queued %d digests of shard %s", queued, shard or "primary")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.query_stats import count_queries
+from app.tests.utils.user import create_random_user
+
+
+def test_batch(client: TestClient, normal_user_token_headers: dict[str, str]) -> None:
+    operations = [
+        {"method": "GET", "path": "/users/me"},
+        {"method": "GET", "path": "/utils/health-check/"},
+        {"method": "PATCH", "path": "/users/me", "body": {"full_name": "Batched"}},
+        {"method": "GET", "path": "/users/me?fields=full_name"},
+        {"method": "GET", "path": "/users/"},
+    ]
+    with count_queries() as stats:
+        r = client.post(
+            f"{settings.API_V1_STR}/batch/",
+            headers=normal_user_token_headers,
+            json={"operations": operations},
+        )
+    assert r.status_code == 200
+    me, health, updated, me_again, users = r.json()["results"]
+    assert me["status"] == 200
+    assert me["body"]["email"] == settings.EMAIL_TEST_USER
+    assert me["headers"]["etag"]
+    assert health == {
+        "status": 200,
+        "headers": {"content-type": "application/json"},
+        "body": True,
+    }
+    assert updated["status"] == 200
+    assert updated["body"]["full_name"] == "Batched"
+    assert me_again["body"]["full_name"] == "Batched"
+    assert users["status"] == 403
+    # The user is loaded once for the batch, then only the update runs
+    assert stats.count == 2
+
+
+def test_batch_invalid_path(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/batch/",
+        headers=normal_user_token_headers,
+        json={"operations": [{"method": "POST", "path": "/batch/"}]},
+    )
+    assert r.status_code == 400
+
+
+def test_batch_invalid_header(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    operation = {"method": "GET", "path": "/users/me", "headers": {"X-Mark": "✓"}}
+    r = client.post(
+        f"{settings.API_V1_STR}/batch/",
+        headers=normal_user_token_headers,
+        json={"operations": [operation]},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid batch operation header: X-Mark"
+
+
+def test_batch_write_after_failed_write(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    other_user = create_random_user(db)
+    operations = [
+        # The username isn't checked first, the unique index rejects it
+        {
+            "method": "PATCH",
+            "path": "/users/me",
+            "body": {"username": other_user.username},
+        },
+        {"method": "PATCH", "path": "/users/me", "body": {"full_name": "Batched"}},
+    ]
+    r = client.post(
+        f"{settings.API_V1_STR}/batch/",
+        headers=normal_user_token_headers,
+        json={"operations": operations},
+    )
+    assert r.status_code == 200
+    failed, updated = r.json()["results"]
+    assert failed["status"] == 500
+    assert updated["status"] == 200
+    assert updated["body"]["full_name"] == "Batched"
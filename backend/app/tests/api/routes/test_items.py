@@ -3,8 +3,12 @@ import uuid
 from fastapi.testclient import TestClient
 from sqlmodel import Session
 
+from app import crud
 from app.core.config import settings
+from app.models import UserCreate
 from app.tests.utils.item import create_random_item
+from app.tests.utils.user import user_authentication_headers
+from app.tests.utils.utils import random_email, random_lower_string
 
 
 def test_create_item(
@@ -79,6 +83,20 @@ def test_read_items(
     assert len(content["data"]) >= 2
 
 
+def test_read_items_while_user_data_is_moving(client: TestClient, db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, username=email, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    headers = user_authentication_headers(client=client, email=email, password=password)
+    user.shard_moving = True
+    db.add(user)
+    db.commit()
+    # Items stay in the main database, only todos and tags are moved
+    response = client.get(f"{settings.API_V1_STR}/items/", headers=headers)
+    assert response.status_code == 200
+
+
 def test_update_item(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
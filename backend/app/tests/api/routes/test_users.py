@@ -1,14 +1,34 @@
+import hashlib
 import uuid
+from typing import Any
 from unittest.mock import patch
 
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from sqlalchemy.exc import DataError
+from sqlmodel import Session, col, func, select
 
 from app import crud
 from app.core.config import settings
+from app.core.query_stats import count_queries
 from app.core.security import verify_password
-from app.models import User, UserCreate
-from app.tests.utils.utils import random_email, random_lower_string
+from app.core.sharding import shard_session
+from app.models import (
+    IdempotencyRecord,
+    OutboundEmail,
+    Tag,
+    Todo,
+    TodoTag,
+    User,
+    UserCreate,
+)
+from app.tests.utils.todo import create_random_todos
+from app.tests.utils.user import create_random_user, user_authentication_headers
+from app.tests.utils.utils import (
+    AssertMaxQueries,
+    random_email,
+    random_lower_string,
+)
 
 
 def test_get_users_superuser_me(
@@ -33,17 +53,51 @@ def test_get_users_normal_user_me(
     assert current_user["email"] == settings.EMAIL_TEST_USER
 
 
+def test_read_user_me_not_modified(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+    etag = r.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/me",
+        headers={**normal_user_token_headers, "If-None-Match": etag},
+    )
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    assert r.content == b""
+
+
+def test_read_users_not_modified(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    url = f"{settings.API_V1_STR}/users/"
+    etag = client.get(url, headers=superuser_token_headers).headers["ETag"]
+
+    with count_queries() as stats:
+        r = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    # The current user and the version of the list, no user page is loaded
+    assert stats.count == 2
+
+    create_random_user(db)
+    r = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+
+
 def test_create_user_new_email(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
     with (
-        patch("app.utils.send_email", return_value=None),
         patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
         patch("app.core.config.settings.SMTP_USER", "admin@example.com"),
+        patch("app.core.config.settings.EMAILS_FROM_EMAIL", "noreply@example.com"),
     ):
         username = random_email()
         password = random_lower_string()
-        data = {"email": username, "password": password}
+        data = {"email": username, "username": username, "password": password}
         r = client.post(
             f"{settings.API_V1_STR}/users/",
             headers=superuser_token_headers,
@@ -54,6 +108,33 @@ def test_create_user_new_email(
         user = crud.get_user_by_email(session=db, email=username)
         assert user
         assert user.email == created_user["email"]
+        # Sent by the email worker
+        queued = db.exec(
+            select(OutboundEmail).where(OutboundEmail.email_to == username)
+        ).one()
+        assert queued.status == "pending"
+        # A link to set the password, the password isn't stored in the queue
+        assert password not in queued.html_content
+        assert "/reset-password?token=" in queued.html_content
+
+
+def test_create_user_new_email_rolled_back_with_the_user(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    username = random_email()
+    data = {"email": username, "username": username, "password": "password"}
+    with (
+        patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
+        patch("app.core.config.settings.EMAILS_FROM_EMAIL", "noreply@example.com"),
+        # The subject is too long for its column, the email can't be inserted
+        patch("app.core.config.settings.PROJECT_NAME", "x" * 300),
+        pytest.raises(DataError),
+    ):
+        client.post(
+            f"{settings.API_V1_STR}/users/", headers=superuser_token_headers, json=data
+        )
+
+    assert crud.get_user_by_email(session=db, email=username) is None
 
 
 def test_get_existing_user(
@@ -166,6 +247,177 @@ def test_retrieve_users(
     assert "count" in all_users
     for item in all_users["data"]:
         assert "email" in item
+        assert "hashed_password" not in item
+
+
+def test_retrieve_users_fields(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"fields": "email,is_active"},
+    )
+    assert r.status_code == 200
+    for item in r.json()["data"]:
+        assert item.keys() == {"id", "email", "is_active"}
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"fields": "email,hashed_password"},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Unknown fields: hashed_password"
+
+
+def create_search_users(
+    db: Session, prefix: str, count: int, **values: Any
+) -> list[User]:
+    users = []
+    for n in range(count):
+        email = f"{prefix}{n}{random_lower_string()[:4]}@example.com"
+        user_in = UserCreate(email=email, username=email, password="changethis")
+        user = crud.create_user(session=db, user_create=user_in)
+        user.sqlmodel_update(values)
+        db.add(user)
+        db.commit()
+        users.append(user)
+    return users
+
+
+def search_all_pages(
+    client: TestClient, headers: dict[str, str], params: dict[str, Any]
+) -> list[dict[str, Any]]:
+    url = f"{settings.API_V1_STR}/users/search"
+    found: list[dict[str, Any]] = []
+    r = client.get(url, headers=headers, params=params)
+    while True:
+        assert r.status_code == 200
+        page = r.json()
+        found.extend(page["data"])
+        if page["next_cursor"] is None:
+            return found
+        params = {**params, "cursor": page["next_cursor"]}
+        r = client.get(url, headers=headers, params=params)
+
+
+def test_search_users_by_email_prefix(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    prefix = random_lower_string()[:8]
+    users = create_search_users(db, prefix, 5)
+    # The prefix is literal
+    create_search_users(db, prefix[:4] + "_" + prefix[5:], 1)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/search",
+        headers=superuser_token_headers,
+        params={"email_prefix": prefix, "limit": 2},
+    )
+    assert r.status_code == 200
+    page = r.json()
+    assert page["count"] == 5
+    assert page["count_is_estimate"] is False
+    assert len(page["data"]) == 2
+
+    found = search_all_pages(
+        client, superuser_token_headers, {"email_prefix": prefix, "limit": 2}
+    )
+    assert [user["email"] for user in found] == sorted(user.email for user in users)
+
+
+def test_search_users_filters(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    prefix = random_lower_string()[:8]
+    create_search_users(db, prefix, 2)
+    inactive = create_search_users(db, prefix, 2, is_active=False)
+    create_search_users(db, prefix, 1, is_active=False, is_verified=True)
+
+    found = search_all_pages(
+        client,
+        superuser_token_headers,
+        {
+            "username_prefix": prefix,
+            "is_active": False,
+            "is_verified": False,
+            "limit": 1,
+        },
+    )
+    assert sorted(user["id"] for user in found) == sorted(
+        str(user.id) for user in inactive
+    )
+
+
+def test_search_users_newest_first(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    users = create_search_users(db, random_lower_string()[:8], 3)
+    assert users[0].created_at
+
+    found = search_all_pages(
+        client,
+        superuser_token_headers,
+        {
+            "created_after": users[0].created_at.isoformat(),
+            "fields": "email",
+            "limit": 2,
+        },
+    )
+    ids = [user["id"] for user in found]
+    # Created in the same transaction, the ids are in creation order
+    assert ids == [str(user.id) for user in reversed(users)]
+    assert found[0].keys() == {"id", "email"}
+
+
+def test_search_users_estimated_count(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    prefix = random_lower_string()[:8]
+    create_search_users(db, prefix, 3)
+
+    with patch("app.core.config.settings.USER_SEARCH_EXACT_COUNT_LIMIT", 2):
+        r = client.get(
+            f"{settings.API_V1_STR}/users/search",
+            headers=superuser_token_headers,
+            params={"email_prefix": prefix},
+        )
+    assert r.status_code == 200
+    page = r.json()
+    assert page["count_is_estimate"] is True
+    assert page["count"] >= 3
+    assert len(page["data"]) == 3
+
+
+def test_search_users_invalid_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    url = f"{settings.API_V1_STR}/users/search"
+    r = client.get(url, headers=superuser_token_headers, params={"cursor": "x"})
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid cursor"
+
+    prefix = random_lower_string()[:8]
+    create_search_users(db, prefix, 2)
+    r = client.get(
+        url,
+        headers=superuser_token_headers,
+        params={"email_prefix": prefix, "limit": 1},
+    )
+    # The cursor of another sort
+    cursor = r.json()["next_cursor"]
+    r = client.get(url, headers=superuser_token_headers, params={"cursor": cursor})
+    assert r.status_code == 400
+
+
+def test_search_users_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/users/search", headers=normal_user_token_headers
+    )
+    assert r.status_code == 403
 
 
 def test_update_user_me(
@@ -304,6 +556,58 @@ def test_register_user(client: TestClient, db: Session) -> None:
     assert verify_password(password, user_db.hashed_password)
 
 
+def test_register_user_idempotency_key(client: TestClient, db: Session) -> None:
+    email = random_email()
+    data = {"email": email, "username": email, "password": random_lower_string()}
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    r = client.post(f"{settings.API_V1_STR}/users/signup", json=data, headers=headers)
+    assert r.status_code == 200
+
+    with count_queries() as stats:
+        retry = client.post(
+            f"{settings.API_V1_STR}/users/signup", json=data, headers=headers
+        )
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == r.json()
+    # The stored response is found with one lookup, the user isn't created again
+    assert stats.count == 1
+    users = db.exec(select(func.count()).select_from(User).where(User.email == email))
+    assert users.one() == 1
+
+    other = {**data, "full_name": "Other"}
+    r = client.post(f"{settings.API_V1_STR}/users/signup", json=other, headers=headers)
+    assert r.status_code == 422
+
+
+def test_register_user_idempotency_key_hides_password(
+    client: TestClient, db: Session
+) -> None:
+    email = random_email()
+    data = {"email": email, "username": email, "password": random_lower_string()}
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    with patch(
+        "app.crud.create_idempotency_record", side_effect=RuntimeError("no space")
+    ):
+        with pytest.raises(RuntimeError):
+            client.post(
+                f"{settings.API_V1_STR}/users/signup", json=data, headers=headers
+            )
+    # The user is committed with the stored response or not at all
+    assert crud.get_user_by_email(session=db, email=email) is None
+
+    r = client.post(f"{settings.API_V1_STR}/users/signup", json=data, headers=headers)
+    assert r.status_code == 200
+    record = db.exec(
+        select(IdempotencyRecord).where(
+            IdempotencyRecord.key == headers["Idempotency-Key"]
+        )
+    ).one()
+    body = r.request.content
+    plain = hashlib.sha256(b"POST\0/api/v1/users/signup\0" + body + b"\0").digest()
+    assert record.fingerprint != plain
+
+
 def test_register_user_already_exists_error(client: TestClient) -> None:
     password = random_lower_string()
     full_name = random_lower_string()
@@ -413,6 +717,47 @@ def test_delete_user_me(client: TestClient, db: Session) -> None:
     assert user_db is None
 
 
+def test_delete_user_me_on_shard(client: TestClient, db: Session, shard: str) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, username=email, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    user_id = user.id
+    headers = user_authentication_headers(client=client, email=email, password=password)
+    with shard_session(shard) as shard_db:
+        shard_db.add(User(id=user_id, email=email, username=email, hashed_password=""))
+        create_random_todos(shard_db, user_id=user_id, count=2)
+    user.shard = shard
+    db.add(user)
+    db.commit()
+
+    r = client.delete(f"{settings.API_V1_STR}/users/me", headers=headers)
+
+    assert r.status_code == 200
+    assert db.get(User, user_id) is None
+    with shard_session(shard) as shard_db:
+        assert shard_db.get(User, user_id) is None
+        assert not shard_db.exec(select(Todo).where(Todo.user_id == user_id)).all()
+
+
+def test_delete_user_me_while_data_is_moving(client: TestClient, db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, username=email, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    headers = user_authentication_headers(client=client, email=email, password=password)
+    user.shard_moving = True
+    db.add(user)
+    db.commit()
+
+    r = client.delete(f"{settings.API_V1_STR}/users/me", headers=headers)
+
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "5"
+    db.refresh(user)
+    assert user.id
+
+
 def test_delete_user_me_as_superuser(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -484,3 +829,146 @@ def test_delete_user_without_privileges(
     )
     assert r.status_code == 403
     assert r.json()["detail"] == "The user doesn't have enough privileges"
+
+
+def test_register_user_query_count(
+    client: TestClient, assert_max_queries: AssertMaxQueries
+) -> None:
+    data = {
+        "email": random_email(),
+        "username": random_lower_string(),
+        "password": random_lower_string(),
+    }
+    # Email lookup, then a single INSERT ... RETURNING
+    with assert_max_queries(2):
+        r = client.post(f"{settings.API_V1_STR}/users/signup", json=data)
+    assert r.status_code == 200
+
+
+def test_create_user_query_count(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    assert_max_queries: AssertMaxQueries,
+) -> None:
+    data = {
+        "email": random_email(),
+        "username": random_lower_string(),
+        "password": random_lower_string(),
+    }
+    # Current user, email lookup, then a single INSERT ... RETURNING
+    with assert_max_queries(3):
+        r = client.post(
+            f"{settings.API_V1_STR}/users/", headers=superuser_token_headers, json=data
+        )
+    assert r.status_code == 200
+
+
+def test_update_user_me_query_count(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    assert_max_queries: AssertMaxQueries,
+) -> None:
+    # Current user, then a single UPDATE ... RETURNING
+    with assert_max_queries(2):
+        r = client.patch(
+            f"{settings.API_V1_STR}/users/me",
+            headers=normal_user_token_headers,
+            json={"full_name": "Updated Name"},
+        )
+    assert r.status_code == 200
+    assert r.json()["full_name"] == "Updated Name"
+
+
+def test_update_user_query_count(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    assert_max_queries: AssertMaxQueries,
+) -> None:
+    user_in = UserCreate(
+        email=random_email(),
+        username=random_lower_string(),
+        password=random_lower_string(),
+    )
+    user = crud.create_user(session=db, user_create=user_in)
+    user_id = user.id
+    # Current user, user to update, then a single UPDATE ... RETURNING
+    with assert_max_queries(3):
+        r = client.patch(
+            f"{settings.API_V1_STR}/users/{user_id}",
+            headers=superuser_token_headers,
+            json={"full_name": "Updated Name"},
+        )
+    assert r.status_code == 200
+
+
+def test_delete_user_cascades_to_todos_and_tags(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user_in = UserCreate(
+        email=random_email(),
+        username=random_lower_string(),
+        password=random_lower_string(),
+    )
+    user = crud.create_user(session=db, user_create=user_in)
+    user_id = user.id
+    todos = create_random_todos(db, user_id=user_id, count=3, with_tag=True)
+    todo_ids = [todo.id for todo in todos]
+
+    r = client.delete(
+        f"{settings.API_V1_STR}/users/{user_id}", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    db.expire_all()
+    assert db.exec(select(Todo).where(Todo.user_id == user_id)).first() is None
+    assert db.exec(select(Tag).where(Tag.user_id == user_id)).first() is None
+    links = select(func.count()).select_from(TodoTag)
+    assert db.exec(links.where(col(TodoTag.todo_id).in_(todo_ids))).one() == 0
+
+
+def test_user_deletion_job(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user_in = UserCreate(
+        email=random_email(),
+        username=random_lower_string(),
+        password=random_lower_string(),
+    )
+    user = crud.create_user(session=db, user_create=user_in)
+    user_id = user.id
+    create_random_todos(db, user_id=user_id, count=7, with_tag=True)
+
+    with patch("app.core.config.settings.USER_DELETION_BATCH_SIZE", 3):
+        r = client.post(
+            f"{settings.API_V1_STR}/users/{user_id}/deletion-job",
+            headers=superuser_token_headers,
+        )
+    assert r.status_code == 202
+    job = r.json()
+    assert job["total_todos"] == 7
+    assert job["total_tags"] == 1
+
+    # The test client runs background tasks before returning the response
+    r = client.get(
+        f"{settings.API_V1_STR}/users/deletion-jobs/{job['id']}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    job = r.json()
+    assert job["status"] == "finished"
+    assert job["deleted_todos"] == 7
+    assert job["deleted_tags"] == 1
+    assert job["finished_at"]
+    db.expire_all()
+    assert db.get(User, user_id) is None
+
+
+def test_user_deletion_job_not_found(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/users/deletion-jobs/{uuid.uuid4()}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Deletion job not found"
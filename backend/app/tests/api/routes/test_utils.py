@@ -0,0 +1,41 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_read_concurrency_limit(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    client.get(f"{settings.API_V1_STR}/utils/health-check/")
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/concurrency-limit/",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert settings.CONCURRENCY_LIMIT_MIN <= content["limit"]
+    assert content["limit"] <= settings.CONCURRENCY_LIMIT_MAX
+    # The request reading the limit is in flight
+    assert content["in_flight"] == 1
+    assert content["route_classes"]["critical"]["latency_ms"] > 0
+    assert set(content["route_classes"]) == {"critical", "default", "expensive"}
+    assert all(route["baseline_latency_ms"] > 0 for route in content["routes"].values())
+
+
+def test_read_concurrency_limit_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/concurrency-limit/",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 403
+
+
+def test_readiness(client: TestClient) -> None:
+    r = client.get(f"{settings.API_V1_STR}/utils/ready/")
+    assert r.status_code == 200
+    content = r.json()
+    assert content["ready"]
+    assert content["checks"]["database"]["ok"]
+    assert content["checks"]["smtp"]["ok"]
@@ -1,27 +1,105 @@
 from collections.abc import Generator
+from contextlib import contextmanager
+from unittest.mock import patch
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, delete
+from sqlalchemy import Connection
+from sqlmodel import Session
 
-from app.core.config import settings
-from app.core.db import engine, init_db
-from app.main import app
-from app.models import Item, User
-from app.tests.utils.user import authentication_token_from_email
-from app.tests.utils.utils import get_superuser_token_headers
+from app.tests.utils.database import (
+    create_shard_database,
+    create_worker_database,
+    drop_database,
+    use_worker_database,
+)
+
+# Every pytest-xdist worker gets its own database, this must run before the
+# app engine is created
+use_worker_database()
+
+from app.api.deps import get_db  # noqa: E402
+from app.core import query_stats, sharding  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.db import engine  # noqa: E402
+from app.core.query_stats import QueryStats, count_queries  # noqa: E402
+from app.main import app  # noqa: E402
+from app.tests.utils.user import authentication_token_from_email  # noqa: E402
+from app.tests.utils.utils import (  # noqa: E402
+    AssertMaxQueries,
+    get_superuser_token_headers,
+)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def connection() -> Generator[Connection, None, None]:
+    create_worker_database()
+    with engine.connect() as connection:
+        yield connection
+    engine.dispose()
 
 
 @pytest.fixture(scope="session", autouse=True)
-def db() -> Generator[Session, None, None]:
-    with Session(engine) as session:
-        init_db(session)
+def ignore_savepoints() -> Generator[None, None, None]:
+    # The requests run in SAVEPOINTs of the test transaction, the statement
+    # counts are those of the code under test
+    with patch.object(
+        query_stats,
+        "ignored_statements",
+        ("SAVEPOINT ", "RELEASE SAVEPOINT ", "ROLLBACK TO SAVEPOINT "),
+    ):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def db(connection: Connection) -> Generator[Session, None, None]:
+    """
+    Run each test in a transaction rolled back at the end.
+
+    The test and the requests it makes use sessions on the same connection,
+    their commits only release a SAVEPOINT inside the test transaction. So do
+    the background user deletion jobs, which open their session on the engine.
+    """
+    transaction = connection.begin()
+    # Sessions joining the connection in a SAVEPOINT create their own
+    connection.begin_nested()
+
+    def get_test_db() -> Generator[Session, None, None]:
+        with Session(
+            connection, join_transaction_mode="create_savepoint", expire_on_commit=False
+        ) as session:
+            yield session
+
+    app.dependency_overrides[get_db] = get_test_db
+    with (
+        patch("app.api.routes.users.engine", connection),
+        Session(connection, join_transaction_mode="create_savepoint") as session,
+    ):
         yield session
-        statement = delete(Item)
-        session.execute(statement)
-        statement = delete(User)
-        session.execute(statement)
-        session.commit()
+    del app.dependency_overrides[get_db]
+    transaction.rollback()
+
+
+@pytest.fixture(scope="session")
+def shard_database() -> Generator[str, None, None]:
+    url = create_shard_database("shard1")
+    yield url.render_as_string(hide_password=False)
+    drop_database(url)
+
+
+@pytest.fixture
+def shard(shard_database: str) -> Generator[str, None, None]:
+    """
+    Name of a shard database, empty but for the seeded superuser.
+
+    Unlike the main database, what the test commits there is kept until the end
+    of the session.
+    """
+    with patch.dict(settings.SHARD_DATABASE_URIS, {"shard1": shard_database}):
+        yield "shard1"
+    for shard_engine in sharding._shard_engines.values():
+        shard_engine.dispose()
+    sharding._shard_engines.clear()
 
 
 @pytest.fixture(scope="module")
@@ -35,8 +113,29 @@ def superuser_token_headers(client: TestClient) -> dict[str, str]:
     return get_superuser_token_headers(client)
 
 
-@pytest.fixture(scope="module")
+@pytest.fixture
 def normal_user_token_headers(client: TestClient, db: Session) -> dict[str, str]:
     return authentication_token_from_email(
         client=client, email=settings.EMAIL_TEST_USER, db=db
     )
+
+
+@pytest.fixture
+def assert_max_queries() -> AssertMaxQueries:
+    """
+    Fail when the block runs more than `limit` statements, e.g.:
+
+        with assert_max_queries(3):
+            client.get(...)
+    """
+
+    @contextmanager
+    def check(limit: int) -> Generator[QueryStats, None, None]:
+        with count_queries() as stats:
+            yield stats
+        assert stats.count <= limit, (
+            f"Expected at most {limit} queries, got {stats.count}:\n"
+            + "\n".join(stats.statements)
+        )
+
+    return check
@@ -0,0 +1,93 @@
+import zlib
+from collections.abc import AsyncIterator
+
+import pytest
+import zstandard
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.compression import CompressionMiddleware, negotiate_encoding
+
+BODY = b"todo " * 1000
+
+
+def make_middleware(endpoint: ASGIApp) -> CompressionMiddleware:
+    return CompressionMiddleware(
+        endpoint, minimum_size=500, zstd_level=3, brotli_quality=4, gzip_level=6
+    )
+
+
+def make_client(endpoint: ASGIApp) -> TestClient:
+    # Without the context manager, the endpoint doesn't handle lifespan events
+    return TestClient(make_middleware(endpoint))
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "expected"),
+    [
+        ("gzip, deflate, br, zstd", "zstd"),
+        ("gzip, br", "br"),
+        ("gzip;q=1.0, br;q=0.5", "gzip"),
+        ("br;q=0, *", "zstd"),
+        ("zstd;q=0, br;q=0, *;q=0.1", "gzip"),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_negotiate_encoding(accept_encoding: str, expected: str | None) -> None:
+    assert negotiate_encoding(accept_encoding, ["zstd", "br", "gzip"]) == expected
+
+
+@pytest.mark.parametrize("encoding", ["zstd", "br", "gzip"])
+def test_compress_response(encoding: str) -> None:
+    client = make_client(PlainTextResponse(BODY))
+    r = client.get("/", headers={"Accept-Encoding": encoding})
+    assert r.headers["Content-Encoding"] == encoding
+    assert r.headers["Vary"] == "Accept-Encoding"
+    assert int(r.headers["Content-Length"]) < len(BODY) / 10
+    assert r.content == BODY
+
+
+def test_small_response_not_compressed() -> None:
+    client = make_client(PlainTextResponse(b"todo"))
+    r = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in r.headers
+    assert r.content == b"todo"
+
+
+def test_encoded_response_not_compressed_again() -> None:
+    compressed = zlib.compress(BODY)
+    client = make_client(
+        PlainTextResponse(compressed, headers={"Content-Encoding": "deflate"})
+    )
+    r = client.get("/", headers={"Accept-Encoding": "deflate, gzip"})
+    assert r.headers["Content-Encoding"] == "deflate"
+    assert r.content == BODY
+
+
+def test_streamed_response_compressed_by_chunk() -> None:
+    chunks = [b"first chunk\n" * 10, b"second chunk\n" * 10]
+
+    async def stream() -> AsyncIterator[bytes]:
+        for chunk in chunks:
+            yield chunk
+
+    middleware = make_middleware(StreamingResponse(stream()))
+    sent: list[bytes] = []
+
+    async def record_chunks(scope: Scope, receive: Receive, send: Send) -> None:
+        async def send_and_record(message: Message) -> None:
+            if message["type"] == "http.response.body":
+                sent.append(message["body"])
+            await send(message)
+
+        await middleware(scope, receive, send_and_record)
+
+    r = TestClient(record_chunks).get("/", headers={"Accept-Encoding": "zstd"})
+    assert r.headers["Content-Encoding"] == "zstd"
+    assert "Content-Length" not in r.headers
+    assert r.content == b"".join(chunks)
+    # Each chunk can be decoded as soon as it's received
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    assert decompressor.decompress(sent[0]) == chunks[0]
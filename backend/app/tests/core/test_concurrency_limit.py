@@ -0,0 +1,129 @@
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse
+
+from app.core.concurrency_limit import (
+    AdaptiveConcurrencyLimit,
+    ConcurrencyLimitMiddleware,
+)
+
+
+def make_limit(initial_limit: int = 10) -> AdaptiveConcurrencyLimit:
+    return AdaptiveConcurrencyLimit(
+        initial_limit=initial_limit, min_limit=2, max_limit=20, latency_tolerance=2.0
+    )
+
+
+def make_client(limit: AdaptiveConcurrencyLimit) -> TestClient:
+    middleware = ConcurrencyLimitMiddleware(
+        PlainTextResponse("ok"),
+        limit=limit,
+        critical_paths={"/health"},
+        expensive_paths={"/login"},
+    )
+    return TestClient(middleware)
+
+
+def test_expensive_requests_shed_first() -> None:
+    limit = make_limit(initial_limit=4)
+    assert limit.try_acquire("expensive")
+    assert limit.try_acquire("expensive")
+    assert not limit.try_acquire("expensive")
+    assert limit.try_acquire("default")
+    assert limit.try_acquire("default")
+    assert not limit.try_acquire("default")
+    assert limit.try_acquire("critical")
+    assert limit.in_flight == 5
+    assert limit.route_classes["expensive"].shed == 1
+    assert limit.route_classes["default"].shed == 1
+    assert limit.route_classes["critical"].shed == 0
+
+
+def request(
+    limit: AdaptiveConcurrencyLimit, latency: float, route: str = "read_users"
+) -> None:
+    limit.try_acquire("default")
+    limit.release("default", route, latency)
+
+
+def test_limit_increases_while_latency_is_usual() -> None:
+    limit = make_limit(initial_limit=4)
+    for _ in range(20):
+        for _ in range(3):
+            limit.try_acquire("default")
+        for _ in range(3):
+            limit.release("default", "read_users", 0.01)
+    assert 5 < limit.limit < 20
+
+
+def test_limit_decreases_on_high_latency() -> None:
+    limit = make_limit()
+    for _ in range(10):
+        request(limit, 0.01)
+    assert limit.limit == 10
+    # A single slow request is smoothed over
+    request(limit, 0.1)
+    assert limit.limit == 10
+    for _ in range(5):
+        request(limit, 0.1)
+    # Only once for the requests slowed down by the same burst
+    assert limit.limit == 9
+
+
+def test_limit_kept_with_routes_of_different_latencies() -> None:
+    limit = make_limit(initial_limit=10)
+    for n in range(500):
+        for _ in range(8):
+            limit.try_acquire("default")
+        for i in range(8):
+            route = "read_users" if i % 2 else "read_todos"
+            limit.release("default", route, 0.003 if i % 2 else 0.03)
+        # A route whose requests take different times, e.g. by their page size
+        request(limit, 0.003 if n % 2 else 0.03, route="search_users")
+    assert limit.limit >= 10
+
+
+def test_usual_latency_follows_a_lasting_change() -> None:
+    limit = make_limit()
+    for _ in range(10):
+        request(limit, 0.01)
+    for _ in range(500):
+        request(limit, 0.05)
+    route_latency = limit.routes["read_users"]
+    assert route_latency.baseline > 0.04
+    assert route_latency.latency < route_latency.baseline * limit.latency_tolerance
+
+
+def test_limit_stays_within_bounds() -> None:
+    limit = make_limit()
+    for _ in range(10):
+        request(limit, 0.01)
+    limit.limit = limit.min_limit
+    for _ in range(5):
+        request(limit, 1.0)
+    assert limit.limit == limit.min_limit
+
+
+def test_critical_requests_do_not_change_the_limit() -> None:
+    limit = make_limit()
+    for latency in [0.01] * 10 + [1.0] * 5:
+        limit.try_acquire("critical")
+        limit.release("critical", "health_check", latency)
+    assert limit.limit == 10
+    assert limit.routes == {}
+
+
+def test_shed_requests_answered_with_503() -> None:
+    limit = make_limit(initial_limit=2)
+    client = make_client(limit)
+    assert client.get("/").status_code == 200
+    assert limit.in_flight == 0
+    limit.try_acquire("default")
+    limit.try_acquire("default")
+    r = client.get("/login")
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+    assert r.json() == {"detail": "The server is overloaded, please retry"}
+    assert client.get("/").status_code == 503
+    assert client.get("/health").status_code == 200
+    assert limit.route_classes["expensive"].shed == 1
+    assert limit.route_classes["default"].shed == 1
@@ -0,0 +1,44 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from app.core.cpu import available_cpus, cgroup_cpu_quota
+
+
+def write(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+@pytest.mark.parametrize(
+    ("files", "expected"),
+    [
+        ({"cpu.max": "150000 100000\n"}, 1.5),
+        ({"cpu.max": "max 100000\n"}, None),
+        ({"cpu/cpu.cfs_quota_us": "200000", "cpu/cpu.cfs_period_us": "100000"}, 2.0),
+        (
+            {
+                "cpu,cpuacct/cpu.cfs_quota_us": "-1",
+                "cpu,cpuacct/cpu.cfs_period_us": "100000",
+            },
+            None,
+        ),
+        ({}, None),
+    ],
+)
+def test_cgroup_cpu_quota(
+    tmp_path: Path, files: dict[str, str], expected: float | None
+) -> None:
+    for name, content in files.items():
+        write(tmp_path / name, content)
+    assert cgroup_cpu_quota(tmp_path) == expected
+
+
+def test_available_cpus(tmp_path: Path) -> None:
+    affinity = len(os.sched_getaffinity(0))
+    assert available_cpus(tmp_path) == affinity
+    write(tmp_path / "cpu.max", "50000 100000")
+    assert available_cpus(tmp_path) == 1
+    write(tmp_path / "cpu.max", f"{affinity * 100000 + 1} 100000")
+    assert available_cpus(tmp_path) == affinity
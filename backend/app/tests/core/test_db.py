@@ -0,0 +1,84 @@
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pydantic_core import MultiHostUrl
+from sqlalchemy import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, create_engine, select
+
+from app.core.config import settings
+from app.core.db import get_engine_options
+from app.models import User
+
+# Port published by the pgbouncer service in docker-compose.override.yml
+PGBOUNCER_PORT = 6432
+
+
+def pgbouncer_url() -> str:
+    return str(
+        MultiHostUrl.build(
+            scheme="postgresql+psycopg",
+            username=settings.POSTGRES_USER,
+            password=settings.POSTGRES_PASSWORD,
+            host=settings.POSTGRES_SERVER,
+            port=PGBOUNCER_PORT,
+            path=settings.POSTGRES_DB,
+        )
+    )
+
+
+@pytest.fixture(scope="module", params=[0, 2], ids=["null-pool", "client-pool"])
+def pgbouncer_engine(request: pytest.FixtureRequest) -> Generator[Engine, None, None]:
+    engine = create_engine(
+        pgbouncer_url(),
+        **get_engine_options(
+            pgbouncer_transaction_pooling=True, client_pool_size=request.param
+        ),
+    )
+    try:
+        with engine.connect():
+            pass
+    except OperationalError:
+        pytest.skip(f"PgBouncer is not listening on port {PGBOUNCER_PORT}")
+    yield engine
+    engine.dispose()
+
+
+def test_engine_options_default() -> None:
+    assert get_engine_options(pgbouncer_transaction_pooling=False) == {}
+
+
+def test_engine_options_transaction_pooling() -> None:
+    options = get_engine_options(pgbouncer_transaction_pooling=True)
+    assert options["connect_args"] == {"prepare_threshold": None}
+    assert options["poolclass"] is NullPool
+
+
+def test_engine_options_transaction_pooling_client_pool() -> None:
+    options = get_engine_options(pgbouncer_transaction_pooling=True, client_pool_size=3)
+    assert options["connect_args"] == {"prepare_threshold": None}
+    assert options["pool_size"] == 3
+    assert options["max_overflow"] == 0
+    assert "poolclass" not in options
+
+
+def test_pgbouncer_repeated_statements(pgbouncer_engine: Engine) -> None:
+    # psycopg prepares a statement server-side once it ran 5 times on the same
+    # connection, running it more often than that must keep working
+    for _ in range(20):
+        with Session(pgbouncer_engine) as session:
+            statement = select(User).where(User.email == settings.FIRST_SUPERUSER)
+            user = session.exec(statement).first()
+            assert user
+
+
+def test_pgbouncer_concurrent_transactions(pgbouncer_engine: Engine) -> None:
+    def count_users() -> int:
+        with Session(pgbouncer_engine) as session:
+            return len(session.exec(select(User.id).limit(10)).all())
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: count_users(), range(64)))
+    assert all(result > 0 for result in results)
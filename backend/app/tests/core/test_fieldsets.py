@@ -0,0 +1,22 @@
+import pytest
+
+from app.core.fieldsets import fieldset_model, parse_fields
+from app.models import UserPublic
+
+
+def test_parse_fields() -> None:
+    assert parse_fields(UserPublic, None) == tuple(UserPublic.model_fields)
+    assert parse_fields(UserPublic, " full_name,email ,") == (
+        "email",
+        "full_name",
+        "id",
+    )
+    with pytest.raises(ValueError, match="Unknown fields: password"):
+        parse_fields(UserPublic, "email,password")
+
+
+def test_fieldset_model() -> None:
+    model = fieldset_model(UserPublic, ("email", "id"))
+    assert list(model.model_fields) == ["email", "id"]
+    assert fieldset_model(UserPublic, ("email", "id")) is model
+    assert fieldset_model(UserPublic, tuple(UserPublic.model_fields)) is UserPublic
@@ -0,0 +1,23 @@
+import time
+
+from app.core.ids import uuid7
+
+
+def test_uuid7_version_and_variant() -> None:
+    value = uuid7()
+    assert value.version == 7
+    assert value.variant == "specified in RFC 4122"
+
+
+def test_uuid7_timestamp() -> None:
+    before = time.time_ns() // 1_000_000
+    value = uuid7()
+    after = time.time_ns() // 1_000_000
+    # The counter may borrow a few milliseconds when many ids were generated
+    assert before <= value.int >> 80 <= after + 10
+
+
+def test_uuid7_monotonic() -> None:
+    values = [uuid7() for _ in range(10_000)]
+    assert values == sorted(values)
+    assert len(set(values)) == len(values)
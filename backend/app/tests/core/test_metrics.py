@@ -0,0 +1,37 @@
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.core.config import settings
+from app.core.security import get_password_hash
+
+
+def sample(name: str, labels: dict[str, str]) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_request_metrics(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    labels = {"route": "users-read_user_me"}
+    count = sample("http_request_duration_seconds_count", labels)
+    ok = sample("http_requests_total", {**labels, "status": "200"})
+    client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+    client.get(f"{settings.API_V1_STR}/not-a-route")
+    assert sample("http_request_duration_seconds_count", labels) == count + 1
+    assert sample("http_requests_total", {**labels, "status": "200"}) == ok + 1
+    assert sample("http_requests_total", {"route": "unmatched", "status": "404"})
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{route="users-read_user_me"}' in r.text
+    assert "http_requests_in_flight 1.0" in r.text
+    assert 'db_pool_connections{database="primary"}' in r.text
+    assert "http_concurrency_limit" in r.text
+
+
+def test_password_hash_metrics() -> None:
+    labels = {"operation": "hash"}
+    count = sample("password_hash_duration_seconds_count", labels)
+    get_password_hash("password")
+    assert sample("password_hash_duration_seconds_count", labels) == count + 1
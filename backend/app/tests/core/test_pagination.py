@@ -0,0 +1,25 @@
+import uuid
+from datetime import datetime, timezone
+from typing import Literal
+
+import pytest
+
+from app.core.pagination import decode_cursor, encode_cursor
+
+CreatedCursor = tuple[Literal["created"], datetime, uuid.UUID]
+
+
+def test_cursor_round_trip() -> None:
+    key = ("created", datetime.now(timezone.utc), uuid.uuid4())
+    cursor = encode_cursor(key)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, CreatedCursor) == key
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    ["", "not base64!", encode_cursor(("email", "user@example.com"))],
+)
+def test_invalid_cursor(cursor: str) -> None:
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor, CreatedCursor)
@@ -0,0 +1,85 @@
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import Session, select
+from starlette.types import Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.query_stats import QueryStats, QueryStatsMiddleware, count_queries
+from app.models import User
+from app.tests.utils.utils import AssertMaxQueries
+
+
+def test_query_stats_repeated_statements() -> None:
+    stats = QueryStats()
+    for _ in range(3):
+        stats.record("SELECT tag.id FROM tag WHERE tag.id = %(id)s", 0.001)
+    stats.record("SELECT todo.id FROM todo", 0.002)
+    assert stats.count == 4
+    assert stats.repeated_statements(2) == [
+        ("SELECT tag.id FROM tag WHERE tag.id = %(id)s", 3)
+    ]
+    assert stats.repeated_statements(3) == []
+
+
+def test_query_stats_server_timing() -> None:
+    stats = QueryStats()
+    stats.record("SELECT 1", 0.0125)
+    assert stats.server_timing() == 'db;desc="1 queries";dur=12.50'
+
+
+def test_count_queries(db: Session) -> None:
+    with count_queries() as stats:
+        db.exec(select(User).limit(1)).all()
+        db.exec(select(User).limit(1)).all()
+    assert stats.count == 2
+    assert stats.repeated_statements(1)
+
+
+def test_count_queries_after_failed_statement() -> None:
+    with engine.connect() as conn:
+        with pytest.raises(DBAPIError):
+            conn.exec_driver_sql("SELECT 1 / 0")
+        conn.rollback()
+        with count_queries() as stats:
+            conn.exec_driver_sql("SELECT 1")
+        # The failed statement left no start time to pair with a later one
+        assert isinstance(conn.info["query_start_time"], float)
+    assert stats.count == 1
+
+
+def test_server_timing_header(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert r.headers["Server-Timing"].startswith('db;desc="1 queries";dur=')
+
+
+def test_repeated_statements_warning(caplog: pytest.LogCaptureFixture) -> None:
+    async def endpoint(_scope: Scope, _receive: Receive, send: Send) -> None:
+        with Session(engine) as session:
+            for _ in range(3):
+                session.exec(select(User).limit(1)).all()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = QueryStatsMiddleware(endpoint, server_timing=True, repeat_threshold=2)
+    # Without the context manager, the endpoint doesn't handle lifespan events
+    with caplog.at_level(logging.WARNING):
+        r = TestClient(middleware).get("/todos/")
+    assert 'db;desc="3 queries"' in r.headers["Server-Timing"]
+    assert "Possible N+1 query in GET /todos/" in caplog.text
+
+
+def test_assert_max_queries(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    assert_max_queries: AssertMaxQueries,
+) -> None:
+    with assert_max_queries(3):
+        r = client.get(f"{settings.API_V1_STR}/users/", headers=superuser_token_headers)
+    assert r.status_code == 200
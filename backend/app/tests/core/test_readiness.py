@@ -0,0 +1,51 @@
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
+
+from app.core.readiness import ReadinessProbe, check_database, migration_heads
+
+
+def test_check_database() -> None:
+    check_database(None)
+    assert len(migration_heads()) == 1
+
+
+def test_check_database_times_out(db: Session) -> None:
+    # The check's query waits for the lock until its statement timeout
+    db.exec(text("LOCK TABLE alembic_version IN ACCESS EXCLUSIVE MODE"))  # type: ignore
+    start = time.perf_counter()
+    with (
+        patch("app.core.config.settings.READINESS_CHECK_TIMEOUT_SECONDS", 0.2),
+        pytest.raises(OperationalError, match="statement timeout"),
+    ):
+        check_database(None)
+    assert time.perf_counter() - start < 2
+
+
+def test_readiness_probe_failed_check(caplog: pytest.LogCaptureFixture) -> None:
+    failing = MagicMock(side_effect=ConnectionRefusedError("Connection refused"))
+    probe = ReadinessProbe(
+        {"database": lambda: None, "smtp": failing, "queue": lambda: None},
+        ttl=60,
+    )
+    result = probe.check()
+    assert not result.ready
+    assert result.checks["database"].ok
+    assert result.checks["queue"].ok
+    assert not result.checks["smtp"].ok
+    # Only logged, the probe is public
+    assert "detail" not in result.model_dump_json()
+    assert "smtp failed: ConnectionRefusedError: Connection refused" in caplog.text
+
+
+@pytest.mark.parametrize(("ttl", "runs"), [(60, 1), (0, 3)])
+def test_readiness_probe_cached(ttl: float, runs: int) -> None:
+    check = MagicMock(return_value=None)
+    probe = ReadinessProbe({"database": check}, ttl=ttl)
+    for _ in range(3):
+        assert probe.check().ready
+    assert check.call_count == runs
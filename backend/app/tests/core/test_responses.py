@@ -0,0 +1,37 @@
+from app.core.responses import (
+    PydanticJSONResponse,
+    construct_public,
+    etag_matches,
+    weak_etag,
+)
+from app.models import User, UserPublic
+
+
+def test_construct_public_copies_only_public_fields() -> None:
+    user = User(email="user@example.com", username="user", hashed_password="hash")
+    (public,) = construct_public(UserPublic, [user])
+    assert isinstance(public, UserPublic)
+    assert public.model_dump() == {
+        "email": "user@example.com",
+        "username": "user",
+        "is_active": True,
+        "is_superuser": False,
+        "is_verified": False,
+        "full_name": None,
+        "id": user.id,
+    }
+
+
+def test_pydantic_json_response_encodes_nan_as_null() -> None:
+    response = PydanticJSONResponse({"value": float("nan"), "id": 1})
+    assert response.body == b'{"value":null,"id":1}'
+
+
+def test_etag_matches() -> None:
+    etag = weak_etag("2026-10-19T10:00:00", 3)
+    assert etag != weak_etag("2026-10-19T10:00:00", 4)
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", {etag.removeprefix("W/")}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('W/"other"', etag)
+    assert not etag_matches(None, etag)
@@ -0,0 +1,48 @@
+import pytest
+from pydantic import ValidationError
+
+from app.core.config import Settings
+from app.core.security import create_pwd_context, get_password_hash, verify_password
+
+
+def make_settings(**values: str) -> Settings:
+    return Settings(
+        _env_file=None,  # type: ignore[call-arg]
+        PROJECT_NAME="test",
+        POSTGRES_SERVER="localhost",
+        POSTGRES_USER="postgres",
+        POSTGRES_PASSWORD="postgres-password",
+        SECRET_KEY="secret-key",
+        FIRST_SUPERUSER="admin@example.com",
+        FIRST_SUPERUSER_PASSWORD="superuser-password",
+        **values,  # type: ignore[arg-type]
+    )
+
+
+def test_password_hash_profile_defaults() -> None:
+    local = make_settings(ENVIRONMENT="local")
+    production = make_settings(ENVIRONMENT="production")
+    assert local.PASSWORD_HASH_PROFILE == "fast"
+    assert production.PASSWORD_HASH_PROFILE == "secure"
+
+
+@pytest.mark.parametrize("environment", ["staging", "production"])
+def test_fast_password_hash_profile_refused_in_deployments(environment: str) -> None:
+    with pytest.raises(ValidationError, match="PASSWORD_HASH_PROFILE"):
+        make_settings(ENVIRONMENT=environment, PASSWORD_HASH_PROFILE="fast")
+    with pytest.raises(RuntimeError):
+        create_pwd_context(profile="fast", environment=environment)
+
+
+def test_fast_hash_verifies_with_secure_profile() -> None:
+    fast_hash = create_pwd_context(profile="fast", environment="local").hash("pw")
+    assert fast_hash.startswith("$2b$04$")
+    assert create_pwd_context(profile="secure", environment="production").verify(
+        "pw", fast_hash
+    )
+
+
+def test_get_password_hash() -> None:
+    hashed = get_password_hash("password")
+    assert verify_password("password", hashed)
+    assert not verify_password("other-password", hashed)
@@ -0,0 +1,82 @@
+import json
+from pathlib import Path
+
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.slow_query import SlowQueryLog
+from app.models import User
+
+
+def read_entries(log_file: Path) -> list[dict]:  # type: ignore[type-arg]
+    return [json.loads(line) for line in log_file.read_text().splitlines()]
+
+
+def test_slow_query_log_captures_plan(tmp_path: Path) -> None:
+    log_file = tmp_path / "slow_queries.jsonl"
+    slow_query_log = SlowQueryLog(
+        engine,
+        threshold_ms=0,
+        sample_rate=1,
+        explain_interval=60,
+        log_file=str(log_file),
+    )
+    slow_query_log.install()
+    try:
+        with Session(engine) as session:
+            statement = select(User).where(User.email == settings.FIRST_SUPERUSER)
+            session.exec(statement).first()
+            session.exec(statement).first()
+        slow_query_log._explain_queue.join()
+    finally:
+        slow_query_log.uninstall()
+
+    entries = [
+        entry for entry in read_entries(log_file) if 'FROM "user"' in entry["statement"]
+    ]
+    assert len(entries) == 2
+    # The bound email is used for the plan but never written to the log
+    assert settings.FIRST_SUPERUSER not in log_file.read_text()
+    # Only the first run is explained, the second one is rate limited
+    plans = [entry["plan"] for entry in entries if entry["plan"] is not None]
+    assert len(plans) == 1
+    assert plans[0][0]["Plan"]["Node Type"]
+
+
+def test_slow_query_log_threshold(tmp_path: Path) -> None:
+    log_file = tmp_path / "slow_queries.jsonl"
+    slow_query_log = SlowQueryLog(
+        engine,
+        threshold_ms=60_000,
+        sample_rate=1,
+        explain_interval=60,
+        log_file=str(log_file),
+    )
+    slow_query_log.install()
+    try:
+        with Session(engine) as session:
+            session.exec(select(User)).first()
+    finally:
+        slow_query_log.uninstall()
+
+    assert not log_file.exists()
+
+
+def test_slow_query_log_reopened_after_rotation(tmp_path: Path) -> None:
+    log_file = tmp_path / "slow_queries.jsonl"
+    slow_query_log = SlowQueryLog(
+        engine,
+        threshold_ms=0,
+        sample_rate=1,
+        explain_interval=60,
+        log_file=str(log_file),
+    )
+    slow_query_log.write('{"n": 1}')
+    # Moved away by logrotate
+    log_file.rename(tmp_path / "slow_queries.jsonl.1")
+    slow_query_log.write('{"n": 2}')
+    slow_query_log._handler.close()
+
+    assert read_entries(tmp_path / "slow_queries.jsonl.1") == [{"n": 1}]
+    assert read_entries(log_file) == [{"n": 2}]
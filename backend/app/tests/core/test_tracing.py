@@ -0,0 +1,80 @@
+from typing import Any
+
+import pytest
+from fastapi import FastAPI
+
+from app.core.tracing import OpenTelemetryMiddleware, RouteTracesSampler
+
+sampler = RouteTracesSampler(
+    critical_paths={"/health"},
+    expensive_paths={"/login"},
+    sample_rates={"critical": 0.0, "default": 0.1, "expensive": 0.5},
+)
+
+
+@pytest.mark.parametrize(
+    ("sampling_context", "expected"),
+    [
+        ({"asgi_scope": {"path": "/health"}}, 0.0),
+        ({"asgi_scope": {"path": "/login"}}, 0.5),
+        ({"asgi_scope": {"path": "/users/"}}, 0.1),
+        # Clients can't force their requests to be traced, or not
+        ({"asgi_scope": {"path": "/health"}, "parent_sampled": True}, 0.0),
+        ({"asgi_scope": {"path": "/login"}, "parent_sampled": False}, 0.5),
+        ({"transaction_context": {"op": "task"}}, 0.1),
+    ],
+)
+def test_route_traces_sampler(
+    sampling_context: dict[str, Any], expected: float
+) -> None:
+    assert sampler(sampling_context) == expected
+
+
+def test_opentelemetry_middleware() -> None:
+    pytest.importorskip("opentelemetry.sdk")
+    from fastapi.testclient import TestClient
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+
+    from app.core.otel import RouteSampler, route_parent_based
+
+    app = FastAPI()
+
+    @app.get("/health")
+    def health() -> bool:
+        return True
+
+    @app.get("/login")
+    def login() -> bool:
+        return True
+
+    exporter = InMemorySpanExporter()
+    always = RouteTracesSampler(
+        critical_paths={"/health"},
+        expensive_paths={"/login"},
+        sample_rates={"critical": 0.0, "default": 1.0, "expensive": 1.0},
+    )
+    provider = TracerProvider(sampler=route_parent_based(RouteSampler(always)))
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    app.add_middleware(OpenTelemetryMiddleware, tracer_provider=provider)
+    client = TestClient(app)
+
+    assert client.get("/health").status_code == 200
+    assert client.get("/login").status_code == 200
+    sampled = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+    not_sampled = "00-1af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-00"
+    # The decision of the client is ignored, the route rate applies
+    client.get("/health", headers={"traceparent": sampled})
+    client.get("/login", headers={"traceparent": not_sampled})
+
+    login_span, continued_login_span = exporter.get_finished_spans()
+    assert login_span.name == "GET login_login_get"
+    assert login_span.attributes is not None
+    assert login_span.attributes["http.response.status_code"] == 200
+    assert continued_login_span.parent is not None
+    assert continued_login_span.context.trace_id == int(
+        "1af7651916cd43dd8448eb211c80319c", 16
+    )
@@ -2,6 +2,7 @@ from fastapi.encoders import jsonable_encoder
 from sqlmodel import Session
 
 from app import crud
+from app.core.query_stats import count_queries
 from app.core.security import verify_password
 from app.models import User, UserCreate, UserUpdate
 from app.tests.utils.utils import random_email, random_lower_string
@@ -89,3 +90,33 @@ def test_update_user(db: Session) -> None:
     assert user_2
     assert user.email == user_2.email
     assert verify_password(new_password, user_2.hashed_password)
+
+
+def test_create_user_single_statement(db: Session) -> None:
+    user_in = UserCreate(
+        email=random_email(),
+        username=random_lower_string(),
+        password=random_lower_string(),
+    )
+    with count_queries() as stats:
+        user = crud.create_user(session=db, user_create=user_in)
+    # created_at comes back with the INSERT ... RETURNING, no refresh needed
+    assert stats.count == 1
+    assert stats.statements.most_common(1)[0][0].startswith("INSERT")
+    assert user.created_at is not None
+
+
+def test_update_user_single_statement(db: Session) -> None:
+    user_in = UserCreate(
+        email=random_email(),
+        username=random_lower_string(),
+        password=random_lower_string(),
+    )
+    user = crud.create_user(session=db, user_create=user_in)
+    db.refresh(user)
+    with count_queries() as stats:
+        crud.update_user(
+            session=db, db_user=user, user_in=UserUpdate(full_name="Updated Name")
+        )
+    assert stats.count == 1
+    assert "RETURNING" in stats.statements.most_common(1)[0][0]
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.email_worker import send_batch, smtp_backend
+from app.models import OutboundEmail
+from app.tests.utils.smtp import smtp_server
+
+
+def enqueue(db: Session, email_to: str) -> OutboundEmail:
+    return crud.enqueue_email(
+        session=db, email_to=email_to, subject="Hello", html_content="<p>Hello</p>"
+    )
+
+
+def test_send_batch_reuses_the_connection(db: Session) -> None:
+    with smtp_server() as server:
+        # Read before the rows are deleted, the expired emails can't be loaded
+        ids = [enqueue(db, f"user{n}@example.com").id for n in range(3)]
+        smtp = smtp_backend()
+        try:
+            assert send_batch(session=db, smtp=smtp) == 3
+        finally:
+            smtp.close()
+
+    assert sorted(e.rcpt_tos[0] for e in server.envelopes) == [
+        "user0@example.com",
+        "user1@example.com",
+        "user2@example.com",
+    ]
+    assert len(server.sessions) == 1
+    # Sent emails are deleted
+    assert all(db.get(OutboundEmail, id) is None for id in ids)
+
+
+def test_send_batch_retries_temporary_failures(db: Session) -> None:
+    with smtp_server() as server:
+        refused = enqueue(db, "refused@example.com")
+        busy = enqueue(db, "busy@example.com")
+        sent_id = enqueue(db, "user@example.com").id
+        smtp = smtp_backend()
+        try:
+            assert send_batch(session=db, smtp=smtp) == 3
+        finally:
+            smtp.close()
+
+    assert [e.rcpt_tos for e in server.envelopes] == [["user@example.com"]]
+    assert db.get(OutboundEmail, sent_id) is None
+    db.refresh(refused)
+    assert refused.status == "failed"
+    assert refused.error and "550" in refused.error
+    assert refused.html_content == ""
+    db.refresh(busy)
+    assert busy.status == "pending"
+    assert busy.attempts == 1
+    assert busy.next_attempt_at
+    assert busy.next_attempt_at > datetime.now(timezone.utc) + timedelta(seconds=20)
+
+
+def test_claim_emails_pushes_claimed_emails_back(db: Session) -> None:
+    with patch.multiple(
+        settings, SMTP_HOST="smtp.example.com", EMAILS_FROM_EMAIL="noreply@example.com"
+    ):
+        email = enqueue(db, "user@example.com")
+    lease = timedelta(minutes=5)
+
+    claimed = crud.claim_emails(session=db, limit=10, lease=lease)
+
+    assert [e.id for e in claimed] == [email.id]
+    assert claimed[0].attempts == 1
+    # Until the lease expires, the worker that claimed it is sending it
+    assert crud.claim_emails(session=db, limit=10, lease=lease) == []
+
+
+def test_delete_failed_emails(db: Session) -> None:
+    with patch.multiple(
+        settings, SMTP_HOST="smtp.example.com", EMAILS_FROM_EMAIL="noreply@example.com"
+    ):
+        old, recent, pending = (enqueue(db, "user@example.com") for _ in range(3))
+    for db_email in (old, recent):
+        crud.fail_email(session=db, db_email=db_email, error="550", retry_in=None)
+    old.next_attempt_at = datetime.now(timezone.utc) - timedelta(days=8)
+    db.add(old)
+    db.commit()
+    ids = [old.id, recent.id, pending.id]
+
+    deleted = crud.delete_failed_emails(session=db, older_than=timedelta(days=7))
+
+    assert deleted == 1
+    assert [db.get(OutboundEmail, id) is None for id in ids] == [True, False, False]
@@ -0,0 +1,130 @@
+import uuid
+from collections.abc import Generator
+
+import pytest
+from sqlmodel import Session, col, delete, func, select
+
+from app.core.db import engine
+from app.core.sharding import get_shard_engine, shard_session
+from app.models import Tag, Todo, TodoTag, User
+from app.rebalance_shard import (
+    copy_rows,
+    copy_user_row,
+    delete_missing_rows,
+    rebalance,
+    todo_table,
+)
+from app.tests.utils.todo import create_random_todos
+from app.tests.utils.user import create_random_user
+
+
+@pytest.fixture
+def primary() -> Generator[Session, None, None]:
+    """
+    Session committing to the main database, where the script opens its own
+    connections. The users created in the test are deleted afterwards.
+    """
+    with Session(engine, expire_on_commit=False) as session:
+        started_at = session.exec(select(func.now())).one()
+        session.commit()
+        yield session
+        session.rollback()
+        session.exec(delete(User).where(col(User.created_at) >= started_at))  # type: ignore
+        session.commit()
+
+
+def count_user_rows(session: Session, user_id: uuid.UUID) -> tuple[int, int, int]:
+    todos = session.exec(
+        select(func.count()).select_from(Todo).where(Todo.user_id == user_id)
+    ).one()
+    tags = session.exec(
+        select(func.count()).select_from(Tag).where(Tag.user_id == user_id)
+    ).one()
+    links = session.exec(
+        select(func.count())
+        .select_from(TodoTag)
+        .join(Todo, col(TodoTag.todo_id) == Todo.id)
+        .where(Todo.user_id == user_id)
+    ).one()
+    return todos, tags, links
+
+
+def test_rebalance(primary: Session, shard: str) -> None:
+    user = create_random_user(primary)
+    create_random_todos(primary, user_id=user.id, count=3, with_tag=True)
+
+    rebalance(user_id=user.id, shard=shard, batch_size=2, grace_seconds=0)
+
+    primary.refresh(user)
+    assert user.shard == shard
+    assert not user.shard_moving
+    assert count_user_rows(primary, user.id) == (0, 0, 0)
+    with shard_session(shard) as shard_db:
+        assert count_user_rows(shard_db, user.id) == (3, 1, 3)
+        copy = shard_db.get(User, user.id)
+        assert copy
+        assert copy.email == user.email
+        assert copy.hashed_password == ""
+
+    # And back to the main database
+    rebalance(user_id=user.id, shard=None, batch_size=2, grace_seconds=0)
+
+    primary.refresh(user)
+    assert user.shard is None
+    assert not user.shard_moving
+    assert count_user_rows(primary, user.id) == (3, 1, 3)
+    with shard_session(shard) as shard_db:
+        assert count_user_rows(shard_db, user.id) == (0, 0, 0)
+        assert shard_db.get(User, user.id) is None
+
+
+def test_delete_missing_rows(primary: Session, shard: str) -> None:
+    user = create_random_user(primary)
+    todos = create_random_todos(primary, user_id=user.id, count=3)
+    with (
+        engine.connect() as source,
+        get_shard_engine(shard).connect() as target,
+    ):
+        copy_user_row(source, target, user.id)
+        copy_rows(source, target, todo_table, user.id, batch_size=2)
+        primary.delete(todos[1])
+        primary.commit()
+
+        deleted = delete_missing_rows(source, target, todo_table, user.id, batch_size=1)
+
+    assert deleted == 1
+    with shard_session(shard) as shard_db:
+        ids = shard_db.exec(select(Todo.id).where(Todo.user_id == user.id)).all()
+    assert sorted(ids) == sorted([todos[0].id, todos[2].id])
+
+
+def test_copy_user_row_refreshes_stale_copies(primary: Session, shard: str) -> None:
+    user = create_random_user(primary)
+    old_email = user.email
+    rebalance(user_id=user.id, shard=shard, batch_size=100, grace_seconds=0)
+    user.email = user.username = f"new-{old_email}"
+    primary.add(user)
+    primary.commit()
+    # Another user now has the email and username left on the shard's copy
+    other_user = create_random_user(primary)
+    other_user.email = other_user.username = old_email
+    primary.add(other_user)
+    primary.commit()
+
+    rebalance(user_id=other_user.id, shard=shard, batch_size=100, grace_seconds=0)
+
+    with shard_session(shard) as shard_db:
+        other_copy = shard_db.get(User, other_user.id)
+        assert other_copy
+        assert other_copy.email == old_email
+        copy = shard_db.get(User, user.id)
+        assert copy
+        assert copy.email == copy.username == str(user.id)
+
+    # The copy is updated when the user is copied again
+    with engine.connect() as source, get_shard_engine(shard).connect() as target:
+        copy_user_row(source, target, user.id)
+    with shard_session(shard) as shard_db:
+        copy = shard_db.get(User, user.id)
+        assert copy
+        assert copy.email == user.email
@@ -0,0 +1,145 @@
+import uuid
+from datetime import date, datetime, time, timedelta
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from sqlmodel import Session, col, select
+
+from app import crud
+from app.core.config import settings
+from app.models import OutboundEmail, Todo, User
+from app.send_digests import queue_digests
+from app.tests.utils.user import create_random_user
+from app.utils import generate_digest_email
+
+DAY = date(2026, 10, 19)
+DAY_START = datetime.combine(DAY, time())
+
+
+@pytest.fixture(autouse=True)
+def emails_enabled() -> Any:
+    with patch.multiple(
+        settings, SMTP_HOST="smtp.example.com", EMAILS_FROM_EMAIL="noreply@example.com"
+    ):
+        yield
+
+
+def add_todo(
+    db: Session, user: User, title: str, due_date: datetime, **values: Any
+) -> None:
+    db.add(Todo(title=title, user_id=user.id, due_date=due_date, **values))
+    db.commit()
+
+
+def queued_emails(db: Session, *users: User) -> list[OutboundEmail]:
+    statement = select(OutboundEmail).where(
+        col(OutboundEmail.email_to).in_([user.email for user in users])
+    )
+    return list(db.exec(statement))
+
+
+def queue(db: Session, batch_size: int = 100) -> int:
+    return queue_digests(
+        session=db,
+        data_session=db,
+        shard=None,
+        day=DAY,
+        batch_size=batch_size,
+        titles_limit=10,
+    )
+
+
+def test_queue_digests(db: Session) -> None:
+    user = create_random_user(db)
+    add_todo(db, user, "Overdue", DAY_START - timedelta(days=2))
+    add_todo(db, user, "Due today", DAY_START + timedelta(hours=9))
+    add_todo(db, user, "Due tomorrow", DAY_START + timedelta(days=1))
+    add_todo(db, user, "Completed", DAY_START, is_completed=True)
+    add_todo(db, user, "Deleted", DAY_START, is_deleted=True)
+    later_user = create_random_user(db)
+    add_todo(db, later_user, "Due tomorrow", DAY_START + timedelta(days=1))
+    inactive_user = create_random_user(db)
+    inactive_user.is_active = False
+    db.add(inactive_user)
+    add_todo(db, inactive_user, "Overdue", DAY_START - timedelta(days=1))
+
+    assert queue(db) == 1
+
+    [email] = queued_emails(db, user, later_user, inactive_user)
+    assert email.email_to == user.email
+    assert DAY.isoformat() in email.subject
+    assert "Overdue: 1" in email.html_content
+    assert "Due today: 1" in email.html_content
+    for title in ("Due tomorrow", "Completed", "Deleted"):
+        assert title not in email.html_content
+
+
+def test_queue_digests_escapes_titles(db: Session) -> None:
+    user = create_random_user(db)
+    add_todo(db, user, "<b>Overdue</b>", DAY_START - timedelta(days=1))
+
+    queue(db)
+
+    [email] = queued_emails(db, user)
+    assert "&lt;b&gt;Overdue&lt;/b&gt;" in email.html_content
+
+
+def test_queue_digests_resumes_without_resending(db: Session) -> None:
+    users = [create_random_user(db) for _ in range(3)]
+    for user in users:
+        add_todo(db, user, "Overdue", DAY_START - timedelta(days=1))
+    calls = []
+
+    def fail_on_the_second_batch(**kwargs: Any) -> Any:
+        calls.append(kwargs["email_to"])
+        if len(calls) == 2:
+            raise RuntimeError("Stopped")
+        return generate_digest_email(**kwargs)
+
+    with (
+        patch(
+            "app.send_digests.generate_digest_email",
+            side_effect=fail_on_the_second_batch,
+        ),
+        pytest.raises(RuntimeError),
+    ):
+        queue(db, batch_size=1)
+    assert len(queued_emails(db, *users)) == 1
+
+    assert queue(db, batch_size=1) == 2
+    emails = queued_emails(db, *users)
+    assert sorted(email.email_to for email in emails) == sorted(
+        user.email for user in users
+    )
+    # The day is finished
+    assert queue(db, batch_size=1) == 0
+
+
+def test_queue_digests_skips_users_moved_to_another_shard(db: Session) -> None:
+    user = create_random_user(db)
+    add_todo(db, user, "Overdue", DAY_START - timedelta(days=1))
+    user.shard = "shard1"
+    db.add(user)
+    db.commit()
+
+    assert queue(db) == 0
+
+
+def test_get_todo_digests_is_one_query(db: Session, assert_max_queries: Any) -> None:
+    users = [create_random_user(db) for _ in range(5)]
+    for user in users:
+        add_todo(db, user, "Overdue", DAY_START - timedelta(days=1))
+        add_todo(db, user, "Due today", DAY_START)
+
+    with assert_max_queries(1):
+        digests = crud.get_todo_digests(
+            session=db, day_start=DAY_START, after=None, limit=10, titles_limit=1
+        )
+
+    by_user: dict[uuid.UUID, Any] = {digest.user_id: digest for digest in digests}
+    for user in users:
+        digest = by_user[user.id]
+        assert (digest.overdue, digest.due_today) == (1, 1)
+        assert digest.overdue_titles == ["Overdue"]
+        assert digest.due_today_titles == ["Due today"]
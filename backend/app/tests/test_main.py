@@ -0,0 +1,42 @@
+import subprocess
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+
+# Only needed by some requests, when Sentry is enabled or by the planning scripts
+LAZY_MODULES = [
+    *["alembic", "emails", "jinja2", "sentry_sdk"],
+    *["anthropic", "jira", "pandas", "plotly"],
+]
+
+
+def test_app_import_skips_lazy_modules() -> None:
+    # In a new interpreter, the tests import all of them
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, app.main; print(*sorted(sys.modules), sep='\\n')",
+        ],
+        cwd=Path(__file__).parents[2],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported = set(result.stdout.split())
+    assert [module for module in LAZY_MODULES if module in imported] == []
+
+
+def test_shed_requests_have_cors_headers(client: TestClient) -> None:
+    with patch.object(app.state.concurrency_limit, "try_acquire", return_value=False):
+        r = client.get(
+            f"{settings.API_V1_STR}/users/me",
+            headers={"Origin": settings.FRONTEND_HOST},
+        )
+    assert r.status_code == 503
+    assert r.headers["Access-Control-Allow-Origin"] == settings.FRONTEND_HOST
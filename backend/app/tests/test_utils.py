@@ -0,0 +1,31 @@
+import os
+from pathlib import Path
+
+from app.utils import email_templates, generate_test_email
+
+
+def test_email_templates_compiled_once(tmp_path: Path) -> None:
+    (tmp_path / "hello.html").write_text("Hello {{ name }}")
+    environment = email_templates(tmp_path)
+
+    template = environment.get_template("hello.html")
+    assert template.render(name="Ana") == "Hello Ana"
+    assert environment.get_template("hello.html") is template
+
+
+def test_email_templates_recompiled_on_change(tmp_path: Path) -> None:
+    path = tmp_path / "hello.html"
+    path.write_text("Hello {{ name }}")
+    environment = email_templates(tmp_path)
+    environment.get_template("hello.html")
+
+    path.write_text("Bye {{ name }}")
+    # The change is seen from the modification time
+    mtime = path.stat().st_mtime + 1
+    os.utime(path, (mtime, mtime))
+    assert environment.get_template("hello.html").render(name="Ana") == "Bye Ana"
+
+
+def test_generate_test_email() -> None:
+    email_data = generate_test_email(email_to="user@example.com")
+    assert "user@example.com" in email_data.html_content
@@ -0,0 +1,134 @@
+import hashlib
+import os
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import URL, Connection, Engine, create_engine, make_url, text
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session
+
+from app.core.config import settings
+
+BACKEND_DIR = Path(__file__).parents[3]
+MIGRATIONS_DIR = BACKEND_DIR / "app" / "alembic"
+
+BASE_DATABASE = settings.POSTGRES_DB
+TEMPLATE_DATABASE = f"{BASE_DATABASE}_test_template"
+# Any key works, it only has to be the same in every worker
+TEMPLATE_LOCK_ID = 7_263_005
+
+
+def worker_database() -> str:
+    # Set by pytest-xdist in its worker processes, e.g. gw0
+    worker = os.environ.get("PYTEST_XDIST_WORKER", "main")
+    return f"{BASE_DATABASE}_test_{worker}"
+
+
+def use_worker_database() -> None:
+    """
+    Point the settings to this worker's database, before the engine is created.
+    """
+    settings.POSTGRES_DB = worker_database()
+
+
+def database_url(database: str) -> URL:
+    return make_url(str(settings.SQLALCHEMY_DATABASE_URI)).set(database=database)
+
+
+def template_version() -> str:
+    """
+    Hash of the migrations and of the seeded data, the template is rebuilt when
+    it changes.
+    """
+    digest = hashlib.sha256()
+    for path in sorted((MIGRATIONS_DIR / "versions").glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    digest.update(settings.FIRST_SUPERUSER.encode())
+    digest.update(settings.FIRST_SUPERUSER_PASSWORD.encode())
+    return digest.hexdigest()
+
+
+def migrate_template(template_engine: Engine) -> None:
+    # Imported here, the app engine must only be created after use_worker_database()
+    from app.core.db import init_db
+
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    with template_engine.begin() as connection:
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
+    with Session(template_engine) as session:
+        init_db(session)
+
+
+def server_engine() -> Engine:
+    return create_engine(
+        database_url("postgres"), isolation_level="AUTOCOMMIT", poolclass=NullPool
+    )
+
+
+def clone_template(server: Connection, database: str) -> None:
+    server.execute(text(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)'))
+    server.execute(text(f'CREATE DATABASE "{database}" TEMPLATE "{TEMPLATE_DATABASE}"'))
+
+
+def create_worker_database() -> None:
+    """
+    Clone this worker's database from a template with the migrations applied.
+
+    The template is built once and reused by the next runs until the migrations
+    change, cloning it is much faster than migrating a new database.
+    """
+    engine = server_engine()
+    version = template_version()
+    with engine.connect() as server:
+        # Workers start at the same time, only one of them builds the template
+        server.execute(text("SELECT pg_advisory_lock(:id)"), {"id": TEMPLATE_LOCK_ID})
+        try:
+            template_comment = server.execute(
+                text(
+                    "SELECT shobj_description(oid, 'pg_database') "
+                    "FROM pg_database WHERE datname = :name"
+                ),
+                {"name": TEMPLATE_DATABASE},
+            ).scalar()
+            if template_comment != version:
+                server.execute(
+                    text(f'DROP DATABASE IF EXISTS "{TEMPLATE_DATABASE}" WITH (FORCE)')
+                )
+                server.execute(text(f'CREATE DATABASE "{TEMPLATE_DATABASE}"'))
+                template_engine = create_engine(
+                    database_url(TEMPLATE_DATABASE), poolclass=NullPool
+                )
+                migrate_template(template_engine)
+                template_engine.dispose()
+                server.execute(
+                    text(f"COMMENT ON DATABASE \"{TEMPLATE_DATABASE}\" IS '{version}'")
+                )
+        finally:
+            server.execute(
+                text("SELECT pg_advisory_unlock(:id)"), {"id": TEMPLATE_LOCK_ID}
+            )
+        clone_template(server, worker_database())
+    engine.dispose()
+
+
+def create_shard_database(shard: str) -> URL:
+    """
+    Clone a database for `shard` from the template, after this worker's own.
+    """
+    database = f"{worker_database()}_{shard}"
+    engine = server_engine()
+    with engine.connect() as server:
+        clone_template(server, database)
+    engine.dispose()
+    return database_url(database)
+
+
+def drop_database(url: URL) -> None:
+    engine = server_engine()
+    with engine.connect() as server:
+        server.execute(text(f'DROP DATABASE IF EXISTS "{url.database}" WITH (FORCE)'))
+    engine.dispose()
@@ -0,0 +1,98 @@
+import asyncio
+import socket
+from collections.abc import Generator
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import SMTP, Envelope
+from aiosmtpd.smtp import Session as SMTPSession
+
+from app.core.config import settings
+
+
+class RecordingHandler:
+    """
+    Accept every email and record it, recipients starting with "refused" are
+    refused for good and the ones starting with "busy" for now.
+
+    `handshake_delay` is added to the greeting of each connection, like the
+    round trips of TLS and authentication with a remote server.
+    """
+
+    def __init__(self, *, handshake_delay: float = 0) -> None:
+        self.handshake_delay = handshake_delay
+        self.envelopes: list[Envelope] = []
+        self.sessions: list[SMTPSession] = []
+
+    async def handle_EHLO(
+        self,
+        server: SMTP,
+        session: SMTPSession,
+        envelope: Envelope,
+        hostname: str,
+        responses: list[str],
+    ) -> list[str]:
+        await asyncio.sleep(self.handshake_delay)
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(
+        self,
+        server: SMTP,
+        session: SMTPSession,
+        envelope: Envelope,
+        address: str,
+        rcpt_options: list[str],
+    ) -> str:
+        if address.startswith("refused"):
+            return "550 No such user"
+        if address.startswith("busy"):
+            return "451 Try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(
+        self,
+        server: SMTP,
+        session: SMTPSession,
+        envelope: Envelope,
+    ) -> str:
+        self.envelopes.append(envelope)
+        # One session per connection
+        if not any(seen is session for seen in self.sessions):
+            self.sessions.append(session)
+        return "250 Message accepted for delivery"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port: int = s.getsockname()[1]
+        return port
+
+
+@contextmanager
+def smtp_server(
+    *, handshake_delay: float = 0
+) -> Generator[RecordingHandler, None, None]:
+    """
+    Run a local SMTP server in a thread, the settings point to it meanwhile.
+    """
+    handler = RecordingHandler(handshake_delay=handshake_delay)
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    try:
+        with patch.multiple(
+            settings,
+            SMTP_HOST=controller.hostname,
+            SMTP_PORT=controller.port,
+            SMTP_TLS=False,
+            SMTP_SSL=False,
+            SMTP_USER=None,
+            SMTP_PASSWORD=None,
+            EMAILS_FROM_EMAIL="noreply@example.com",
+        ):
+            yield handler
+    finally:
+        controller.stop()
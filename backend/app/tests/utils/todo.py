@@ -0,0 +1,20 @@
+import uuid
+
+from sqlmodel import Session
+
+from app.models import Tag, Todo, TodoTag
+from app.tests.utils.utils import random_lower_string
+
+
+def create_random_todos(
+    db: Session, *, user_id: uuid.UUID, count: int, with_tag: bool = False
+) -> list[Todo]:
+    todos = [Todo(title=random_lower_string(), user_id=user_id) for _ in range(count)]
+    db.add_all(todos)
+    if with_tag:
+        tag = Tag(name=random_lower_string(), user_id=user_id)
+        db.add(tag)
+        db.flush()
+        db.add_all([TodoTag(todo_id=todo.id, tag_id=tag.id) for todo in todos])
+    db.commit()
+    return todos
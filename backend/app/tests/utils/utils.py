@@ -1,9 +1,15 @@
 import random
 import string
+from collections.abc import Callable
+from contextlib import AbstractContextManager
 
 from fastapi.testclient import TestClient
 
 from app.core.config import settings
+from app.core.query_stats import QueryStats
+
+# Type of the assert_max_queries fixture
+AssertMaxQueries = Callable[[int], AbstractContextManager[QueryStats]]
 
 
 def random_lower_string() -> str:
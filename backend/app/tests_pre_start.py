@@ -2,20 +2,28 @@ import logging
 
 from sqlalchemy import Engine
 from sqlmodel import Session, select
-from tenacity import after_log, before_log, retry, stop_after_attempt, wait_fixed
+from tenacity import (
+    after_log,
+    before_log,
+    retry,
+    stop_after_delay,
+    wait_random_exponential,
+)
 
 from app.core.db import engine
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-max_tries = 60 * 5  # 5 minutes
-wait_seconds = 1
+max_wait_seconds = 60 * 5  # 5 minutes
+# The first retries come within tens of milliseconds, then the waits double up
+# to 5s. They're random, so replicas starting together don't retry in lockstep
+wait = wait_random_exponential(multiplier=0.05, max=5)
 
 
 @retry(
-    stop=stop_after_attempt(max_tries),
-    wait=wait_fixed(wait_seconds),
+    stop=stop_after_delay(max_wait_seconds),
+    wait=wait,
     before=before_log(logger, logging.INFO),
     after=after_log(logger, logging.WARN),
 )
@@ -1,16 +1,19 @@
 import logging
 from dataclasses import dataclass
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
+from functools import cache
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import emails  # type: ignore
 import jwt
-from jinja2 import Template
 from jwt.exceptions import InvalidTokenError
 
 from app.core import security
 from app.core.config import settings
+from app.core.metrics import EMAIL_SEND_DURATION
+
+if TYPE_CHECKING:
+    from jinja2 import Environment
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,12 +25,53 @@ class EmailData:
     subject: str
 
 
+EMAIL_TEMPLATES_DIR = Path(__file__).parent / "email-templates" / "build"
+
+
+@cache
+def email_templates(directory: Path = EMAIL_TEMPLATES_DIR) -> "Environment":
+    """
+    The Jinja environment of the email templates of `directory`, created on
+    first use, the requests that don't send emails don't pay for it.
+
+    A template is compiled once per process and kept, then compiled again only
+    when its file changes. The bytecode cache in the temporary directory spares
+    the compilation to new processes, e.g. replaced server workers.
+    """
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+    return Environment(
+        loader=FileSystemLoader(directory),
+        bytecode_cache=FileSystemBytecodeCache(),
+        auto_reload=True,
+    )
+
+
+def load_email_templates() -> None:
+    """
+    Compile all the email templates, e.g. before the server forks its workers,
+    which then share them.
+    """
+    environment = email_templates()
+    for template_name in environment.list_templates():
+        environment.get_template(template_name)
+
+
 def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
-    template_str = (
-        Path(__file__).parent / "email-templates" / "build" / template_name
-    ).read_text()
-    html_content = Template(template_str).render(context)
-    return html_content
+    return email_templates().get_template(template_name).render(context)
+
+
+def smtp_options() -> dict[str, Any]:
+    options: dict[str, Any] = {"host": settings.SMTP_HOST, "port": settings.SMTP_PORT}
+    if settings.SMTP_TLS:
+        options["tls"] = True
+    elif settings.SMTP_SSL:
+        options["ssl"] = True
+    if settings.SMTP_USER:
+        options["user"] = settings.SMTP_USER
+    if settings.SMTP_PASSWORD:
+        options["password"] = settings.SMTP_PASSWORD
+    return options
 
 
 def send_email(
@@ -35,23 +79,24 @@ def send_email(
     email_to: str,
     subject: str = "",
     html_content: str = "",
+    smtp: Any = None,
 ) -> None:
+    """
+    Send an email over a new SMTP connection, or over `smtp`, the open
+    connection of an emails SMTPBackend kept by app/email_worker.py.
+    """
+    import emails  # type: ignore
+
     assert settings.emails_enabled, "no provided configuration for email variables"
     message = emails.Message(
         subject=subject,
         html=html_content,
         mail_from=(settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL),
     )
-    smtp_options = {"host": settings.SMTP_HOST, "port": settings.SMTP_PORT}
-    if settings.SMTP_TLS:
-        smtp_options["tls"] = True
-    elif settings.SMTP_SSL:
-        smtp_options["ssl"] = True
-    if settings.SMTP_USER:
-        smtp_options["user"] = settings.SMTP_USER
-    if settings.SMTP_PASSWORD:
-        smtp_options["password"] = settings.SMTP_PASSWORD
-    response = message.send(to=email_to, smtp=smtp_options)
+    with EMAIL_SEND_DURATION.time():
+        response = message.send(
+            to=email_to, smtp=smtp_options() if smtp is None else smtp
+        )
     logger.info(f"send email result: {response}")
 
 
@@ -82,17 +127,44 @@ def generate_reset_password_email(email_to: str, email: str, token: str) -> Emai
     return EmailData(html_content=html_content, subject=subject)
 
 
-def generate_new_account_email(
-    email_to: str, username: str, password: str
-) -> EmailData:
+def generate_new_account_email(email_to: str, username: str, token: str) -> EmailData:
+    # The email is stored in the queue until it's sent, it holds a link to set
+    # the password that expires rather than the password
     project_name = settings.PROJECT_NAME
     subject = f"{project_name} - New account for user {username}"
+    link = f"{settings.FRONTEND_HOST}/reset-password?token={token}"
     html_content = render_email_template(
         template_name="new_account.html",
         context={
             "project_name": settings.PROJECT_NAME,
             "username": username,
-            "password": password,
+            "email": email_to,
+            "valid_hours": settings.EMAIL_RESET_TOKEN_EXPIRE_HOURS,
+            "link": link,
+        },
+    )
+    return EmailData(html_content=html_content, subject=subject)
+
+
+def generate_digest_email(
+    email_to: str,
+    day: date,
+    overdue: int,
+    overdue_titles: list[str],
+    due_today: int,
+    due_today_titles: list[str],
+) -> EmailData:
+    project_name = settings.PROJECT_NAME
+    subject = f"{project_name} - Your todos for {day.isoformat()}"
+    html_content = render_email_template(
+        template_name="digest.html",
+        context={
+            "project_name": settings.PROJECT_NAME,
+            "day": day.isoformat(),
+            "overdue": overdue,
+            "overdue_titles": overdue_titles,
+            "due_today": due_today,
+            "due_today_titles": due_today_titles,
             "email": email_to,
             "link": settings.FRONTEND_HOST,
         },
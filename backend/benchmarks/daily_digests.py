@@ -0,0 +1,171 @@
+"""
+Compare queueing the daily digests user by user with the grouped batches.
+
+Creates users with open todos, overdue, due on the day of the digests and due
+later, then queues the digest emails of the day twice and reports the time and
+the SQL statements each way took:
+
+- per user: the todos of each user are read by a query of their own and their
+  email is queued in a transaction of its own
+- grouped: app/send_digests.py, a grouped query over the todos and a query of
+  the users per batch, queued in one transaction with the progress of the run
+
+Sending is measured by benchmarks.email_queue. It uses the database configured
+in `.env` and deletes the users and emails it created, run it from ./backend/
+against a scratch database:
+
+    $ uv run python -m benchmarks.daily_digests --users 10000 --todos 20
+"""
+
+import argparse
+import time
+from datetime import date, datetime, timedelta
+from typing import Any
+from unittest.mock import patch
+
+from sqlalchemy import text
+from sqlmodel import Session, col, delete, select
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.core.query_stats import count_queries
+from app.models import DigestRun, OutboundEmail, Todo, User
+from app.send_digests import queue_digests
+from app.utils import generate_digest_email
+
+DAY = date(2000, 1, 3)
+EMAIL_PREFIX = "digest-bench-"
+
+CREATE_USERS = """
+INSERT INTO "user" (id, email, username, hashed_password, is_active,
+    is_superuser, is_verified, shard_moving)
+SELECT gen_random_uuid(), :prefix || n || '@example.com', :prefix || n, '', true,
+    false, false, false
+FROM generate_series(1, :users) AS n
+"""
+
+# Due one day apart, from overdue to later than the day of the digests
+CREATE_TODOS = """
+INSERT INTO todo (id, user_id, title, due_date, is_completed, is_deleted)
+SELECT gen_random_uuid(), u.id, 'Todo ' || n, :day_start + (n - :todos / 2) * interval '1 day',
+    n % 5 = 0, false
+FROM "user" AS u, generate_series(1, :todos) AS n
+WHERE u.email LIKE :prefix || '%'
+"""
+
+
+def queue_per_user(session: Session, day_start: datetime) -> int:
+    users = session.exec(
+        select(User.id, User.email).where(col(User.email).startswith(EMAIL_PREFIX))
+    ).all()
+    queued = 0
+    for user_id, email in users:
+        todos = session.exec(
+            select(Todo)
+            .where(
+                Todo.user_id == user_id,
+                ~col(Todo.is_completed),
+                ~col(Todo.is_deleted),
+                col(Todo.due_date) < day_start + timedelta(days=1),
+            )
+            .order_by(col(Todo.due_date))
+        ).all()
+        if not todos:
+            continue
+        overdue = [t.title for t in todos if t.due_date and t.due_date < day_start]
+        due_today = [t.title for t in todos if t.due_date and t.due_date >= day_start]
+        email_data = generate_digest_email(
+            email_to=email,
+            day=DAY,
+            overdue=len(overdue),
+            overdue_titles=overdue[:10],
+            due_today=len(due_today),
+            due_today_titles=due_today[:10],
+        )
+        crud.enqueue_email(
+            session=session,
+            email_to=email,
+            subject=email_data.subject,
+            html_content=email_data.html_content,
+        )
+        queued += 1
+    return queued
+
+
+def delete_queued(session: Session) -> None:
+    session.exec(  # type: ignore
+        delete(OutboundEmail).where(
+            col(OutboundEmail.email_to).startswith(EMAIL_PREFIX)
+        )
+    )
+    session.exec(delete(DigestRun).where(DigestRun.day == DAY))  # type: ignore
+    session.commit()
+
+
+def report(name: str, seconds: float, statements: int, queued: int) -> None:
+    print(f"{name:<12}{seconds:>10.2f}{statements:>14}{queued:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--todos", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    day_start = datetime.combine(DAY, datetime.min.time())
+    params: dict[str, Any] = {
+        "prefix": EMAIL_PREFIX,
+        "users": args.users,
+        "todos": args.todos,
+        "day_start": day_start,
+    }
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_USERS), params)
+        conn.execute(text(CREATE_TODOS), params)
+        conn.execute(text("ANALYZE todo"))
+        conn.execute(text('ANALYZE "user"'))
+
+    print(f"{'queueing':<12}{'seconds':>10}{'statements':>14}{'emails':>10}")
+    try:
+        with (
+            patch.multiple(
+                settings,
+                SMTP_HOST="smtp.example.com",
+                EMAILS_FROM_EMAIL="noreply@example.com",
+            ),
+            Session(engine, expire_on_commit=False) as session,
+        ):
+            with count_queries() as stats:
+                start = time.perf_counter()
+                queued = queue_per_user(session, day_start)
+                elapsed = time.perf_counter() - start
+            report("per user", elapsed, stats.count, queued)
+            delete_queued(session)
+
+            with (
+                count_queries() as stats,
+                Session(engine, expire_on_commit=False) as data_session,
+            ):
+                start = time.perf_counter()
+                queued = queue_digests(
+                    session=session,
+                    data_session=data_session,
+                    shard=None,
+                    day=DAY,
+                    batch_size=args.batch_size,
+                    titles_limit=10,
+                )
+                elapsed = time.perf_counter() - start
+            report("grouped", elapsed, stats.count, queued)
+            delete_queued(session)
+    finally:
+        with engine.begin() as conn:
+            conn.execute(
+                text("DELETE FROM \"user\" WHERE email LIKE :prefix || '%'"), params
+            )
+
+
+if __name__ == "__main__":
+    main()
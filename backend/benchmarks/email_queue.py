@@ -0,0 +1,78 @@
+"""
+Compare sending emails in the request with queueing them for the email worker.
+
+Starts a local SMTP server, the one the tests use, then sends the emails one by
+one over a new connection each, as the requests used to, and queues the same
+emails in the database and sends them with the worker, in batches over one
+connection. Reports the time a request spends on an email each way, and the
+emails sent per second. The local server answers right away, --handshake-ms
+adds the round trips of TLS and authentication with a remote one to each
+connection.
+
+It uses the database configured in `.env`, the queued emails are deleted once
+sent. Run it from ./backend/ with the dev dependencies:
+
+    $ uv run python -m benchmarks.email_queue --emails 1000 --handshake-ms 100
+"""
+
+import argparse
+import time
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.db import engine
+from app.email_worker import send_batch, smtp_backend
+from app.tests.utils.smtp import smtp_server
+from app.utils import generate_test_email, send_email
+
+
+def report(name: str, request_seconds: float, send_seconds: float, emails: int) -> None:
+    request_ms = request_seconds / emails * 1000
+    print(f"{name:<24}{request_ms:>14.3f}{emails / send_seconds:>14.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--emails", type=int, default=1000)
+    parser.add_argument("--handshake-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    recipients = [f"user{n}@example.com" for n in range(args.emails)]
+    print(f"{'delivery':<24}{'request ms':>14}{'emails/s':>14}")
+    with smtp_server(handshake_delay=args.handshake_ms / 1000) as server:
+        email_data = generate_test_email(email_to=recipients[0])
+
+        start = time.perf_counter()
+        for email_to in recipients:
+            send_email(
+                email_to=email_to,
+                subject=email_data.subject,
+                html_content=email_data.html_content,
+            )
+        elapsed = time.perf_counter() - start
+        report("in the request", elapsed, elapsed, args.emails)
+
+        with Session(engine, expire_on_commit=False) as session:
+            start = time.perf_counter()
+            for email_to in recipients:
+                crud.enqueue_email(
+                    session=session,
+                    email_to=email_to,
+                    subject=email_data.subject,
+                    html_content=email_data.html_content,
+                )
+            queued = time.perf_counter() - start
+            start = time.perf_counter()
+            smtp = smtp_backend()
+            while send_batch(session=session, smtp=smtp):
+                pass
+            smtp.close()
+            elapsed = time.perf_counter() - start
+        report("queued, worker", queued, elapsed, args.emails)
+
+    print(f"{len(server.sessions)} SMTP connections for {len(server.envelopes)} emails")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measure the time taken to import the app, and fail past a budget.
+
+Imports app.main in a new interpreter with `python -X importtime`, several
+times, and reports the fastest run: the total and the time spent importing each
+top-level package, the sum of the self time of its modules. Exits with an error
+when the total is over the budget, a server worker or a test run start later
+when an import is added to the app.
+
+It doesn't connect to the database, run it from ./backend/:
+
+    $ uv run python -m benchmarks.import_time --budget-ms 2000
+"""
+
+import argparse
+import subprocess
+import sys
+from collections import Counter
+from dataclasses import dataclass
+
+
+@dataclass
+class Import:
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def parse_importtime(output: str) -> list[Import]:
+    imports = []
+    for line in output.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module = line.removeprefix("import time:").split("|")
+        imports.append(Import(module.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def package_times(imports: list[Import]) -> Counter[str]:
+    times: Counter[str] = Counter()
+    for imported in imports:
+        times[imported.module.split(".")[0]] += imported.self_us
+    return times
+
+
+def import_module(module: str) -> list[Import]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        lines = result.stderr.splitlines()
+        sys.exit(
+            "\n".join(line for line in lines if not line.startswith("import time:"))
+        )
+    return parse_importtime(result.stderr)
+
+
+def total_us(imports: list[Import], module: str) -> int:
+    return next(i.cumulative_us for i in imports if i.module == module)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=2000)
+    args = parser.parse_args()
+
+    # The fastest run is the least disturbed by the rest of the machine
+    imports = min(
+        (import_module(args.module) for _ in range(args.runs)),
+        key=lambda imports: total_us(imports, args.module),
+    )
+    total_ms = total_us(imports, args.module) / 1000
+    print(f"{'package':<24}{'ms':>10}")
+    for package, us in package_times(imports).most_common(args.top):
+        print(f"{package:<24}{us / 1000:>10.1f}")
+    print(f"{'total':<24}{total_ms:>10.1f}")
+
+    if total_ms > args.budget_ms:
+        sys.exit(
+            f"Importing {args.module} took {total_ms:.0f} ms, "
+            f"over the budget of {args.budget_ms:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
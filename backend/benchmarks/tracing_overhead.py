@@ -0,0 +1,179 @@
+"""
+Measure the overhead of tracing requests at several sampling rates.
+
+Serves a page of users from an app without tracing, then from apps traced by
+Sentry and, if the otel extra is installed, by OpenTelemetry at each sample
+rate, and reports the median and mean time per request and the mean overhead
+against the app without tracing. Nothing is sent, the traces are dropped by the transport.
+
+Sentry patches FastAPI for good once initialized, so the untraced and the
+OpenTelemetry apps are measured first.
+
+It doesn't need a database, run it from ./backend/:
+
+    $ uv run python -m benchmarks.tracing_overhead --rates 0 0.01 0.1 1
+"""
+
+import argparse
+import statistics
+import time
+from collections.abc import Sequence
+from typing import Any
+
+import anyio
+import sentry_sdk
+from fastapi import FastAPI
+from sentry_sdk.transport import Transport
+from starlette.types import Message
+
+from app.core.responses import PydanticJSONResponse, construct_public
+from app.core.tracing import OpenTelemetryMiddleware, RouteTracesSampler
+from app.models import User, UserPublic, UsersPublic
+
+
+class NullTransport(Transport):
+    def capture_envelope(self, envelope: Any) -> None:
+        pass
+
+    # sentry-sdk 1.x
+    def capture_event(self, event: Any) -> None:
+        pass
+
+
+def make_app(rows: int) -> FastAPI:
+    users = [
+        User(
+            email=f"user{n}@example.com",
+            username=f"user{n}",
+            hashed_password="$2b$12$" + "x" * 53,
+        )
+        for n in range(rows)
+    ]
+    app = FastAPI(default_response_class=PydanticJSONResponse)
+
+    @app.get("/users/", response_model=UsersPublic)
+    def read_users() -> Any:
+        page = UsersPublic.model_construct(
+            data=construct_public(UserPublic, users), count=len(users)
+        )
+        return PydanticJSONResponse(page)
+
+    return app
+
+
+def make_sampler(rate: float) -> RouteTracesSampler:
+    return RouteTracesSampler(
+        critical_paths=set(),
+        expensive_paths=set(),
+        sample_rates={"critical": 0.0, "default": rate, "expensive": rate},
+    )
+
+
+async def request(app: FastAPI) -> None:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 12345),
+        "root_path": "",
+        "path": "/users/",
+        "raw_path": b"/users/",
+        "query_string": b"",
+        "headers": [(b"host", b"testserver")],
+    }
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200
+
+    await app(scope, receive, send)
+
+
+async def time_requests(app: FastAPI, requests: int) -> list[float]:
+    # Warm up, the first requests are much slower
+    for _ in range(requests // 10):
+        await request(app)
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await request(app)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: list[float], baseline: list[float]) -> None:
+    # The mean includes the cost of the sampled requests, the median doesn't
+    median = statistics.median(timings) * 1000
+    mean = statistics.fmean(timings) * 1000
+    overhead = mean - statistics.fmean(baseline) * 1000
+    print(f"{name:<16}{median:>12.3f}{mean:>12.3f}{overhead:>14.3f}")
+
+
+async def measure_otel(
+    rows: int, rates: Sequence[float], requests: int, baseline: list[float]
+) -> None:
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import (
+            BatchSpanProcessor,
+            SpanExporter,
+            SpanExportResult,
+        )
+
+        from app.core.otel import RouteSampler
+    except ImportError:
+        print("OpenTelemetry skipped, install the otel extra to measure it")
+        return
+
+    class NullExporter(SpanExporter):
+        def export(self, spans: Any) -> SpanExportResult:
+            return SpanExportResult.SUCCESS
+
+    # The provider can only be set once, its sampler is changed for each rate
+    route_sampler = RouteSampler(make_sampler(0.0))
+    provider = TracerProvider(sampler=route_sampler)
+    provider.add_span_processor(BatchSpanProcessor(NullExporter()))
+    trace.set_tracer_provider(provider)
+    for rate in rates:
+        route_sampler.sampler = make_sampler(rate)
+        app = make_app(rows)
+        app.add_middleware(OpenTelemetryMiddleware)
+        report(f"otel {rate:g}", await time_requests(app, requests), baseline)
+
+
+async def run(rows: int, rates: Sequence[float], requests: int) -> None:
+    print(f"{'tracing':<16}{'median ms':>12}{'mean ms':>12}{'overhead ms':>14}")
+    baseline = await time_requests(make_app(rows), requests)
+    report("none", baseline, baseline)
+
+    await measure_otel(rows, rates, requests, baseline)
+
+    for rate in rates:
+        sentry_sdk.init(
+            dsn="https://public@sentry.example.com/1",
+            transport=NullTransport,
+            traces_sampler=make_sampler(rate),
+        )
+        timings = await time_requests(make_app(rows), requests)
+        report(f"sentry {rate:g}", timings, baseline)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.0, 0.01, 0.1, 1.0])
+    args = parser.parse_args()
+
+    anyio.run(run, args.rows, args.rates, args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Compare the offset pages of the user list with the keyset pages of the search.
+
+Creates users, 1% of them inactive and 10% unverified, then reports the median
+time of a page of 100 users, counted, at the start, at 1% and at 50% of the
+users each way finds:
+
+- list: GET /users/, an exact count of the table and OFFSET
+- search: GET /users/search newest first, keyset pages with a bounded count
+- search inactive: the same, with is_active=false, from its partial index
+- search email prefix: the users of a 1% prefix, in email order
+
+It uses the database configured in `.env` and deletes the users it created,
+run it from ./backend/ against a scratch database:
+
+    $ uv run python -m benchmarks.user_search --users 1000000
+"""
+
+import argparse
+import statistics
+import time
+from collections.abc import Callable
+from functools import partial
+from typing import Any
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.api.routes.users import read_users, search_users
+from app.core.db import engine
+from app.core.pagination import encode_cursor
+
+EMAIL_PREFIX = "search-bench-"
+
+# The emails of a 1% prefix start with search-bench-00
+CREATE_USERS = """
+INSERT INTO "user" (id, email, username, hashed_password, is_active,
+    is_superuser, is_verified, shard_moving, created_at)
+SELECT gen_random_uuid(), :prefix || lpad((n % 100)::text, 2, '0') || '-' || n
+    || '@example.com', :prefix || n, '', n % 100 <> 0, false, n % 10 <> 0, false,
+    now() - n * interval '1 second'
+FROM generate_series(1, :users) AS n
+"""
+
+
+def search(session: Session, cursor: str | None, **filters: Any) -> Any:
+    params: dict[str, Any] = {
+        "email_prefix": None,
+        "username_prefix": None,
+        "is_active": None,
+        "is_verified": None,
+        "created_after": None,
+        "created_before": None,
+        **filters,
+    }
+    return search_users(
+        session=session, cursor=cursor, limit=100, fields=None, **params
+    )
+
+
+def median_ms(run: Callable[[], Any], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def cursor_at(session: Session, depth: int, sort: str, where: str = "") -> str | None:
+    """
+    The cursor of the page before `depth`, as the search would have returned it.
+    """
+    if depth == 0:
+        return None
+    if sort == "email":
+        statement = (
+            'SELECT email FROM "user" WHERE email COLLATE "C" LIKE :prefix || \'00%\' '
+            'ORDER BY email COLLATE "C" OFFSET :offset LIMIT 1'
+        )
+    else:
+        statement = (
+            f'SELECT created_at, id FROM "user" {where} '
+            "ORDER BY created_at DESC, id DESC OFFSET :offset LIMIT 1"
+        )
+    row = session.execute(
+        text(statement), {"prefix": EMAIL_PREFIX, "offset": depth - 1}
+    ).one()
+    return encode_cursor((sort, *row))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    params = {"prefix": EMAIL_PREFIX, "users": args.users}
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_USERS), params)
+        conn.execute(text('ANALYZE "user"'))
+
+    depths = [0, args.users // 100, args.users // 2]
+    print(f"{'page':<24}{'first':>14}{'at 1%':>14}{'at 50%':>14}")
+    try:
+        with Session(engine) as session:
+            row = []
+            for depth in depths:
+                list_page = partial(
+                    read_users,
+                    session=session,
+                    skip=depth,
+                    limit=100,
+                    fields=None,
+                    if_none_match=None,
+                )
+                row.append(median_ms(list_page, args.repeat))
+            print(f"{'list':<24}" + "".join(f"{ms:>11.1f} ms" for ms in row))
+
+            scenarios: list[tuple[str, str, str, dict[str, Any], list[int]]] = [
+                ("search", "created", "", {}, depths),
+                (
+                    "search inactive",
+                    "created",
+                    "WHERE NOT is_active",
+                    {"is_active": False},
+                    [depth // 100 for depth in depths],
+                ),
+                (
+                    "search email prefix",
+                    "email",
+                    "",
+                    {"email_prefix": f"{EMAIL_PREFIX}00"},
+                    [depth // 100 for depth in depths],
+                ),
+            ]
+            for name, sort, where, filters, scenario_depths in scenarios:
+                row = []
+                for depth in scenario_depths:
+                    cursor = cursor_at(session, depth, sort, where)
+                    search_page = partial(search, session, cursor, **filters)
+                    row.append(median_ms(search_page, args.repeat))
+                print(f"{name:<24}" + "".join(f"{ms:>11.1f} ms" for ms in row))
+    finally:
+        with engine.begin() as conn:
+            conn.execute(
+                text("DELETE FROM \"user\" WHERE email LIKE :prefix || '%'"), params
+            )
+
+
+if __name__ == "__main__":
+    main()
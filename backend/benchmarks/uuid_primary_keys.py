@@ -0,0 +1,130 @@
+"""
+Compare random (v4) and time-ordered (v7) UUID primary keys.
+
+Fills two tables shaped like `todo` with the same number of rows, one keyed by
+version 4 and the other by version 7 UUIDs, and reports the insert throughput
+of each batch and the final table and primary key index sizes.
+
+Run it from ./backend/ against a scratch database, 50M rows need ~15GB:
+
+    $ uv run python -m benchmarks.uuid_primary_keys --rows 50000000
+
+The ids are generated by Postgres so the client isn't the bottleneck, v7 ids use
+the same layout as app.core.ids.uuid7.
+"""
+
+import argparse
+import time
+
+from sqlalchemy import Connection, text
+
+from app.core.db import engine
+
+TABLES = {
+    "bench_uuid_v4": "gen_random_uuid()",
+    "bench_uuid_v7": "pg_temp.uuid_v7()",
+}
+
+UUID_V7_FUNCTION = """
+CREATE FUNCTION pg_temp.uuid_v7() RETURNS uuid AS $$
+    SELECT encode(
+        set_bit(
+            set_bit(
+                overlay(
+                    uuid_send(gen_random_uuid())
+                    PLACING substring(
+                        int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint)
+                        FROM 3
+                    )
+                    FROM 1 FOR 6
+                ),
+                52, 1
+            ),
+            53, 1
+        ),
+        'hex'
+    )::uuid
+$$ LANGUAGE sql VOLATILE
+"""
+
+
+def create_tables(conn: Connection) -> None:
+    conn.execute(text(UUID_V7_FUNCTION))
+    for table in TABLES:
+        conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        conn.execute(
+            text(
+                f"CREATE TABLE {table} ("
+                "id uuid PRIMARY KEY, user_id uuid NOT NULL, title varchar(255) NOT NULL"
+                ")"
+            )
+        )
+
+
+def fill_table(conn: Connection, table: str, rows: int, batch_size: int) -> float:
+    user_id = "gen_random_uuid()"
+    inserted = 0
+    elapsed = 0.0
+    while inserted < rows:
+        batch = min(batch_size, rows - inserted)
+        start = time.perf_counter()
+        conn.execute(
+            text(
+                f"INSERT INTO {table} (id, user_id, title) "
+                f"SELECT {TABLES[table]}, {user_id}, md5(n::text) "
+                "FROM generate_series(1, :batch) AS n"
+            ),
+            {"batch": batch},
+        )
+        conn.commit()
+        batch_elapsed = time.perf_counter() - start
+        elapsed += batch_elapsed
+        inserted += batch
+        print(
+            f"{table}: {inserted:>12,} rows, "
+            f"{batch / batch_elapsed:>10,.0f} rows/s in the last batch"
+        )
+    return elapsed
+
+
+def relation_size(conn: Connection, relation: str) -> int:
+    return int(
+        conn.execute(
+            text("SELECT pg_relation_size(:relation)"), {"relation": relation}
+        ).scalar_one()
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=50_000_000)
+    parser.add_argument("--batch-size", type=int, default=1_000_000)
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the tables after the run"
+    )
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        create_tables(conn)
+        conn.commit()
+        results = {
+            table: fill_table(conn, table, args.rows, args.batch_size)
+            for table in TABLES
+        }
+        print()
+        print(f"{'table':<16}{'rows/s':>12}{'table MB':>12}{'pkey MB':>12}")
+        for table, elapsed in results.items():
+            table_size = relation_size(conn, table) / 2**20
+            index_size = relation_size(conn, f"{table}_pkey") / 2**20
+            print(
+                f"{table:<16}{args.rows / elapsed:>12,.0f}"
+                f"{table_size:>12,.0f}{index_size:>12,.0f}"
+            )
+        if not args.keep:
+            for table in TABLES:
+                conn.execute(text(f"DROP TABLE {table}"))
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main()
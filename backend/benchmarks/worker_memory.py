@@ -0,0 +1,122 @@
+"""
+Compare the memory of the server workers, with and without a preloaded app.
+
+Starts the app with `fastapi run --workers N`, where each worker imports it,
+then with gunicorn and app/gunicorn_conf.py, where the workers are forked from
+a master that imported it. Once they answered some requests, reports the RSS of
+each process and its PSS, which splits the pages shared with other processes
+between them. The sum of the PSS is the memory the server really uses.
+
+Linux only, it reads /proc. The app doesn't connect to the database to answer
+the requests used, run it from ./backend/:
+
+    $ uv run python -m benchmarks.worker_memory --workers 4
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+PROC = Path("/proc")
+
+
+def children(pid: int) -> list[int]:
+    pids = []
+    for stat in PROC.glob("[0-9]*/stat"):
+        try:
+            # The command may contain spaces, the fields after it don't
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+        if int(fields[1]) == pid:
+            pids.append(int(stat.parent.name))
+    return pids
+
+
+def is_worker(pid: int) -> bool:
+    # multiprocessing starts a resource tracker next to the uvicorn workers
+    return b"resource_tracker" not in (PROC / str(pid) / "cmdline").read_bytes()
+
+
+def memory_mb(pid: int) -> tuple[float, float]:
+    values = {}
+    for line in (PROC / str(pid) / "smaps_rollup").read_text().splitlines()[1:]:
+        name, value, *_ = line.split()
+        values[name.rstrip(":")] = int(value)
+    return values["Rss"] / 1024, values["Pss"] / 1024
+
+
+def wait_until_up(url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(url).raise_for_status()
+            return
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def measure(name: str, command: list[str], base_url: str, requests: int) -> None:
+    server = subprocess.Popen(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_up(f"{base_url}/api/v1/utils/health-check/")
+        # Spread over the workers, each one builds its OpenAPI schema
+        with httpx.Client(base_url=base_url) as client:
+            for _ in range(requests):
+                client.get("/api/v1/openapi.json", headers={"Connection": "close"})
+        workers = [pid for pid in children(server.pid) if is_worker(pid)]
+        processes = [("parent", server.pid)] + [
+            (f"worker {n}", pid) for n, pid in enumerate(workers, 1)
+        ]
+        total_rss = total_pss = 0.0
+        for process, pid in processes:
+            rss, pss = memory_mb(pid)
+            total_rss += rss
+            total_pss += pss
+            print(f"{name:<16}{process:<10}{rss:>10.1f}{pss:>10.1f}")
+            name = ""
+        print(f"{'':<16}{'total':<10}{total_rss:>10.1f}{total_pss:>10.1f}")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    workers = str(args.workers)
+    servers = {
+        "fastapi run": [
+            *[sys.executable, "-m", "fastapi", "run", "app/main.py"],
+            *["--workers", workers, "--port", str(args.port)],
+        ],
+        "gunicorn": [
+            *[sys.executable, "-m", "gunicorn", "--config", "app/gunicorn_conf.py"],
+            *["--workers", workers, "--bind", f"127.0.0.1:{args.port}"],
+            "app.main:app",
+        ],
+    }
+    # Both servers would write their metrics to the same directory
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    print(f"{'server':<16}{'process':<10}{'RSS MB':>10}{'PSS MB':>10}")
+    for name, command in servers.items():
+        measure(name, command, base_url, args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,9 @@ python app/backend_pre_start.py
 
 # Run migrations
 alembic upgrade head
+for shard in $(python -c "from app.core.config import settings; print(*settings.SHARD_DATABASE_URIS)"); do
+    alembic -x shard="$shard" upgrade head
+done
 
 # Create initial data in DB
 python app/initial_data.py
@@ -0,0 +1,8 @@
+#! /usr/bin/env bash
+
+set -e
+
+# Metrics left by the workers of a previous run
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+
+exec gunicorn --config app/gunicorn_conf.py app.main:app